@@ -0,0 +1,5 @@
+import sys
+
+from coqpyt.cli import main
+
+sys.exit(main())
@@ -0,0 +1,130 @@
+import os
+import sys
+import logging
+import argparse
+import tempfile
+from typing import Optional, List
+
+from coqpyt.coq.bundle import ContextBundle
+from coqpyt.coq.proof_file import _AuxFile
+
+logger = logging.getLogger(__name__)
+
+
+def build_context(
+    workspace: Optional[str] = None,
+    requires: List[str] = [],
+    timeout: int = 600,
+    coq_lsp: str = "coq-lsp",
+    coqtop: str = "coqtop",
+) -> ContextBundle:
+    """Builds a bundle with the terms of the libraries loaded by default and
+    of the libraries required.
+
+    Args:
+        workspace (Optional[str], optional): Absolute path for the workspace.
+            The _CoqProject of the workspace is used to find the libraries.
+        requires (List[str], optional): Libraries to add to the bundle, besides
+            the ones loaded by default. E.g. "Coq.Lists.List".
+        timeout (int, optional): Timeout used in coq-lsp. Defaults to 600.
+        coq_lsp (str, optional): Path to the coq-lsp binary. Defaults to "coq-lsp".
+        coqtop (str, optional): Path to the coqtop binary. Defaults to "coqtop".
+
+    Returns:
+        ContextBundle: The bundle built.
+    """
+    bundle = ContextBundle(workspace, coq_lsp)
+
+    def add_libraries(aux_file: _AuxFile, prelude: bool):
+        libraries = _AuxFile.get_libraries(aux_file)
+        libraries = [l for l in libraries if l not in bundle.libraries]
+        library_files = _AuxFile.locate_libraries(aux_file, libraries)
+        for library, library_file in zip(libraries, library_files):
+            logger.info(f"Loading {library}")
+            terms = _AuxFile.get_library(
+                library,
+                library_file,
+                timeout,
+                workspace=workspace,
+                coq_lsp=coq_lsp,
+                coqtop=coqtop,
+            )
+            bundle.add_library(library, library_file, terms, prelude=prelude)
+
+    # The libraries loaded by default are found as in _AuxFile.get_coq_context
+    temp_path = os.path.join(tempfile.gettempdir(), "build_context.v")
+    with _AuxFile(temp_path, timeout=timeout, coq_lsp=coq_lsp) as aux_file:
+        aux_file.didOpen()
+        add_libraries(aux_file, True)
+
+    if len(requires) > 0:
+        directory = tempfile.gettempdir() if workspace is None else workspace
+        temp_path = os.path.join(directory, "build_context.v")
+        with _AuxFile(
+            temp_path, timeout=timeout, workspace=workspace, coq_lsp=coq_lsp
+        ) as aux_file:
+            aux_file.write("".join(f"Require {library}.\n" for library in requires))
+            aux_file.didOpen()
+            add_libraries(aux_file, False)
+
+    return bundle
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="coqpyt")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser(
+        "build-context",
+        help="Precompute the contexts of Coq libraries into a bundle file.",
+    )
+    build.add_argument(
+        "-w",
+        "--workspace",
+        default=None,
+        help="Workspace whose _CoqProject is used to find the libraries.",
+    )
+    build.add_argument(
+        "-r",
+        "--require",
+        nargs="*",
+        default=[],
+        help="Libraries to include besides the ones loaded by default.",
+    )
+    build.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Path of the bundle. Defaults to the path where ProofFile looks for it.",
+    )
+    build.add_argument("--timeout", type=int, default=600)
+    build.add_argument("--coq-lsp", default="coq-lsp")
+    build.add_argument("--coqtop", default="coqtop")
+    args = parser.parse_args(argv)
+
+    if args.command == "build-context":
+        # The progress of the build is reported on stderr
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        workspace = args.workspace
+        if workspace is not None:
+            workspace = os.path.abspath(workspace)
+        output = args.output
+        if output is None:
+            cache_dir = _AuxFile.get_coqpyt_disk_cache_loc()
+            if cache_dir is None:
+                parser.error("no cache directory found, use --output")
+            output = ContextBundle.default_path(cache_dir, workspace, args.coq_lsp)
+
+        bundle = build_context(
+            workspace,
+            args.require,
+            timeout=args.timeout,
+            coq_lsp=args.coq_lsp,
+            coqtop=args.coqtop,
+        )
+        bundle.save(output)
+        print(f"Saved {len(bundle.libraries)} libraries to {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -57,7 +57,8 @@ class CoqFile(object):
             coq_lsp(str, optional): Path to the coq-lsp binary. Defaults to "coq-lsp".
             coqtop(str, optional): Path to the coqtop binary used to compile the Coq libraries
                 imported by coq-lsp. This is NOT passed as a parameter to coq-lsp, it is
-                simply used to check the Coq version in use. Defaults to "coqtop".
+                simply used to check the Coq version in use when coq-lsp does not report it.
+                Defaults to "coqtop".
         """
         if not os.path.isabs(file_path):
             file_path = os.path.abspath(file_path)
@@ -78,10 +79,15 @@ class CoqFile(object):
             self._handle_exception(e)
             raise e
 
+        self.context = FileContext(
+            self.path,
+            module=self.file_module,
+            coqtop=coqtop,
+            coq_version=self.coq_lsp_client.coq_version,
+        )
         self.steps_taken: int = 0
         self.__init_steps(text, ast)
         self.__validate()
-        self.context = FileContext(self.path, module=self.file_module, coqtop=coqtop)
         self.version = 1
         self.workspace = workspace
 
@@ -149,7 +155,10 @@ class CoqFile(object):
         if ast[-1].span == None:
             ast = ast[:-1]
         for i, curr_ast in enumerate(ast):
-            self.steps.append(self.__init_step(lines, i, curr_ast, ast[i - 1]))
+            step = self.__init_step(lines, i, curr_ast, ast[i - 1])
+            # The classification of the step is computed once from its AST
+            self.context.step_info(step)
+            self.steps.append(step)
 
     def __validate(self):
         uri = f"file://{self._path}"
@@ -350,6 +359,7 @@ class CoqFile(object):
 
             backup = self.__backup_steps[index]
             backup.text, backup.ast = step.text, step.ast
+            backup.info = step.info
             backup.diagnostics = step.diagnostics
             backup.short_text = step.short_text
             self.steps[i] = backup
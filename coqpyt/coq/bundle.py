@@ -0,0 +1,175 @@
+import os
+import pickle
+import logging
+import shutil
+import hashlib
+from typing import Optional, List, Dict, Tuple
+
+from coqpyt.coq.structs import Term
+
+logger = logging.getLogger(__name__)
+
+
+class ContextBundle(object):
+    """Prebuilt term tables of Coq libraries, stored in a single file.
+
+    Bundles are built with ``coqpyt build-context`` and are loaded by a
+    ProofFile in one read. Each library in the bundle records the stat
+    signature of its file, so libraries whose file changed since the bundle
+    was built are ignored and loaded as usual.
+
+    Attributes:
+        workspace (Optional[str]): Workspace for which the bundle was built.
+        coq_lsp (str): Path to the coq-lsp binary used to build the bundle.
+        prelude (List[str]): Libraries loaded by default on an empty file.
+        libraries (Dict[str, Tuple[str, Tuple[int, int], Dict[str, Term]]]): For
+            each library, its file, the size and mtime of the file and its terms.
+    """
+
+    FORMAT = 1
+    DIR_NAME = "bundles"
+
+    def __init__(self, workspace: Optional[str] = None, coq_lsp: str = "coq-lsp"):
+        self.format = ContextBundle.FORMAT
+        self.workspace = workspace
+        self.coq_lsp = coq_lsp
+        self.prelude: List[str] = []
+        self.libraries: Dict[str, Tuple[str, Tuple[int, int], Dict[str, Term]]] = {}
+
+    @staticmethod
+    def __signature(library_file: str) -> Tuple[int, int]:
+        stat = os.stat(library_file)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def add_library(
+        self,
+        library_name: str,
+        library_file: str,
+        terms: Dict[str, Term],
+        prelude: bool = False,
+    ):
+        """Adds the terms of a library to the bundle.
+
+        Args:
+            library_name (str): The name of the library.
+            library_file (str): The file of the library.
+            terms (Dict[str, Term]): The terms defined by the library.
+            prelude (bool, optional): Whether the library is loaded by default.
+                Defaults to False.
+        """
+        signature = ContextBundle.__signature(library_file)
+        self.libraries[library_name] = (library_file, signature, terms)
+        if prelude and library_name not in self.prelude:
+            self.prelude.append(library_name)
+
+    def get_library(
+        self, library_name: str, library_file: Optional[str] = None
+    ) -> Optional[Dict[str, Term]]:
+        """
+        Args:
+            library_name (str): The name of the library.
+            library_file (Optional[str], optional): The file of the library. If
+                defined, it must be the same file used to build the bundle.
+
+        Returns:
+            Optional[Dict[str, Term]]: The terms defined by the library, if the
+                library is in the bundle and its file did not change.
+        """
+        if library_name not in self.libraries:
+            return None
+        bundled_file, signature, terms = self.libraries[library_name]
+        if library_file is not None and library_file != bundled_file:
+            return None
+        try:
+            if ContextBundle.__signature(bundled_file) != signature:
+                return None
+        except OSError:
+            return None
+        return terms
+
+    def save(self, path: str):
+        """Writes the bundle to a file.
+
+        Args:
+            path (str): Path of the bundle file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so that readers never see a partial bundle
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "ContextBundle":
+        """Reads a bundle from a file.
+
+        Args:
+            path (str): Path of the bundle file.
+
+        Raises:
+            ValueError: If the file is not a bundle in the current format.
+
+        Returns:
+            ContextBundle: The bundle.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        bundle = pickle.loads(data)
+        if (
+            not isinstance(bundle, ContextBundle)
+            or bundle.format != ContextBundle.FORMAT
+        ):
+            raise ValueError(f"{path} is not a valid context bundle.")
+        return bundle
+
+    @staticmethod
+    def default_path(
+        cache_dir: str, workspace: Optional[str] = None, coq_lsp: str = "coq-lsp"
+    ) -> str:
+        """
+        Args:
+            cache_dir (str): Directory of the coqpyt cache.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+            coq_lsp (str, optional): Path to the coq-lsp binary.
+
+        Returns:
+            str: The path where the bundle for the workspace and coq-lsp binary
+                is stored by default.
+        """
+        if workspace is not None:
+            workspace = os.path.abspath(workspace)
+        coq_lsp = shutil.which(coq_lsp) or coq_lsp
+        key = "\0".join([str(workspace), coq_lsp])
+        name = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(cache_dir, ContextBundle.DIR_NAME, name + ".bundle")
+
+    @staticmethod
+    def discover(
+        cache_dir: Optional[str],
+        workspace: Optional[str] = None,
+        coq_lsp: str = "coq-lsp",
+    ) -> Optional["ContextBundle"]:
+        """Loads the bundle stored in the default path, if it exists.
+
+        Args:
+            cache_dir (Optional[str]): Directory of the coqpyt cache.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+            coq_lsp (str, optional): Path to the coq-lsp binary.
+
+        Returns:
+            Optional[ContextBundle]: The bundle, if it exists and is valid. A
+                file that cannot be loaded is treated as a stale bundle.
+        """
+        if cache_dir is None:
+            return None
+        path = ContextBundle.default_path(cache_dir, workspace, coq_lsp)
+        if not os.path.exists(path):
+            return None
+        try:
+            return ContextBundle.load(path)
+        except Exception as e:
+            # Truncated or foreign files may fail in many ways while unpickling
+            logger.warning(f"Ignoring the context bundle {path}: {e!r}")
+            return None
@@ -1,30 +1,101 @@
+import os
 import re
 import subprocess
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from types import MappingProxyType
 from packaging import version
-from typing import Optional, List, Dict, Tuple, Union
+from typing import Optional, List, Dict, Tuple, Union, Mapping, Callable
 
 from coqpyt.coq.exceptions import NotationNotFoundException
-from coqpyt.coq.structs import SegmentType, SegmentStack, Step, TermType, Term
+from coqpyt.coq.structs import (
+    SegmentType,
+    SegmentStack,
+    Step,
+    StepInfo,
+    TermType,
+    Term,
+)
+
+# We match the wildcards of notations with the description from here:
+# https://coq.inria.fr/distrib/current/refman/language/core/basic.html#grammar-token-ident
+# Coq accepts more characters, but no one should need more than these...
+_IDENT_CHARS = "A-Za-zÀ-ÖØ-öø-ˁˆ-ˑˠ-ˤˬˮͰ-ʹͶͷͺ-ͽͿΆΈ-ΊΌΎ-ΡΣ-ϵϷ-ҁҊ-ԯԱ-Ֆՙա-և"
+_IDENT_REGEX = f"([{_IDENT_CHARS}][{_IDENT_CHARS}0-9_']*|_[{_IDENT_CHARS}0-9_']+)"
+
+
+class LibraryResolver(ABC):
+    """Looks up terms in libraries whose terms are not loaded in a FileContext,
+    e.g., the libraries kept by a library context daemon (see
+    coqpyt.coq.daemon). The libraries are given from the oldest to the newest
+    one, so newer libraries shadow older ones."""
+
+    @abstractmethod
+    def get_term(
+        self, libraries: List[Tuple[str, str]], names: List[str]
+    ) -> Optional[Term]:
+        """
+        Args:
+            libraries (List[Tuple[str, str]]): The name and file of each library.
+            names (List[str]): Names of the term, which may be qualified, in the
+                order in which they are tried. E.g. ["M.x", "x"] for x inside
+                the module M.
+
+        Returns:
+            Optional[Term]: The term mapped to the first name that is found.
+        """
+
+    @abstractmethod
+    def get_notation(
+        self, libraries: List[Tuple[str, str]], notation: str, scope: str
+    ) -> Optional[Term]:
+        """
+        Args:
+            libraries (List[Tuple[str, str]]): The name and file of each library.
+            notation (str): Id of the notation. E.g. "_ + _".
+            scope (str): Scope of the notation. E.g. "nat_scope".
+
+        Returns:
+            Optional[Term]: Term that corresponds to the notation, if it exists.
+        """
 
 
 class FileContext:
+    # Maximum number of index lookups for a notation before falling back to
+    # matching the notation against every name in the context
+    MAX_NOTATION_PROBES = 64
+
     def __init__(
         self,
         path: str,
         module: Optional[List[str]] = None,
         coqtop: str = "coqtop",
         terms: Optional[Dict[str, Term]] = None,
+        coq_version: Optional[str] = None,
     ):
-        self.libraries: Dict[str, Dict[str, Term]] = {}
         self.__path = path
         self.__module = [] if module is None else module
-        self.__init_coq_version(coqtop)
+        if coq_version is None:
+            coq_version = FileContext.get_coq_version(coqtop)
+        self.__init_coq_version(coq_version)
         self.__init_context(terms)
 
-    def __init_coq_version(self, coqtop):
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_coq_version(coqtop: str = "coqtop") -> str:
+        """Gets the version of Coq by running coqtop. The version is only
+        checked once for each coqtop path.
+
+        Args:
+            coqtop (str, optional): Path to the coqtop binary. Defaults to "coqtop".
+
+        Returns:
+            str: The version of Coq. E.g. "8.19.2".
+        """
         output = subprocess.check_output(f"{coqtop} -v", shell=True)
-        coq_version = output.decode("utf-8").split("\n")[0].split()[-1]
+        return output.decode("utf-8").split("\n")[0].split()[-1]
 
+    def __init_coq_version(self, coq_version: str):
         # For versions 8.18+, we ignore the tags [VernacSynterp] and [VernacSynPure]
         # and use the "ntn_decl" prefix when handling where notations
         post17 = version.parse(coq_version) >= version.parse("8.18")
@@ -44,20 +115,252 @@ class FileContext:
         # versions prior to that.
 
     def __init_context(self, terms: Optional[Dict[str, Term]] = None):
-        # NOTE: We use a stack for each term because of the following case:
-        # 1) File A imports a file B with term C
+        self.libraries: Dict[str, Dict[str, Term]] = {}
+        # NOTE: The terms of remote libraries are not loaded. Their layers are
+        # empty and names which may be defined in them are looked up with the
+        # resolver, so only the file of each remote library is kept.
+        self.remote_libraries: Dict[str, str] = {}
+        self.__resolver: Optional[LibraryResolver] = None
+        # NOTE: The context is a chain of layers, from the oldest to the newest.
+        # Each library is an immutable layer (keyed by its name) and the terms
+        # added between libraries form a local layer (keyed by an integer).
+        # Names are looked up from the newest layer to the oldest one, so the
+        # terms of the libraries are never copied to the context.
+        # In local layers, we use a stack for each term because of the following case:
+        # 1) The context is updated with the terms of a file B with term C
         # 2) File A defines a new term C
-        self.__terms: Dict[str, List[Term]] = {} if terms is None else terms
+        self.__layers: Dict[Union[str, int], Mapping] = {}
+        self.__local_id = 0
+        # NOTE: Each layer has a position, which grows with the order in which
+        # the layers are added, so the newest of two layers is found directly
+        self.__positions: Dict[Union[str, int], int] = {}
+        self.__next_position = 0
+        # NOTE: The visible term of each name, the layer it comes from and the
+        # indexes of the visible terms are maintained as terms and libraries
+        # are added and removed. Only the names of the layer that changes are
+        # updated, so adding or removing a library costs O(|library|) index
+        # updates (the terms are still not copied), but it never rebuilds the
+        # context and lookups never walk the layers.
+        self.__visible: Dict[str, Term] = {}
+        self.__visible_layers: Dict[str, Union[str, int]] = {}
+        self.__files: Dict[str, Dict[str, Term]] = {}
+        self.__types: Dict[TermType, Dict[str, Term]] = {}
+        # NOTE: Modules are indexed by their full path, i.e., the path of the
+        # library (or of the file) followed by the modules inside it
+        self.__modules: Dict[Tuple[str, ...], Dict[str, Term]] = {}
+        self.__type_modules: Dict[Tuple, Dict[str, Term]] = {}
+        self.__scopes: Dict[str, Dict[str, Term]] = {}
+        # NOTE: Visible notations are indexed by the shape of their name (see
+        # __notation_shape), both with and without the text after the last ":"
+        self.__notations: Dict[Tuple, Dict[str, None]] = {}
+        self.__notation_prefixes: Dict[Tuple, Dict[str, None]] = {}
+        # NOTE: Terms are stored once, under their name qualified by the modules
+        # of the file. They are also accessible through any suffix of the module
+        # path of their file (e.g. Init.Nat.add for add in Coq.Init.Nat), so we
+        # map each suffix to the module paths (own file or libraries) ending in it.
+        self.__suffixes: Dict[str, List[str]] = {}
+        # NOTE: Qualified names of the file itself are looked up in a stack of
+        # the (layer, term) pairs of each name defined by the file
+        self.__own_terms: Dict[str, List[Tuple[int, Term]]] = {}
+        self.__add_suffixes(".".join(self.__module))
         self.__last_terms: List[Tuple[str, Term]] = []
         self.__segments = SegmentStack()
         self.__anonymous_id: Optional[int] = None
+        if terms is not None:
+            self.update(terms)
 
     def __repr__(self) -> str:
         res = ""
-        for name, terms in self.__terms.items():
-            res += f"{name}: {repr(terms[-1])}\n"
+        for name, term in self.terms.items():
+            res += f"{name}: {repr(term)}\n"
         return res
 
+    def __local_layer(self) -> int:
+        if len(self.__layers) > 0:
+            key = next(reversed(self.__layers))
+            if isinstance(key, int):
+                return key
+        self.__local_id += 1
+        self.__insert_layer(self.__local_id, {})
+        return self.__local_id
+
+    def __insert_layer(self, key: Union[str, int], layer: Mapping):
+        self.__layers[key] = layer
+        self.__positions[key] = self.__next_position
+        self.__next_position += 1
+
+    def __delete_layer(self, key: Union[str, int]) -> Mapping:
+        del self.__positions[key]
+        return self.__layers.pop(key)
+
+    def __index_notation(self, name: str, add: bool):
+        indexes = [(self.__notations, name)]
+        if ":" in name:
+            prefix = name.rsplit(":", 1)[0].strip()
+            indexes.append((self.__notation_prefixes, prefix))
+        for index, key in indexes:
+            shape = FileContext.__notation_shape(key.split(" "))
+            if add:
+                if shape not in index:
+                    index[shape] = {}
+                index[shape][name] = None
+            else:
+                del index[shape][name]
+                if len(index[shape]) == 0:
+                    del index[shape]
+
+    def __index_keys(
+        self, name: str, layer: Optional[Union[str, int]], term: Optional[Term]
+    ) -> List:
+        if term is None:
+            return [None, None, None, None, None]
+        scope = None
+        if term.type == TermType.NOTATION:
+            scope = FileContext.get_notation_scope(name)
+        if isinstance(layer, str):
+            path = layer.split(".")
+        elif term.file_path == self.__path:
+            path = self.__module
+        else:
+            # Local layers may also hold terms of other files (see update),
+            # which are indexed under the module named after their file
+            path = [os.path.splitext(os.path.basename(term.file_path))[0]]
+        module = tuple(path + term.module)
+        return [term.file_path, term.type, module, (term.type, module), scope]
+
+    def __add_suffixes(self, path: str):
+        modules = path.split(".") if path != "" else []
+        for i in range(len(modules)):
+            suffix = ".".join(modules[i:])
+            if suffix not in self.__suffixes:
+                self.__suffixes[suffix] = []
+            self.__suffixes[suffix].append(path)
+
+    def __remove_suffixes(self, path: str):
+        modules = path.split(".") if path != "" else []
+        for i in range(len(modules)):
+            suffix = ".".join(modules[i:])
+            self.__suffixes[suffix].remove(path)
+            if len(self.__suffixes[suffix]) == 0:
+                del self.__suffixes[suffix]
+
+    def __lookup_qualified(
+        self, name: str
+    ) -> Tuple[Optional[Union[str, int]], Optional[Term]]:
+        dot = name.find(".")
+        while dot != -1:
+            rest = name[dot + 1 :]
+            # Only the module paths ending in the prefix are checked, and the
+            # term of the newest layer is used, as for unqualified names
+            found_key, found = None, None
+            for path in self.__suffixes.get(name[:dot], []):
+                if path in self.libraries:
+                    key, term = path, self.libraries[path].get(rest)
+                elif len(self.__own_terms.get(rest, [])) > 0:
+                    key, term = self.__own_terms[rest][-1]
+                else:
+                    continue
+                if term is not None and (
+                    found is None or self.__positions[key] > self.__positions[found_key]
+                ):
+                    found_key, found = key, term
+            if found is not None:
+                return found_key, found
+            dot = name.find(".", dot + 1)
+        return None, None
+
+    def __lookup_remote(
+        self,
+        layer: Optional[Union[str, int]],
+        lookup: Callable[[List[Tuple[str, str]]], Optional[Term]],
+    ) -> Optional[Term]:
+        if len(self.remote_libraries) == 0:
+            return None
+        # The remote libraries newer than the layer of the term found in the
+        # process may shadow it, so they are looked up in a single request
+        position = -1 if layer is None else self.__positions[layer]
+        libraries = [
+            (library, library_file)
+            for library, library_file in self.remote_libraries.items()
+            if self.__positions[library] > position
+        ]
+        if len(libraries) == 0:
+            return None
+        return lookup(libraries)
+
+    def __set_visible(
+        self, name: str, layer: Optional[Union[str, int]], term: Optional[Term]
+    ):
+        old_term = self.__visible.get(name)
+        old_notation = old_term is not None and old_term.type == TermType.NOTATION
+        notation = term is not None and term.type == TermType.NOTATION
+        if old_notation != notation:
+            self.__index_notation(name, notation)
+
+        # The name keeps its position in an index if its key does not change
+        indexes = [
+            self.__files,
+            self.__types,
+            self.__modules,
+            self.__type_modules,
+            self.__scopes,
+        ]
+        old_keys = self.__index_keys(name, self.__visible_layers.get(name), old_term)
+        keys = self.__index_keys(name, layer, term)
+        for index, old_key, key in zip(indexes, old_keys, keys):
+            if old_key is not None and old_key != key:
+                del index[old_key][name]
+            if key is not None:
+                if key not in index:
+                    index[key] = {}
+                index[key][name] = term
+
+        if term is None:
+            self.__visible.pop(name, None)
+            self.__visible_layers.pop(name, None)
+        else:
+            self.__visible[name] = term
+            self.__visible_layers[name] = layer
+
+    def __view(self, index: Dict, key) -> Mapping[str, Term]:
+        if key not in index:
+            index[key] = {}
+        return MappingProxyType(index[key])
+
+    def __push(self, name: str, term: Term):
+        key = self.__local_layer()
+        layer = self.__layers[key]
+        if name not in layer:
+            layer[name] = []
+        layer[name].append(term)
+        # Local layers may also hold terms of other files
+        if term.file_path == self.__path:
+            self.__own_terms.setdefault(name, []).append((key, term))
+        # The local layer is the newest one, so the term is always visible
+        self.__set_visible(name, key, term)
+
+    def __pop(self, name: str):
+        for key in reversed(self.__layers):
+            layer = self.__layers[key]
+            if isinstance(key, int) and name in layer:
+                term = layer[name].pop()
+                if term.file_path == self.__path:
+                    self.__own_terms[name].pop()
+                    if len(self.__own_terms[name]) == 0:
+                        del self.__own_terms[name]
+                if len(layer[name]) == 0:
+                    del layer[name]
+                    if len(layer) == 0:
+                        self.__delete_layer(key)
+                self.__set_visible(name, *self.__find(name))
+                return
+
+    def __find(self, name: str) -> Tuple[Optional[Union[str, int]], Optional[Term]]:
+        for key, layer in reversed(self.__layers.items()):
+            if name in layer:
+                return key, layer[name][-1] if isinstance(key, int) else layer[name]
+        return None, None
+
     def __add_terms(self, step: Step, expr: List):
         term_type = self.__term_type(expr)
         text = step.short_text
@@ -118,56 +421,35 @@ class FileContext:
                 ("", Term(step, term_type, self.__path, self.__segments.modules[:]))
             )
         else:
-            names = FileContext.__get_names(expr)
-            for name in names:
+            for name in self.names(step):
                 self.__add_term(name, step, term_type)
 
         self.__handle_where_notations(step, expr, term_type)
 
     def __add_term(self, name: str, step: Step, term_type: TermType):
-        def check_and_add_term(name, term):
-            if name not in self.__terms:
-                self.__terms[name] = []
-            self.__terms[name].append(term)
-
         modules = self.__segments.modules[:]
         term = Term(step, term_type, self.__path, modules)
         self.__last_terms[-1].append((name, term))
         if term.type == TermType.NOTATION:
-            check_and_add_term(name, term)
+            self.__push(name, term)
             return
 
         # The modules inside the file are handled by the get_term method
         # so we don't have to worry about them here.
-        check_and_add_term(".".join(modules + [name]), term)
-
-        curr_module = ""
-        for module in reversed(self.__module):
-            curr_module = module + "." + curr_module
-            check_and_add_term(curr_module + name, term)
+        self.__push(".".join(modules + [name]), term)
 
     def __remove_term(self, name: str, term: Term):
-        def remove_term(name):
-            self.__terms[name].pop()
-            if len(self.__terms[name]) == 0:
-                del self.__terms[name]
-
         # Terms that are not part of the accessible context (e.g. obligations),
         # but are still registered in last_terms.
         if name == "":
             return
 
         if term.type == TermType.NOTATION:
-            remove_term(name)
+            self.__pop(name)
             return
 
         modules = self.__segments.modules[:]
-        remove_term(".".join(modules + [name]))
-
-        curr_module = ""
-        for module in reversed(self.__module):
-            curr_module = module + "." + curr_module
-            remove_term(curr_module + name)
+        self.__pop(".".join(modules + [name]))
 
     # Simultaneous definition of terms and notations (where clause)
     # https://coq.inria.fr/refman/user-extensions/syntax-extensions.html#simultaneous-definition-of-terms-and-notations
@@ -297,6 +579,27 @@ class FileContext:
                         stack.append(v)
         return res
 
+    @staticmethod
+    def __get_references(expr: List) -> List[Tuple[str, str]]:
+        stack, res = expr[:0:-1], []
+        while len(stack) > 0:
+            el = stack.pop()
+            if FileContext.is_id(el):
+                res.append(("id", FileContext.get_id(el)))
+            elif FileContext.is_notation(el):
+                # The notation comes before the terms used in it
+                res.append(("notation", el[2][1]))
+                stack.append(el[1:])
+            elif isinstance(el, list):
+                for v in reversed(el):
+                    if isinstance(v, (dict, list)):
+                        stack.append(v)
+            elif isinstance(el, dict):
+                for v in reversed(el.values()):
+                    if isinstance(v, (dict, list)):
+                        stack.append(v)
+        return res
+
     @staticmethod
     def is_id(el) -> bool:
         return isinstance(el, list) and (len(el) == 3 and el[0] == "Ser_Qualid")
@@ -353,20 +656,75 @@ class FileContext:
         Returns:
             List[Term]: The executed terms defined in the current file.
         """
-        return list(
-            filter(lambda term: term.file_path == self.__path, self.terms.values())
-        )
+        return list(self.__files.get(self.__path, {}).values())
 
     @property
-    def terms(self) -> Dict[str, Term]:
+    def terms(self) -> Mapping[str, Term]:
+        """
+        Returns:
+            Mapping[str, Term]: Read-only live view of every visible term,
+                i.e., the terms of the file and of the libraries loaded in the
+                process, by name. The view follows the changes to the context
+                and cannot be modified, so it must be copied (e.g. with dict)
+                to be modified, kept as a snapshot or iterated while the
+                context changes.
+        """
+        return MappingProxyType(self.__visible)
+
+    def get_terms_by_type(self, term_type: TermType) -> Mapping[str, Term]:
         """
+        Args:
+            term_type (TermType): The type of the terms.
+
         Returns:
-            Dict[str, Term]: All terms defined in the current file.
+            Mapping[str, Term]: The terms in the context with the given type.
+                The mapping is a read-only view which follows the changes to
+                the context.
         """
-        defined_terms = {}
-        for name, terms in self.__terms.items():
-            defined_terms[name] = terms[-1]
-        return defined_terms
+        return self.__view(self.__types, term_type)
+
+    def get_terms_by_module(self, module: List[str]) -> Mapping[str, Term]:
+        """
+        Args:
+            module (List[str]): The full module path where the terms are
+                defined, i.e., the path of the library (or of the current file)
+                followed by the modules inside it. E.g. ["Coq", "Init", "Nat"].
+
+        Returns:
+            Mapping[str, Term]: The terms in the context defined directly in
+                the module. The mapping is a read-only view which follows the
+                changes to the context.
+        """
+        return self.__view(self.__modules, tuple(module))
+
+    def get_terms_by_type_and_module(
+        self, term_type: TermType, module: List[str]
+    ) -> Mapping[str, Term]:
+        """
+        Args:
+            term_type (TermType): The type of the terms.
+            module (List[str]): The full module path where the terms are
+                defined. See get_terms_by_module.
+
+        Returns:
+            Mapping[str, Term]: The terms in the context with the given type
+                defined directly in the module. The mapping is a read-only view
+                which follows the changes to the context.
+        """
+        return self.__view(self.__type_modules, (term_type, tuple(module)))
+
+    def get_notations_by_scope(self, scope: str) -> Mapping[str, Term]:
+        """
+        Args:
+            scope (str): Scope of the notations. E.g. "nat_scope". The empty
+                string gets the notations without a scope.
+
+        Returns:
+            Mapping[str, Term]: The notations in the context in the scope. The
+                mapping is a read-only view which follows the changes to the
+                context.
+        """
+        return self.__view(self.__scopes, scope)
 
     @property
     def in_module_type(self) -> bool:
@@ -447,6 +805,96 @@ class FileContext:
         for name, term in terms:
             self.__remove_term(name, term)
 
+    def step_info(self, step: Step) -> StepInfo:
+        """Classifies a step from its AST. The classification is stored in the
+        step and only computed again if the AST of the step changes.
+
+        Args:
+            step (Step): The step to be processed.
+
+        Returns:
+            StepInfo: The classification of the step.
+        """
+        span = step.ast.span
+        info = step.info
+        if info is not None and info.span is span:
+            return info
+
+        expr, attrs = [None], []
+        if (
+            span is not None
+            and isinstance(span, dict)
+            and isinstance(span.get("v"), dict)
+        ):
+            if "expr" in span["v"]:
+                expr = self.__expr(span["v"]["expr"])
+            if "attrs" in span["v"]:
+                attrs = span["v"]["attrs"]
+
+        term_type = self.__term_type(expr)
+        info = StepInfo(
+            span,
+            expr,
+            attrs,
+            term_type,
+            # Assume that terms of the following types do not introduce new proofs
+            # FIXME: Should probably check if goals were changed
+            term_type
+            not in [
+                TermType.TACTIC,
+                TermType.NOTATION,
+                TermType.INDUCTIVE,
+                TermType.COINDUCTIVE,
+                TermType.RECORD,
+                TermType.CLASS,
+                TermType.SCHEME,
+                TermType.VARIANT,
+                TermType.OTHER,
+            ],
+            # FIXME: Refer to issue #55: https://github.com/sr-lab/coqpyt/issues/55
+            expr[0] in ["VernacEndProof", "VernacExactProof", "VernacAbort"],
+            expr[0]
+            in [
+                "VernacEndSegment",
+                "VernacDefineModule",
+                "VernacDeclareModuleType",
+                "VernacBeginSection",
+            ],
+            any(attr["v"][0] == "program" for attr in attrs),
+        )
+        step.info = info
+        return info
+
+    def references(self, step: Step) -> List[Tuple[str, str]]:
+        """
+        Args:
+            step (Step): The step to be processed.
+
+        Returns:
+            List[Tuple[str, str]]: The identifiers ("id", name) and notations
+                ("notation", notation) referenced by the step, in the order in
+                which they appear in the AST. They are computed once per step.
+        """
+        info = self.step_info(step)
+        if info.references is None:
+            info.references = FileContext.__get_references(info.expr)
+        return info.references
+
+    def names(self, step: Step) -> List[str]:
+        """
+        Args:
+            step (Step): The step to be processed.
+
+        Returns:
+            List[str]: The names defined by the step, e.g. the name of a
+                theorem or the names of an inductive type and its constructors.
+                They are computed once per step.
+        """
+        info = self.step_info(step)
+        if info.names is None:
+            info.names = FileContext.__get_names(self.expr(step))
+        return info.names
+
     def expr(self, step: Step) -> List:
         """
         Args:
@@ -455,15 +903,7 @@ class FileContext:
         Returns:
             List: 'expr' field from the AST of a step.
         """
-        if (
-            step.ast.span is not None
-            and isinstance(step.ast.span, dict)
-            and "v" in step.ast.span
-            and isinstance(step.ast.span["v"], dict)
-            and "expr" in step.ast.span["v"]
-        ):
-            return self.__expr(step.ast.span["v"]["expr"])
-        return [None]
+        return self.step_info(step).expr
 
     def attrs(self, step: Step) -> List:
         """
@@ -473,15 +913,7 @@ class FileContext:
         Returns:
             List: 'attrs' field from the AST of a step.
         """
-        if (
-            step.ast.span is not None
-            and isinstance(step.ast.span, dict)
-            and "v" in step.ast.span
-            and isinstance(step.ast.span["v"], dict)
-            and "attrs" in step.ast.span["v"]
-        ):
-            return step.ast.span["v"]["attrs"]
-        return []
+        return self.step_info(step).attrs
 
     def term_type(self, step: Step) -> TermType:
         """
@@ -491,7 +923,7 @@ class FileContext:
         Returns:
             TermType: The term type of the step.
         """
-        return self.__term_type(self.expr(step))
+        return self.step_info(step).term_type
 
     def is_proof_term(self, step: Step) -> bool:
         """
@@ -501,20 +933,7 @@ class FileContext:
         Returns:
             bool: Whether the step introduces a new proof term.
         """
-        term_type = self.term_type(step)
-        # Assume that terms of the following types do not introduce new proofs
-        # FIXME: Should probably check if goals were changed
-        return term_type not in [
-            TermType.TACTIC,
-            TermType.NOTATION,
-            TermType.INDUCTIVE,
-            TermType.COINDUCTIVE,
-            TermType.RECORD,
-            TermType.CLASS,
-            TermType.SCHEME,
-            TermType.VARIANT,
-            TermType.OTHER,
-        ]
+        return self.step_info(step).is_proof_term
 
     def is_end_proof(self, step: Step) -> bool:
         """
@@ -524,9 +943,7 @@ class FileContext:
         Returns:
             bool: Whether the step closes an open proof term.
         """
-        # FIXME: Refer to issue #55: https://github.com/sr-lab/coqpyt/issues/55
-        expr = self.expr(step)[0]
-        return expr in ["VernacEndProof", "VernacExactProof", "VernacAbort"]
+        return self.step_info(step).is_end_proof
 
     def is_segment_delimiter(self, step: Step) -> bool:
         """
@@ -536,52 +953,91 @@ class FileContext:
         Returns:
             bool: Whether the step delimits a segment (module or section).
         """
-        expr = self.expr(step)[0]
-        return expr in [
-            "VernacEndSegment",
-            "VernacDefineModule",
-            "VernacDeclareModuleType",
-            "VernacBeginSection",
-        ]
+        return self.step_info(step).is_segment_delimiter
 
     def update(self, context: Union["FileContext", Dict[str, Term]] = {}):
         """Updates the context with new terms.
 
         Args:
-            terms (Dict[str, Term]): The new terms to be added.
+            context (Union[FileContext, Dict[str, Term]]): The new terms to be
+                added. If a FileContext is given, its libraries are also added.
         """
         if isinstance(context, FileContext):
-            terms = context.terms
-            for library in context.libraries:
-                self.add_library(library, context.libraries[library])
-        else:
-            terms = context
+            # The layers are added in the same order to keep the same shadowing
+            for key, layer in context.__layers.items():
+                if isinstance(key, int):
+                    for name, terms in layer.items():
+                        self.__push(name, terms[-1])
+                elif key in context.remote_libraries:
+                    self.add_remote_library(
+                        key, context.remote_libraries[key], context.__resolver
+                    )
+                else:
+                    self.add_library(key, context.libraries[key])
+            return
 
-        for name, term in terms.items():
-            if name not in self.__terms:
-                self.__terms[name] = []
-            self.__terms[name].append(term)
+        for name, term in context.items():
+            self.__push(name, term)
 
     def add_library(self, name: str, terms: Dict[str, Term]):
-        """Adds a library to the context.
+        """Adds a library to the context. The terms of the library are not
+        copied, the library is added as a new layer on top of the context.
+        Every term of the library becomes visible, so the indexes of the
+        context are updated once per term, i.e., the cost is O(|terms|).
 
         Args:
             name (str): The name of the library.
-            terms (List[Term]): The terms defined by the library.
+            terms (Dict[str, Term]): The terms defined by the library.
         """
+        # Re-adding a library moves it to the top
+        if name in self.libraries or name in self.remote_libraries:
+            self.remove_library(name)
         self.libraries[name] = terms
-        self.update(terms)
+        self.__insert_layer(name, MappingProxyType(terms))
+        self.__add_suffixes(name)
+        # The library is the newest layer, so all of its terms are visible
+        for term_name, term in terms.items():
+            self.__set_visible(term_name, name, term)
+
+    def add_remote_library(
+        self, name: str, library_file: str, resolver: LibraryResolver
+    ):
+        """Adds a library whose terms are not loaded to the context. The names
+        which are not found in newer layers are looked up with the resolver,
+        so the terms of the library are not part of the terms of the context
+        or of its indexes. All the remote libraries of a context are looked up
+        with the last resolver given.
+
+        Args:
+            name (str): The name of the library.
+            library_file (str): The file of the library.
+            resolver (LibraryResolver): Resolver of the names of the library.
+        """
+        if name in self.libraries or name in self.remote_libraries:
+            self.remove_library(name)
+        self.remote_libraries[name] = library_file
+        self.__insert_layer(name, MappingProxyType({}))
+        self.__resolver = resolver
 
     def remove_library(self, name: str):
-        """Removes a library from the context.
+        """Removes a library from the context. The names whose visible term
+        came from the library are looked up again in the remaining layers, so
+        the cost is O(|terms of the library|) index updates.
 
         Args:
             name (str): The name of the library.
         """
-        if name in self.libraries:
-            for term_name, term in self.libraries[name].items():
-                self.__remove_term(term_name, term)
+        if name in self.remote_libraries:
+            del self.remote_libraries[name]
+            self.__delete_layer(name)
+        elif name in self.libraries:
             del self.libraries[name]
+            layer = self.__delete_layer(name)
+            self.__remove_suffixes(name)
+            # Only the names whose visible term came from the library change
+            for term_name in layer:
+                if self.__visible_layers.get(term_name) == name:
+                    self.__set_visible(term_name, *self.__find(term_name))
         else:
             raise RuntimeError(f"Library {name} not found.")
 
@@ -605,11 +1061,22 @@ class FileContext:
         Returns:
             Optional[Term]: The term mapped to the name, if it exists.
         """
+        names, layer, term = [], None, None
         for i in range(len(self.__segments.modules), -1, -1):
             curr_name = ".".join(self.__segments.modules[:i] + [name])
-            if curr_name in self.__terms:
-                return self.__terms[curr_name][-1]
-        return None
+            names.append(curr_name)
+            layer = self.__visible_layers.get(curr_name)
+            term = self.__visible.get(curr_name)
+            if term is None:
+                layer, term = self.__lookup_qualified(curr_name)
+            if term is not None:
+                break
+        # Only remote libraries newer than the term found in the process (all
+        # of them if none is found) may define one of the names tried so far
+        remote = self.__lookup_remote(
+            layer, lambda libraries: self.__resolver.get_term(libraries, names)
+        )
+        return term if remote is None else remote
 
     @staticmethod
     def get_notation_scope(notation: str) -> str:
@@ -624,30 +1091,71 @@ class FileContext:
             return notation.split(":")[-1].strip()
         return ""
 
-    def get_notation(self, notation: str, scope: str) -> Term:
-        """Get a notation from the context.
-
-        Args:
-            notation (str): Id of the notation. E.g. "_ + _".
-            scope (str): Scope of the notation. E.g. "nat_scope".
-
-        Raises:
-            RuntimeError: If the notation is not found in the context.
-
-        Returns:
-            Term: Term that corresponds to the notation.
-        """
+    @staticmethod
+    def __notation_shape(tokens: List[str]) -> Tuple[Optional[str], ...]:
+        # Identifiers may be matched by wildcards, so they are replaced by None.
+        # The quotes around a token are removed, because a token of a notation
+        # matches the same token with or without quotes.
+        shape = []
+        for token in tokens:
+            if token == "":
+                continue
+            elif re.fullmatch(_IDENT_REGEX, token):
+                shape.append(None)
+            elif len(token) > 2 and token[0] == token[-1] == "'":
+                shape.append(token[1:-1])
+            else:
+                shape.append(token)
+        return tuple(shape)
 
+    @staticmethod
+    def __notation_matches(notation: List[str], name: str) -> bool:
+        tokens = [token for token in name.split(" ") if token != ""]
+        if len(tokens) != len(notation):
+            return False
+        for sub, token in zip(notation, tokens):
+            if sub == "_":
+                if not re.fullmatch(_IDENT_REGEX, token):
+                    return False
+            elif token != sub and token != f"'{sub}'":
+                return False
+        return True
+
+    def __find_notations(
+        self, index: Dict[Tuple, Dict[str, None]], notation: str, prefix: bool
+    ) -> Optional[List[str]]:
+        notation_tokens = [token for token in notation.split(" ") if token != ""]
+        # A wildcard only matches identifiers, while any other token matches
+        # itself or itself between quotes
+        shapes = [()]
+        for token in notation_tokens:
+            if token == "_":
+                options = [None]
+            else:
+                options = list(dict.fromkeys(FileContext.__notation_shape([token])))
+                if token not in options:
+                    options.append(token)
+            if len(shapes) * len(options) > FileContext.MAX_NOTATION_PROBES:
+                return None
+            shapes = [shape + (option,) for shape in shapes for option in options]
+
+        names = []
+        for shape in shapes:
+            for name in index.get(shape, {}):
+                key = name.rsplit(":", 1)[0].strip() if prefix else name
+                if FileContext.__notation_matches(notation_tokens, key):
+                    names.append(name)
+        return names
+
+    def __find_notations_by_regex(
+        self, notation: str, scope: str
+    ) -> Tuple[List[str], List[str], List[str]]:
         def get_regex(notation_id):
             regex = f"{re.escape(notation_id)}".split("\\ ")
             regex = [sub for sub in regex if sub != ""]
             for i, sub in enumerate(regex):
                 if sub == "_":
-                    # We match the wildcard with the description from here:
-                    # https://coq.inria.fr/distrib/current/refman/language/core/basic.html#grammar-token-ident
-                    # Coq accepts more characters, but no one should need more than these...
-                    chars = "A-Za-zÀ-ÖØ-öø-ˁˆ-ˑˠ-ˤˬˮͰ-ʹͶͷͺ-ͽͿΆΈ-ΊΌΎ-ΡΣ-ϵϷ-ҁҊ-ԯԱ-Ֆՙա-և"
-                    regex[i] = f"([{chars}][{chars}0-9_']*|_[{chars}0-9_']+)"
+                    regex[i] = _IDENT_REGEX
                 else:
                     # Handle '_'
                     regex[i] = f"({sub}|('{sub}'))"
@@ -661,31 +1169,75 @@ class FileContext:
         unscoped_regex = get_regex(notation)
 
         # Search notations
-        match_unscoped, match_unscoped_regex = None, None
-        for term in self.__terms.keys():
+        matches, unscoped, prefixed = [], [], []
+        for term in self.__visible:
             if re.match(regex, term):
-                return self.__terms[term][-1]
+                matches.append(term)
             if re.match(unscoped_regex, term):
-                match_unscoped_regex = term
+                unscoped.append(term)
             # We can't use split because : may be used in the notation
             if re.match(regex, term.rsplit(":", 1)[0].strip()):
-                match_unscoped = term
+                prefixed.append(term)
+        return matches, unscoped, prefixed
 
+    def __newest(self, names: List[str]) -> str:
+        # Names from newer layers are preferred, as when they are looked up.
+        # The first name is used for names from the same layer.
+        positions = self.__positions
+        return max(names, key=lambda name: positions[self.__visible_layers[name]])
+
+    def __find_notation(self, notation: str, scope: str) -> Optional[str]:
+        notation_id = FileContext.__get_notation_key(notation, scope)
+        matches = self.__find_notations(self.__notations, notation_id, False)
+        unscoped = self.__find_notations(self.__notations, notation, False)
+        prefixed = self.__find_notations(self.__notation_prefixes, notation_id, True)
+
+        # Search notations
+        if matches is None or unscoped is None or prefixed is None:
+            matches, unscoped, prefixed = self.__find_notations_by_regex(
+                notation, scope
+            )
+        if len(matches) > 0:
+            return self.__newest(matches)
         # In case the stored id does not contain the scope and no scope matched/was provided
-        if match_unscoped_regex is not None:
-            return self.__terms[match_unscoped_regex][-1]
+        elif len(unscoped) > 0:
+            return self.__newest(unscoped[::-1])
         # In case the stored id contains the scope and no scope matched/was provided
-        elif match_unscoped is not None:
-            return self.__terms[match_unscoped][-1]
+        elif len(prefixed) > 0:
+            return self.__newest(prefixed[::-1])
 
         # Search Infix
         if re.match("^_ ([^ ]*) _$", notation):
             op = notation[2:-2]
             key = FileContext.__get_notation_key(op, scope)
-            if key in self.__terms:
-                return self.__terms[key][-1]
+            if key in self.__visible:
+                return key
+        return None
+
+    def get_notation(self, notation: str, scope: str) -> Term:
+        """Get a notation from the context.
+
+        Args:
+            notation (str): Id of the notation. E.g. "_ + _".
+            scope (str): Scope of the notation. E.g. "nat_scope".
+
+        Raises:
+            RuntimeError: If the notation is not found in the context.
 
-        raise NotationNotFoundException(notation_id)
+        Returns:
+            Term: Term that corresponds to the notation.
+        """
+        name = self.__find_notation(notation, scope)
+        layer = None if name is None else self.__visible_layers[name]
+        remote = self.__lookup_remote(
+            layer,
+            lambda libraries: self.__resolver.get_notation(libraries, notation, scope),
+        )
+        if remote is not None:
+            return remote
+        if name is not None:
+            return self.__visible[name]
+        raise NotationNotFoundException(FileContext.__get_notation_key(notation, scope))
 
     def reset(self):
         """Resets the context to its initial state."""
@@ -0,0 +1,534 @@
+import os
+import sys
+import stat
+import pickle
+import signal
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import socketserver
+from abc import ABC, abstractmethod
+from typing import Any, Optional, List, Dict, Tuple, OrderedDict
+
+from coqpyt.coq.structs import Term
+from coqpyt.coq.context import FileContext, LibraryResolver
+from coqpyt.coq.exceptions import NotationNotFoundException
+from coqpyt.coq.proof_file import _AuxFile
+
+
+class LibraryContextService(object):
+    """Loads the contexts of Coq libraries and keeps them loaded.
+
+    The service keeps a warm coq-lsp server (an auxiliary file) for each
+    workspace it is queried on, which is used to find the libraries loaded by
+    default and their files. The terms of each library are loaded once and
+    reused for every request (see _AuxFile.get_library).
+
+    The contexts used to look up names in lists of libraries are also kept, up
+    to MAX_CONTEXTS of them. A context is built again if the digest of one of
+    its libraries changed (see _AuxFile.get_library_hash).
+
+    Attributes:
+        use_disk_cache (bool): If True, the terms of the libraries are also
+            stored in and loaded from the disk cache.
+    """
+
+    MAX_CONTEXTS = 16
+
+    METHODS = [
+        "get_libraries",
+        "get_library",
+        "get_coq_context",
+        "get_term",
+        "get_notation",
+    ]
+
+    def __init__(self, use_disk_cache: bool = False):
+        self.use_disk_cache = use_disk_cache
+        self.__lock = threading.RLock()
+        self.__aux_files: Dict[Tuple[Optional[str], int], _AuxFile] = {}
+        self.__preludes: Dict[Tuple[Optional[str], int], List[Tuple[str, str]]] = {}
+        self.__contexts: OrderedDict[
+            Tuple[Optional[str], int, Tuple[Tuple[str, str], ...]],
+            Tuple[List[Optional[str]], FileContext],
+        ] = OrderedDict()
+
+    def __aux_file(self, timeout: int, workspace: Optional[str]) -> _AuxFile:
+        key = (workspace, timeout)
+        if key not in self.__aux_files:
+            temp_path = os.path.join(tempfile.gettempdir(), "daemon.v")
+            aux_file = _AuxFile(temp_path, timeout=timeout, workspace=workspace)
+            aux_file.didOpen()
+            self.__aux_files[key] = aux_file
+        return self.__aux_files[key]
+
+    def get_libraries(
+        self, timeout: int, workspace: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Args:
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            List[Tuple[str, str]]: The name and file of each library loaded by
+                default on an empty file of the workspace.
+        """
+        with self.__lock:
+            key = (workspace, timeout)
+            if key not in self.__preludes:
+                aux_file = self.__aux_file(timeout, workspace)
+                aux_file.write("")
+                libraries = _AuxFile.get_libraries(aux_file)
+                library_files = _AuxFile.locate_libraries(aux_file, libraries)
+                self.__preludes[key] = list(zip(libraries, library_files))
+            return self.__preludes[key]
+
+    def get_library(
+        self,
+        library_name: str,
+        library_file: str,
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Dict[str, Term]:
+        """
+        Args:
+            library_name (str): The name of the library.
+            library_file (str): The file of the library.
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            Dict[str, Term]: The terms defined by the library.
+        """
+        with self.__lock:
+            return _AuxFile.get_library(
+                library_name,
+                library_file,
+                timeout,
+                workspace=workspace,
+                use_disk_cache=self.use_disk_cache,
+            )
+
+    def get_coq_context(
+        self, timeout: int, workspace: Optional[str] = None
+    ) -> Dict[str, Dict[str, Term]]:
+        """
+        Args:
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            Dict[str, Dict[str, Term]]: The terms of each library loaded by
+                default, in the order in which the libraries are loaded.
+        """
+        with self.__lock:
+            coq_context = {}
+            for library, library_file in self.get_libraries(timeout, workspace):
+                coq_context[library] = self.get_library(
+                    library, library_file, timeout, workspace=workspace
+                )
+            return coq_context
+
+    def __context(
+        self,
+        libraries: List[Tuple[str, str]],
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> FileContext:
+        key = (workspace, timeout, tuple(map(tuple, libraries)))
+        digests = []
+        for library, library_file in libraries:
+            try:
+                digest = _AuxFile.get_library_hash(library, library_file, workspace)
+            except OSError:
+                digest = None
+            digests.append(digest)
+
+        if key in self.__contexts and self.__contexts[key][0] == digests:
+            self.__contexts.move_to_end(key)
+        else:
+            # The version reported by coq-lsp is used if a server is running
+            aux_file = self.__aux_files.get((workspace, timeout))
+            context = FileContext(
+                os.path.join(tempfile.gettempdir(), "daemon.v"),
+                coq_version=(
+                    None if aux_file is None else aux_file.coq_lsp_client.coq_version
+                ),
+            )
+            for library, library_file in libraries:
+                terms = self.get_library(
+                    library, library_file, timeout, workspace=workspace
+                )
+                context.add_library(library, terms)
+            self.__contexts[key] = (digests, context)
+            self.__contexts.move_to_end(key)
+            while len(self.__contexts) > LibraryContextService.MAX_CONTEXTS:
+                self.__contexts.popitem(last=False)
+        return self.__contexts[key][1]
+
+    def get_term(
+        self,
+        libraries: List[Tuple[str, str]],
+        names: List[str],
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Optional[Term]:
+        """
+        Args:
+            libraries (List[Tuple[str, str]]): The name and file of each library
+                in which the term is searched for, from the oldest to the newest.
+            names (List[str]): Names of the term, which may be qualified, in the
+                order in which they are tried.
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            Optional[Term]: The term mapped to the first name that is found.
+        """
+        with self.__lock:
+            context = self.__context(libraries, timeout, workspace)
+            for name in names:
+                term = context.get_term(name)
+                if term is not None:
+                    return term
+            return None
+
+    def get_notation(
+        self,
+        libraries: List[Tuple[str, str]],
+        notation: str,
+        scope: str,
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Optional[Term]:
+        """
+        Args:
+            libraries (List[Tuple[str, str]]): The name and file of each library
+                in which the notation is searched for, from the oldest to the
+                newest.
+            notation (str): Id of the notation. E.g. "_ + _".
+            scope (str): Scope of the notation. E.g. "nat_scope".
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            Optional[Term]: Term that corresponds to the notation, if it exists.
+        """
+        with self.__lock:
+            context = self.__context(libraries, timeout, workspace)
+            try:
+                return context.get_notation(notation, scope)
+            except NotationNotFoundException:
+                return None
+
+    def close(self):
+        """Closes all the coq-lsp servers used by the service."""
+        with self.__lock:
+            for aux_file in self.__aux_files.values():
+                aux_file.close()
+            self.__aux_files.clear()
+
+
+class LibraryContextClient(ABC):
+    """Client of a LibraryContextService. The requests and responses are
+    serialized, so the terms returned are copies owned by the caller."""
+
+    def __init__(self):
+        self.__resolvers: Dict[Tuple[int, Optional[str]], "LibraryClientResolver"] = {}
+
+    @abstractmethod
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        pass
+
+    def get_libraries(
+        self, timeout: int, workspace: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """See LibraryContextService.get_libraries."""
+        return self._call("get_libraries", timeout, workspace=workspace)
+
+    def get_library(
+        self,
+        library_name: str,
+        library_file: str,
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Dict[str, Term]:
+        """See LibraryContextService.get_library."""
+        return self._call(
+            "get_library", library_name, library_file, timeout, workspace=workspace
+        )
+
+    def get_coq_context(
+        self, timeout: int, workspace: Optional[str] = None
+    ) -> Dict[str, Dict[str, Term]]:
+        """See LibraryContextService.get_coq_context."""
+        return self._call("get_coq_context", timeout, workspace=workspace)
+
+    def get_term(
+        self,
+        libraries: List[Tuple[str, str]],
+        names: List[str],
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Optional[Term]:
+        """See LibraryContextService.get_term."""
+        return self._call("get_term", libraries, names, timeout, workspace=workspace)
+
+    def get_notation(
+        self,
+        libraries: List[Tuple[str, str]],
+        notation: str,
+        scope: str,
+        timeout: int,
+        workspace: Optional[str] = None,
+    ) -> Optional[Term]:
+        """See LibraryContextService.get_notation."""
+        return self._call(
+            "get_notation", libraries, notation, scope, timeout, workspace=workspace
+        )
+
+    def resolver(
+        self, timeout: int, workspace: Optional[str] = None
+    ) -> "LibraryClientResolver":
+        """
+        Args:
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+
+        Returns:
+            LibraryClientResolver: Resolver which looks up the names of remote
+                libraries of a FileContext with this client. The same resolver,
+                and so its answers, is returned for the same arguments.
+        """
+        key = (timeout, workspace)
+        if key not in self.__resolvers:
+            self.__resolvers[key] = LibraryClientResolver(
+                self, timeout, workspace=workspace
+            )
+        return self.__resolvers[key]
+
+    def close(self):
+        pass
+
+
+class LibraryClientResolver(LibraryResolver):
+    """Looks up the terms of remote libraries of a FileContext with a
+    LibraryContextClient. The terms of a library do not change, so each answer
+    is kept and a name is only requested once for each list of libraries."""
+
+    def __init__(
+        self,
+        client: LibraryContextClient,
+        timeout: int,
+        workspace: Optional[str] = None,
+    ):
+        """
+        Args:
+            client (LibraryContextClient): The client used for the requests.
+            timeout (int): Timeout used in coq-lsp.
+            workspace (Optional[str], optional): Absolute path for the workspace.
+        """
+        self.client = client
+        self.timeout = timeout
+        self.workspace = workspace
+        self.__answers: Dict[Tuple, Optional[Term]] = {}
+
+    def get_term(
+        self, libraries: List[Tuple[str, str]], names: List[str]
+    ) -> Optional[Term]:
+        key = ("term", tuple(libraries), tuple(names))
+        if key not in self.__answers:
+            self.__answers[key] = self.client.get_term(
+                libraries, names, self.timeout, workspace=self.workspace
+            )
+        return self.__answers[key]
+
+    def get_notation(
+        self, libraries: List[Tuple[str, str]], notation: str, scope: str
+    ) -> Optional[Term]:
+        key = ("notation", tuple(libraries), notation, scope)
+        if key not in self.__answers:
+            self.__answers[key] = self.client.get_notation(
+                libraries, notation, scope, self.timeout, workspace=self.workspace
+            )
+        return self.__answers[key]
+
+
+class InProcessLibraryClient(LibraryContextClient):
+    """Stand-in for a library context daemon which runs the service in the
+    current process."""
+
+    def __init__(self, service: LibraryContextService):
+        super().__init__()
+        self.service = service
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        if method not in LibraryContextService.METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        # The round trip through pickle gives the same isolation as the daemon
+        return pickle.loads(
+            pickle.dumps(getattr(self.service, method)(*args, **kwargs))
+        )
+
+
+def _send_message(sock: socket.socket, message: Any):
+    data = pickle.dumps(message)
+    sock.sendall(struct.pack("!Q", len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def _recv_message(sock: socket.socket) -> Any:
+    header = _recv_exactly(sock, 8)
+    if header is None:
+        raise EOFError()
+    data = _recv_exactly(sock, struct.unpack("!Q", header)[0])
+    if data is None:
+        raise EOFError()
+    return pickle.loads(data)
+
+
+class LibraryDaemonClient(LibraryContextClient):
+    """Client of a library context daemon listening on a Unix socket."""
+
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        """
+        Args:
+            socket_path (str): Path of the Unix socket of the daemon.
+            timeout (Optional[float], optional): Timeout for each request in
+                seconds. Defaults to None (no timeout).
+        """
+        super().__init__()
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.__socket: Optional[socket.socket] = None
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        with self.__lock:
+            if self.__socket is None:
+                self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.__socket.settimeout(self.timeout)
+                self.__socket.connect(self.socket_path)
+            try:
+                _send_message(self.__socket, (method, args, kwargs))
+                ok, result = _recv_message(self.__socket)
+            except (OSError, EOFError) as e:
+                self.close()
+                raise e
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+
+
+class _LibraryRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service: LibraryContextService = self.server.service
+        while True:
+            try:
+                method, args, kwargs = _recv_message(self.request)
+            except (OSError, EOFError):
+                return
+
+            try:
+                if method not in LibraryContextService.METHODS:
+                    raise ValueError(f"Unknown method: {method}")
+                response = (True, getattr(service, method)(*args, **kwargs))
+            except Exception as e:
+                response = (False, e)
+
+            try:
+                _send_message(self.request, response)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                _send_message(self.request, (False, RuntimeError(repr(response[1]))))
+
+
+class LibraryDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Long-running server that shares a LibraryContextService with the
+    clients connected to its Unix socket. Only the owner of the socket can
+    connect to it."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: LibraryContextService):
+        """
+        Args:
+            socket_path (str): Path of the Unix socket to listen on.
+            service (LibraryContextService): Service used to answer requests.
+
+        Raises:
+            FileExistsError: If the path exists and is not a socket.
+        """
+        self.service = service
+        if os.path.lexists(socket_path):
+            # Only a stale socket, e.g., of a daemon that crashed, is replaced
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise FileExistsError(f"{socket_path} exists and is not a socket.")
+            os.remove(socket_path)
+        super().__init__(socket_path, _LibraryRequestHandler, bind_and_activate=False)
+        try:
+            self.server_bind()
+            # Only the owner of the socket can connect to it. Nobody can connect
+            # before the server listens, so the permissions are set in time.
+            os.chmod(socket_path, 0o600)
+            self.server_activate()
+        except BaseException:
+            self.server_close()
+            raise
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.service.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Serve the contexts of Coq libraries over a Unix socket."
+    )
+    parser.add_argument("socket", help="Path of the Unix socket to listen on.")
+    parser.add_argument(
+        "--use-disk-cache",
+        action="store_true",
+        help="Store the terms of the loaded libraries in the disk cache.",
+    )
+    args = parser.parse_args(argv)
+
+    daemon = LibraryDaemon(args.socket, LibraryContextService(args.use_disk_cache))
+    signal.signal(
+        signal.SIGTERM,
+        lambda *_: threading.Thread(target=daemon.shutdown, daemon=True).start(),
+    )
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
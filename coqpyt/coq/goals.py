@@ -0,0 +1,566 @@
+import os
+import mmap
+import zlib
+import pickle
+import hashlib
+import tempfile
+from difflib import SequenceMatcher
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Dict, IO
+
+from coqpyt.lsp.structs import Position, Diagnostic
+from coqpyt.coq.lsp.structs import GoalAnswer, GoalConfig, Goal, Hyp
+
+GoalKey = Tuple[str, int, int, int]
+TacticKey = Tuple[str, str, str]
+
+
+class GoalCache(object):
+    """Bounded LRU cache of the goals returned by coq-lsp.
+
+    The goals are keyed by the URI and version of the document and by the
+    position where they were requested. When a document is edited, the goals
+    before the edit point are still valid, so they are moved to the new
+    version of the document (see invalidate) instead of being requested again.
+
+    If a memory budget is defined, the least recently used goals that do not
+    fit in the budget are compressed and written to a temporary file instead
+    of being discarded. The file is memory-mapped to load them back when they
+    are accessed. Goals loaded back keep their copy in the file, which is
+    reused if they are evicted again, and the file is compacted when most of it
+    is taken by goals no longer stored in it.
+
+    Attributes:
+        max_size (Optional[int]): Maximum number of goals stored in memory. If
+            None, the number of goals has no limit.
+        memory_budget (Optional[int]): Maximum size in bytes of the goals stored
+            in memory, measured as the size of their serialization. If None,
+            the size has no limit and no goals are written to disk.
+        hits (int): Number of lookups answered by the cache.
+        misses (int): Number of lookups not answered by the cache.
+        loads (int): Number of goals loaded back from disk.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = 1024, memory_budget: Optional[int] = None
+    ):
+        self.max_size = max_size
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.__goals: Dict[GoalKey, Optional[GoalAnswer]] = OrderedDict()
+        self.__sizes: Dict[GoalKey, int] = {}
+        self.__memory = 0
+        # Offset and length of the compressed goals in the segment file
+        self.__spilled: Dict[GoalKey, Tuple[int, int]] = {}
+        # Location of the goals loaded back from the segment file, which is
+        # still valid while the goals are not replaced
+        self.__copies: Dict[GoalKey, Tuple[int, int]] = {}
+        self.__segment: Optional[IO[bytes]] = None
+        self.__segment_size = 0
+        # Bytes of the segment file which are not used by any goals
+        self.__dead = 0
+        self.__map: Optional[mmap.mmap] = None
+
+    @staticmethod
+    def key(uri: str, version: int, position: Position) -> GoalKey:
+        return (uri, version, position.line, position.character)
+
+    @property
+    def memory(self) -> int:
+        """
+        Returns:
+            int: Size in bytes of the goals stored in memory. Only measured if
+                a memory budget is defined.
+        """
+        return self.__memory
+
+    @property
+    def disk_size(self) -> int:
+        """
+        Returns:
+            int: Size in bytes of the segment file where goals are written.
+        """
+        return self.__segment_size
+
+    def __len__(self) -> int:
+        return len(self.__goals) + len(self.__spilled)
+
+    def __contains__(self, key: GoalKey) -> bool:
+        if key in self.__goals or key in self.__spilled:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __getitem__(self, key: GoalKey) -> Optional[GoalAnswer]:
+        if key in self.__spilled:
+            self.__load(key)
+        self.__goals.move_to_end(key)
+        return self.__goals[key]
+
+    def __setitem__(self, key: GoalKey, goals: Optional[GoalAnswer]):
+        if self.max_size is not None and self.max_size <= 0:
+            return
+        self.__remove(key)
+        self.__insert(key, goals, None)
+        self.__collect()
+
+    def __insert(
+        self, key: GoalKey, goals: Optional[GoalAnswer], data: Optional[bytes]
+    ):
+        self.__goals[key] = goals
+        if self.memory_budget is not None:
+            if data is None:
+                data = pickle.dumps(goals, protocol=pickle.HIGHEST_PROTOCOL)
+            self.__sizes[key] = len(data)
+            self.__memory += len(data)
+        self.__evict()
+
+    def __evict(self):
+        while len(self.__goals) > 1 and (
+            (self.max_size is not None and len(self.__goals) > self.max_size)
+            or (self.memory_budget is not None and self.__memory > self.memory_budget)
+        ):
+            key, goals = self.__goals.popitem(last=False)
+            size = self.__sizes.pop(key, 0)
+            self.__memory -= size
+            if self.memory_budget is not None:
+                self.__spill(key, goals)
+
+    def __spill(self, key: GoalKey, goals: Optional[GoalAnswer]):
+        if key in self.__copies:
+            self.__spilled[key] = self.__copies.pop(key)
+            return
+        data = zlib.compress(pickle.dumps(goals, protocol=pickle.HIGHEST_PROTOCOL))
+        if self.__segment is None:
+            self.__segment = tempfile.TemporaryFile(prefix="coqpyt_goals_")
+        self.__segment.seek(self.__segment_size)
+        self.__segment.write(data)
+        self.__spilled[key] = (self.__segment_size, len(data))
+        self.__segment_size += len(data)
+
+    def __load(self, key: GoalKey):
+        offset, length = self.__spilled.pop(key)
+        self.__copies[key] = (offset, length)
+        if self.__map is None or len(self.__map) < offset + length:
+            # The segment grew since it was mapped
+            self.__segment.flush()
+            if self.__map is not None:
+                self.__map.close()
+            self.__map = mmap.mmap(
+                self.__segment.fileno(), self.__segment_size, access=mmap.ACCESS_READ
+            )
+        data = zlib.decompress(self.__map[offset : offset + length])
+        self.loads += 1
+        self.__insert(key, pickle.loads(data), data)
+        self.__collect()
+
+    def __discard(self, location: Optional[Tuple[int, int]]):
+        if location is not None:
+            self.__dead += location[1]
+
+    def __remove(self, key: GoalKey):
+        if key in self.__goals:
+            del self.__goals[key]
+            self.__memory -= self.__sizes.pop(key, 0)
+        self.__discard(self.__copies.pop(key, None))
+        self.__discard(self.__spilled.pop(key, None))
+
+    def __collect(self):
+        if len(self.__spilled) == 0:
+            self.__truncate()
+        elif self.__dead * 2 > self.__segment_size:
+            self.__compact()
+
+    def __truncate(self):
+        # Every goal in the segment is stale, so the file can be reused
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        if self.__segment is not None:
+            self.__segment.truncate(0)
+        self.__segment_size = 0
+        self.__copies.clear()
+        self.__dead = 0
+
+    def __compact(self):
+        # Most of the segment is stale, so the spilled goals are rewritten to a
+        # new segment. The copies of the goals in memory are dropped.
+        self.__segment.flush()
+        segment = tempfile.TemporaryFile(prefix="coqpyt_goals_")
+        size = 0
+        for key, (offset, length) in self.__spilled.items():
+            self.__segment.seek(offset)
+            segment.write(self.__segment.read(length))
+            self.__spilled[key] = (size, length)
+            size += length
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        self.__segment.close()
+        self.__segment = segment
+        self.__segment_size = size
+        self.__copies.clear()
+        self.__dead = 0
+
+    def invalidate(self, uri: str, version: int, new_version: int, position: Position):
+        """Updates the goals of a document after it is edited. The goals of the
+        old version requested before the edit point are moved to the new
+        version, and all the other goals of the document are removed, except
+        the ones already requested for the new version.
+
+        Args:
+            uri (str): The URI of the document.
+            version (int): The version of the document before the edit.
+            new_version (int): The version of the document after the edit.
+            position (Position): The edit point, i.e., the first position
+                of the document affected by the edit.
+        """
+        edit_point = (position.line, position.character)
+
+        def moved(key: GoalKey) -> Optional[GoalKey]:
+            if key[1] == version and key[2:] < edit_point:
+                return (uri, new_version, key[2], key[3])
+            return None
+
+        for key in list(self.__goals.keys()):
+            if key[0] != uri or key[1] == new_version:
+                continue
+            goals = self.__goals.pop(key)
+            size = self.__sizes.pop(key, 0)
+            copy = self.__copies.pop(key, None)
+            new_key = moved(key)
+            if new_key is not None and new_key not in self.__goals:
+                # The goals moved keep their relative LRU order
+                self.__goals[new_key] = goals
+                if self.memory_budget is not None:
+                    self.__sizes[new_key] = size
+                if copy is not None:
+                    self.__copies[new_key] = copy
+            else:
+                self.__memory -= size
+                self.__discard(copy)
+
+        for key in list(self.__spilled.keys()):
+            if key[0] != uri or key[1] == new_version:
+                continue
+            location = self.__spilled.pop(key)
+            new_key = moved(key)
+            if (
+                new_key is not None
+                and new_key not in self.__goals
+                and new_key not in self.__spilled
+            ):
+                self.__spilled[new_key] = location
+            else:
+                self.__discard(location)
+        self.__collect()
+
+    def clear(self, uri: Optional[str] = None):
+        """Removes the goals of a document from the cache.
+
+        Args:
+            uri (Optional[str], optional): The URI of the document. If None,
+                the goals of every document are removed.
+        """
+        keys = list(self.__goals.keys()) + list(self.__spilled.keys())
+        for key in keys:
+            if uri is None or key[0] == uri:
+                self.__remove(key)
+        self.__collect()
+
+    def close(self):
+        """Removes all the goals and deletes the segment file."""
+        self.clear()
+        if self.__segment is not None:
+            self.__segment.close()
+            self.__segment = None
+
+
+class GoalDiff(object):
+    """Difference between a goal and a goal of the previous step. A goal can
+    be stored as the diff against the previous goal and rebuilt with apply.
+
+    Attributes:
+        removed (List[Hyp]): Hypotheses of the previous goal which are not in
+            the goal.
+        added (List[Hyp]): Hypotheses of the goal which are not in the
+            previous goal.
+        ty (Optional[str]): The type of the goal.
+        ty_changed (bool): Whether the type differs from the previous goal.
+    """
+
+    def __init__(
+        self,
+        edits: List[Tuple[int, int, List[Hyp]]],
+        removed: List[Hyp],
+        ty: Optional[str],
+        ty_changed: bool,
+    ):
+        self.__edits = edits
+        self.removed = removed
+        self.added = [hyp for _, _, hyps in edits for hyp in hyps]
+        self.ty = ty
+        self.ty_changed = ty_changed
+
+    def __repr__(self) -> str:
+        res = [f"- {hyp}" for hyp in self.removed]
+        res += [f"+ {hyp}" for hyp in self.added]
+        if self.ty_changed:
+            res.append(f"|- {self.ty}")
+        return "\n".join(res)
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        Returns:
+            bool: True if the goal is equal to the previous goal.
+        """
+        return len(self.__edits) == 0 and not self.ty_changed
+
+    def apply(self, previous: Optional[Goal]) -> Goal:
+        """Rebuilds the goal from the previous goal.
+
+        Args:
+            previous (Optional[Goal]): The goal the diff was computed against.
+
+        Returns:
+            Goal: The goal. Hypotheses not changed are shared with the
+                previous goal.
+        """
+        previous_hyps = [] if previous is None else previous.hyps
+        hyps, last = [], 0
+        for start, end, added in self.__edits:
+            hyps.extend(previous_hyps[last:start])
+            hyps.extend(added)
+            last = end
+        hyps.extend(previous_hyps[last:])
+        ty = self.ty if self.ty_changed or previous is None else previous.ty
+        return Goal(hyps, ty)
+
+
+def _hyp_key(hyp: Hyp) -> Tuple[Tuple[str, ...], str, Optional[str]]:
+    return (tuple(hyp.names), hyp.ty, hyp.definition)
+
+
+def diff_goals(previous: Optional[Goal], goal: Goal) -> GoalDiff:
+    """
+    Args:
+        previous (Optional[Goal]): The goal of the previous step. If None,
+            every hypothesis of the goal is considered added.
+        goal (Goal): The goal of the current step.
+
+    Returns:
+        GoalDiff: The difference between the goals.
+    """
+    previous_hyps = [] if previous is None else previous.hyps
+    matcher = SequenceMatcher(
+        None,
+        [_hyp_key(hyp) for hyp in previous_hyps],
+        [_hyp_key(hyp) for hyp in goal.hyps],
+        autojunk=False,
+    )
+    edits, removed = [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        edits.append((i1, i2, goal.hyps[j1:j2]))
+        removed.extend(previous_hyps[i1:i2])
+    ty_changed = previous is None or previous.ty != goal.ty
+    return GoalDiff(edits, removed, goal.ty, ty_changed)
+
+
+def diff_goal_configs(
+    previous: Optional[GoalConfig], goals: Optional[GoalConfig]
+) -> List[GoalDiff]:
+    """Compares the focused goals of two steps. Each goal is compared with
+    the goal in the same position of the previous step.
+
+    Args:
+        previous (Optional[GoalConfig]): The goals of the previous step.
+        goals (Optional[GoalConfig]): The goals of the current step.
+
+    Returns:
+        List[GoalDiff]: The difference of each focused goal of the current
+            step to the previous step.
+    """
+    if goals is None:
+        return []
+    previous_goals = [] if previous is None else previous.goals
+    return [
+        diff_goals(previous_goals[i] if i < len(previous_goals) else None, goal)
+        for i, goal in enumerate(goals.goals)
+    ]
+
+
+def goal_state_hash(goals: GoalConfig) -> str:
+    """
+    Args:
+        goals (GoalConfig): The goals of a proof state.
+
+    Returns:
+        str: Digest of the hypotheses and types of every goal of the state,
+            including the goals in the stack, the shelf and the given up goals.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    def update(label: str, goal_list: List[Goal]):
+        digest.update(f"{label}{len(goal_list)}\0".encode("utf-8"))
+        for goal in goal_list:
+            for hyp in goal.hyps:
+                names = ",".join(hyp.names)
+                digest.update(f"{names}:{hyp.definition}:{hyp.ty}\0".encode("utf-8"))
+            digest.update(f"|-{goal.ty}\0".encode("utf-8"))
+
+    update("goals", goals.goals)
+    for i, (before, after) in enumerate(goals.stack):
+        update(f"stack{i}<", before)
+        update(f"stack{i}>", after)
+    update("shelf", goals.shelf)
+    update("given_up", goals.given_up)
+    digest.update(repr(goals.bullet).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TacticCache(object):
+    """Bounded LRU cache of the outcomes of running tactics on proof states.
+
+    The outcomes are keyed by the hash of the proof state (see goal_state_hash),
+    the text of the tactic and a fingerprint of the context where the tactic
+    runs, so the same tactic on the same goals is only checked once across
+    proofs and files. The cache can be shared by several ProofFiles and saved
+    to disk to be reused by later runs.
+
+    Attributes:
+        path (Optional[str]): File where the cache is saved. If the file exists
+            when the cache is created, its outcomes are loaded.
+        max_size (Optional[int]): Maximum number of outcomes stored. If None,
+            the number of outcomes has no limit.
+        hits (int): Number of lookups (see lookup) answered by the cache.
+        misses (int): Number of lookups not answered by the cache.
+        evictions (int): Number of outcomes removed to respect max_size.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, path: Optional[str] = None, max_size: Optional[int] = 4096):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__outcomes: Dict[
+            TacticKey, Tuple[Optional[GoalConfig], List[Diagnostic]]
+        ] = OrderedDict()
+        if path is not None and os.path.exists(path):
+            self.__load(path)
+
+    @staticmethod
+    def key(state: str, tactic: str, fingerprint: str) -> TacticKey:
+        # Whitespace around the tactic does not change its outcome
+        return (state, tactic.strip(), fingerprint)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns:
+            float: Fraction of the lookups answered by the cache.
+        """
+        lookups = self.hits + self.misses
+        return 0.0 if lookups == 0 else self.hits / lookups
+
+    def __len__(self) -> int:
+        return len(self.__outcomes)
+
+    def __contains__(self, key: TacticKey) -> bool:
+        return key in self.__outcomes
+
+    def __getitem__(
+        self, key: TacticKey
+    ) -> Tuple[Optional[GoalConfig], List[Diagnostic]]:
+        return self.__outcomes[key]
+
+    def get(
+        self, key: TacticKey
+    ) -> Optional[Tuple[Optional[GoalConfig], List[Diagnostic]]]:
+        """Reads an outcome without counting the lookup or changing the order
+        of eviction.
+
+        Args:
+            key (TacticKey): The key of the outcome.
+
+        Returns:
+            Optional[Tuple[Optional[GoalConfig], List[Diagnostic]]]: The goals
+                and diagnostics left by the tactic, if they are cached.
+        """
+        return self.__outcomes.get(key)
+
+    def lookup(
+        self, key: TacticKey
+    ) -> Optional[Tuple[Optional[GoalConfig], List[Diagnostic]]]:
+        """Reads an outcome to be used instead of running the tactic. The
+        lookup is counted in the statistics and the outcome becomes the most
+        recently used.
+
+        Args:
+            key (TacticKey): The key of the outcome.
+
+        Returns:
+            Optional[Tuple[Optional[GoalConfig], List[Diagnostic]]]: The goals
+                and diagnostics left by the tactic, if they are cached.
+        """
+        if key not in self.__outcomes:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__outcomes.move_to_end(key)
+        return self.__outcomes[key]
+
+    def __setitem__(
+        self, key: TacticKey, outcome: Tuple[Optional[GoalConfig], List[Diagnostic]]
+    ):
+        if self.max_size is not None and self.max_size <= 0:
+            return
+        self.__outcomes.pop(key, None)
+        self.__outcomes[key] = outcome
+        while self.max_size is not None and len(self.__outcomes) > self.max_size:
+            self.__outcomes.popitem(last=False)
+            self.evictions += 1
+
+    def __load(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError):
+            return
+        if not isinstance(data, tuple) or data[0] != TacticCache.FORMAT:
+            return
+        for key, outcome in data[1]:
+            self[key] = outcome
+        self.evictions = 0
+
+    def save(self, path: Optional[str] = None):
+        """Writes the outcomes to a file, from the least to the most recently
+        used, so that the order of eviction is kept when they are loaded.
+
+        Args:
+            path (Optional[str], optional): Path of the file. Defaults to the
+                path of the cache.
+        """
+        path = self.path if path is None else path
+        if path is None:
+            raise ValueError("The tactic cache has no path to be saved to.")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so that readers never see a partial cache
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            data = (TacticCache.FORMAT, list(self.__outcomes.items()))
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def clear(self):
+        """Removes all the outcomes from the cache."""
+        self.__outcomes.clear()
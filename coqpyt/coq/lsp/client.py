@@ -1,3 +1,4 @@
+import re
 import sys
 import threading
 import subprocess
@@ -17,6 +18,8 @@ class CoqLspClient(LspClient):
             the `$/coq/fileProgress` notifications sent by the server. The
             keys are the URIs of the files and the values are the list of
             notifications.
+        coq_version (Optional[str]): Version of Coq used by the server, as
+            reported on initialization, if available.
     """
 
     __DEFAULT_INIT_OPTIONS = {
@@ -84,7 +87,7 @@ class CoqLspClient(LspClient):
         # This is required to be False since we use it to know if operations
         # such as didOpen and didChange already finished.
         init_options["eager_diagnostics"] = False
-        self.initialize(
+        result = self.initialize(
             proc.pid,
             "",
             root_uri,
@@ -94,9 +97,22 @@ class CoqLspClient(LspClient):
             workspaces,
         )
         self.initialized()
+        self.coq_version = CoqLspClient.__get_coq_version(result)
         # Used to check if didOpen and didChange already finished
         self.__completed_operation = threading.Event()
 
+    @staticmethod
+    def __get_coq_version(result: Optional[Dict]) -> Optional[str]:
+        # coq-lsp reports its version followed by the version of Coq it was
+        # built with (e.g. "0.1.8+8.19")
+        if not isinstance(result, dict) or not isinstance(
+            result.get("serverInfo"), dict
+        ):
+            return None
+        server_version = result["serverInfo"].get("version", "")
+        match = re.search(r"\+(\d+\.\d+(\.\d+)?)", str(server_version))
+        return match.group(1) if match is not None else None
+
     def __handle_publish_diagnostics(self, params: Dict):
         self.__completed_operation.set()
 
@@ -161,6 +177,42 @@ class CoqLspClient(LspClient):
         )
         return GoalAnswer.parse(result_dict)
 
+    def proof_goals_batch(
+        self,
+        textDocument: TextDocumentIdentifier,
+        positions: List[Position],
+        concurrency: int = 8,
+    ) -> List[Optional[GoalAnswer]]:
+        """Get proof goals at several positions. The requests are pipelined,
+        i.e., up to `concurrency` requests are sent before waiting for the
+        oldest response.
+
+        Args:
+            textDocument (TextDocumentIdentifier): Text document to consider.
+            positions (List[Position]): Positions used to get the proof goals.
+            concurrency (int, optional): Maximum number of requests waiting
+                for a response at the same time. Defaults to 8.
+
+        Returns:
+            List[Optional[GoalAnswer]]: The goals at each position, in the
+                same order as the positions.
+        """
+        concurrency = max(1, concurrency)
+        pending: List[int] = []
+        res: List[Optional[GoalAnswer]] = []
+        for position in positions:
+            pending.append(
+                self.lsp_endpoint.send_method(
+                    "proof/goals", textDocument=textDocument, position=position
+                )
+            )
+            if len(pending) >= concurrency:
+                res.append(GoalAnswer.parse(self.lsp_endpoint.wait_result(pending[0])))
+                pending.pop(0)
+        for rpc_id in pending:
+            res.append(GoalAnswer.parse(self.lsp_endpoint.wait_result(rpc_id)))
+        return res
+
     def get_document(
         self, textDocument: TextDocumentIdentifier
     ) -> Optional[FlecheDocument]:
@@ -1,9 +1,90 @@
+import sys
 from enum import Enum
-from typing import Any, Optional, Tuple, List, Dict
+from typing import Any, Callable, Optional, Tuple, List, Dict
 
 from coqpyt.lsp.structs import Range, VersionedTextDocumentIdentifier, Position
 
 
+def _intern(text: Any) -> Any:
+    # Consecutive goals repeat most hypotheses and types verbatim, so the
+    # strings are interned to be shared between the goals of each step
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+class _Lazy(object):
+    """Attribute parsed from the raw JSON of an object on first access.
+
+    Objects with lazy attributes are created with _from_raw. The parsed value
+    is stored in the object, so it hides the descriptor in later accesses.
+    Objects created with their constructor set every attribute and never
+    use the descriptor.
+    """
+
+    def __init__(
+        self,
+        parse: Callable[[Any], Any] = lambda value: value,
+        default: Callable[[], Any] = lambda: None,
+    ):
+        self.parse = parse
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        # The raw value is dropped once parsed
+        raw = obj.__dict__["_raw"]
+        value = self.parse(raw.pop(self.name)) if self.name in raw else self.default()
+        obj.__dict__[self.name] = value
+        return value
+
+
+class _LazyObject(object):
+    """Base of the objects with lazy attributes (see _Lazy)."""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: The attributes of the object, used to serialize it.
+                The lazy attributes are parsed, and the raw JSON is left out.
+        """
+        for cls in type(self).__mro__:
+            for name, attr in vars(cls).items():
+                if isinstance(attr, _Lazy):
+                    getattr(self, name)
+        return {name: v for name, v in self.__dict__.items() if name != "_raw"}
+
+
+def _from_raw(cls: type, raw: Dict) -> Any:
+    obj = cls.__new__(cls)
+    obj._raw = dict(raw)
+    return obj
+
+
+def _parse_hyp(hyp: Dict) -> "Hyp":
+    definition = hyp.get("def", hyp.get("definition"))
+    return Hyp(
+        [_intern(name) for name in hyp["names"]],
+        _intern(hyp["ty"]),
+        definition=_intern(definition),
+    )
+
+
+def _parse_goals(goals: List[Dict]) -> List[Optional["Goal"]]:
+    return [Goal.parse(goal) for goal in goals]
+
+
+def _parse_message(message: Any) -> Any:
+    if isinstance(message, str):
+        return message
+    message = dict(message)
+    if message["range"]:
+        message["range"] = Range(**message["range"])
+    return Message(**message)
+
+
 class Hyp(object):
     def __init__(self, names: List[str], ty: str, definition: Optional[str] = None):
         self.names = names
@@ -14,7 +95,10 @@ class Hyp(object):
         return ", ".join(self.names) + f": {self.ty}"
 
 
-class Goal(object):
+class Goal(_LazyObject):
+    hyps = _Lazy(lambda hyps: [_parse_hyp(hyp) for hyp in hyps], list)
+    ty = _Lazy(_intern)
+
     def __init__(self, hyps: List[Hyp], ty: str):
         self.hyps = hyps
         self.ty = ty
@@ -23,13 +107,7 @@ class Goal(object):
     def parse(goal: Dict) -> Optional["Goal"]:
         if "hyps" not in goal:
             return None
-        for hyp in goal["hyps"]:
-            if "def" in hyp:
-                hyp["definition"] = hyp["def"]
-                hyp.pop("def")
-        hyps = [Hyp(**hyp) for hyp in goal["hyps"]]
-        ty = None if "ty" not in goal else goal["ty"]
-        return Goal(hyps, ty)
+        return _from_raw(Goal, goal)
 
     def __repr__(self) -> str:
         hyps = list(map(lambda hyp: repr(hyp), self.hyps))
@@ -39,7 +117,15 @@ class Goal(object):
             return self.ty
 
 
-class GoalConfig(object):
+class GoalConfig(_LazyObject):
+    goals = _Lazy(_parse_goals, list)
+    stack = _Lazy(
+        lambda stack: [(_parse_goals(t[0]), _parse_goals(t[1])) for t in stack], list
+    )
+    shelf = _Lazy(_parse_goals, list)
+    given_up = _Lazy(_parse_goals, list)
+    bullet = _Lazy()
+
     def __init__(
         self,
         goals: List[Goal],
@@ -84,13 +170,8 @@ class GoalConfig(object):
 
     @staticmethod
     def parse(goal_config: Dict) -> Optional["GoalConfig"]:
-        parse_goals = lambda goals: [Goal.parse(goal) for goal in goals]
-        goals = parse_goals(goal_config["goals"])
-        stack = [(parse_goals(t[0]), parse_goals(t[1])) for t in goal_config["stack"]]
-        bullet = None if "bullet" not in goal_config else goal_config["bullet"]
-        shelf = parse_goals(goal_config["shelf"])
-        given_up = parse_goals(goal_config["given_up"])
-        return GoalConfig(goals, stack, shelf, given_up, bullet=bullet)
+        # The goals are parsed when they are accessed
+        return _from_raw(GoalConfig, goal_config)
 
 
 class Message(object):
@@ -100,7 +181,16 @@ class Message(object):
         self.range = range
 
 
-class GoalAnswer(object):
+class GoalAnswer(_LazyObject):
+    textDocument = _Lazy(
+        lambda textDocument: VersionedTextDocumentIdentifier(**textDocument)
+    )
+    position = _Lazy(lambda position: Position(position["line"], position["character"]))
+    messages = _Lazy(lambda messages: [_parse_message(m) for m in messages], list)
+    goals = _Lazy(GoalConfig.parse)
+    error = _Lazy()
+    program = _Lazy(default=list)
+
     def __init__(
         self,
         textDocument: VersionedTextDocumentIdentifier,
@@ -135,23 +225,8 @@ class GoalAnswer(object):
 
     @staticmethod
     def parse(goal_answer) -> Optional["GoalAnswer"]:
-        goal_answer["textDocument"] = VersionedTextDocumentIdentifier(
-            **goal_answer["textDocument"]
-        )
-        goal_answer["position"] = Position(
-            goal_answer["position"]["line"], goal_answer["position"]["character"]
-        )
-
-        if "goals" in goal_answer:
-            goal_answer["goals"] = GoalConfig.parse(goal_answer["goals"])
-
-        for i, message in enumerate(goal_answer["messages"]):
-            if not isinstance(message, str):
-                if message["range"]:
-                    message["range"] = Range(**message["range"])
-                goal_answer["messages"][i] = Message(**message)
-
-        return GoalAnswer(**goal_answer)
+        # The attributes are parsed when they are accessed
+        return _from_raw(GoalAnswer, goal_answer)
 
 
 class Result(object):
@@ -166,7 +241,10 @@ class Query(object):
         self.results = results
 
 
-class RangedSpan(object):
+class RangedSpan(_LazyObject):
+    range = _Lazy(lambda range: Range(**range))
+    span = _Lazy()
+
     def __init__(self, range: Range, span: Any):
         self.range = range
         self.span = span
@@ -178,7 +256,14 @@ class CompletionStatus(object):
         self.range = range
 
 
-class FlecheDocument(object):
+class FlecheDocument(_LazyObject):
+    spans = _Lazy(lambda spans: [_from_raw(RangedSpan, span) for span in spans])
+    completed = _Lazy(
+        lambda completed: CompletionStatus(
+            completed["status"], Range(**completed["range"])
+        )
+    )
+
     def __init__(self, spans: List[RangedSpan], completed: CompletionStatus):
         self.spans = spans
         self.completed = completed
@@ -187,17 +272,8 @@ class FlecheDocument(object):
     def parse(fleche_document: Dict) -> Optional["FlecheDocument"]:
         if "spans" not in fleche_document or "completed" not in fleche_document:
             return None
-        spans: List[RangedSpan] = []
-        for span in fleche_document["spans"]:
-            range = Range(**span["range"])
-            spans.append(
-                RangedSpan(range, None if "span" not in span else span["span"])
-            )
-        completion_status = CompletionStatus(
-            fleche_document["completed"]["status"],
-            Range(**fleche_document["completed"]["range"]),
-        )
-        return FlecheDocument(spans, completion_status)
+        # The spans are parsed when they are accessed
+        return _from_raw(FlecheDocument, fleche_document)
 
 
 class CoqFileProgressKind(Enum):
@@ -0,0 +1,405 @@
+import time
+import queue
+import threading
+import subprocess
+from typing import Any, Optional, List, Dict, Tuple
+
+from coqpyt.lsp.structs import (
+    Diagnostic,
+    DiagnosticSeverity,
+    Position,
+    ResponseError,
+    VersionedTextDocumentIdentifier,
+)
+from coqpyt.lsp.json_rpc_endpoint import JsonRpcEndpoint
+from coqpyt.lsp.endpoint import LspEndpoint
+from coqpyt.coq.lsp.structs import GoalAnswer, GoalConfig, Message
+from coqpyt.coq.structs import ProofTerm, CandidateResult
+from coqpyt.coq.proof_file import ProofFile
+
+
+class PetState(object):
+    """Handle of a proof state in a petanque server.
+
+    Attributes:
+        st (int): The handle of the state.
+        hash (Optional[int]): Hash of the state, if reported by the server.
+        proof_finished (bool): Whether the proof has no goals left.
+        feedback (List[Message]): Messages produced when the state was reached.
+    """
+
+    def __init__(
+        self,
+        st: int,
+        hash: Optional[int] = None,
+        proof_finished: bool = False,
+        feedback: Optional[List[Message]] = None,
+    ):
+        self.st = st
+        self.hash = hash
+        self.proof_finished = proof_finished
+        self.feedback = [] if feedback is None else feedback
+
+    def __repr__(self) -> str:
+        return f"PetState({self.st})"
+
+    @staticmethod
+    def parse(result: Any) -> "PetState":
+        # Older versions of petanque only return the handle
+        if isinstance(result, int):
+            return PetState(result)
+        feedback = [
+            Message(level, text if isinstance(text, str) else repr(text))
+            for level, text in result.get("feedback", [])
+        ]
+        return PetState(
+            result["st"],
+            hash=result.get("hash"),
+            proof_finished=result.get("proof_finished", False),
+            feedback=feedback,
+        )
+
+
+class PetanqueClient(object):
+    """Client of the petanque server (`pet`) shipped with coq-lsp, which runs
+    tactics directly on proof states instead of checking documents."""
+
+    def __init__(
+        self,
+        root_uri: Optional[str] = None,
+        timeout: int = 30,
+        pet: str = "pet",
+        pet_options: str = "",
+    ):
+        """Creates a PetanqueClient
+
+        Args:
+            root_uri (Optional[str], optional): URI to the workspace where the
+                theorems are loaded from. Defaults to None.
+            timeout (int, optional): Timeout used for the petanque requests.
+                Defaults to 30.
+            pet (str, optional): Path to the pet binary. Defaults to "pet".
+            pet_options (str, optional): Options passed to pet. Defaults to "".
+        """
+        self.__proc = subprocess.Popen(
+            f"{pet} {pet_options}".strip(),
+            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE,
+            shell=True,
+        )
+        json_rpc_endpoint = JsonRpcEndpoint(self.__proc.stdin, self.__proc.stdout)
+        self.lsp_endpoint = LspEndpoint(json_rpc_endpoint, timeout=timeout)
+        self.lsp_endpoint.start()
+        if root_uri is not None:
+            self.set_workspace(root_uri)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_workspace(self, root_uri: str, debug: bool = False):
+        """Sets the workspace used to find the libraries of the documents.
+
+        Args:
+            root_uri (str): URI to the workspace.
+            debug (bool, optional): Enables debug messages. Defaults to False.
+        """
+        self.lsp_endpoint.call_method(
+            "petanque/setWorkspace", debug=debug, root=root_uri
+        )
+
+    def start(self, uri: str, thm: str, pre_commands: Optional[str] = None) -> PetState:
+        """Starts the proof of a theorem of a document.
+
+        Args:
+            uri (str): URI of the document, which is read from disk.
+            thm (str): Name of the theorem.
+            pre_commands (Optional[str], optional): Commands run before the
+                proof is started. Defaults to None.
+
+        Returns:
+            PetState: The state at the start of the proof.
+        """
+        params: Dict[str, Any] = {"uri": uri, "thm": thm}
+        if pre_commands is not None:
+            params["pre_commands"] = pre_commands
+        return PetState.parse(self.lsp_endpoint.call_method("petanque/start", **params))
+
+    def state_at_pos(self, uri: str, position: Position) -> PetState:
+        """Gets the state of a document at a position, e.g., to start proofs
+        without a name such as the ones of Goal commands.
+
+        Args:
+            uri (str): URI of the document, which is read from disk.
+            position (Position): The position in the document.
+
+        Returns:
+            PetState: The state after the command that ends at the position.
+        """
+        return PetState.parse(
+            self.lsp_endpoint.call_method(
+                "petanque/get_state_at_pos", uri=uri, position=position
+            )
+        )
+
+    def run(self, state: PetState, tactic: str) -> PetState:
+        """Runs a tactic on a proof state. The state is not changed.
+
+        Args:
+            state (PetState): The proof state.
+            tactic (str): The tactic, e.g. "intros.".
+
+        Raises:
+            ResponseError: If the tactic fails.
+
+        Returns:
+            PetState: The state after the tactic.
+        """
+        return PetState.parse(
+            self.lsp_endpoint.call_method("petanque/run", st=state.st, tac=tactic)
+        )
+
+    def goals(self, state: PetState) -> Optional[GoalConfig]:
+        """
+        Args:
+            state (PetState): The proof state.
+
+        Returns:
+            Optional[GoalConfig]: The goals of the state, or None if the state
+                is not in proof mode.
+        """
+        result = self.lsp_endpoint.call_method("petanque/goals", st=state.st)
+        return None if result is None else GoalConfig.parse(result)
+
+    def close(self):
+        """Stops the petanque server."""
+        self.lsp_endpoint.stop()
+        # The server exits when its input is closed
+        self.__proc.stdin.close()
+        try:
+            self.__proc.wait(timeout=self.lsp_endpoint.timeout)
+        except subprocess.TimeoutExpired:
+            self.__proc.kill()
+            self.__proc.wait()
+
+
+class PetanqueEngine(object):
+    """Checks steps of the proofs of a ProofFile with petanque.
+
+    The engine has the same search interface as the ProofFile (try_step and
+    evaluate_candidates), so it can be used by a ProofTree instead of the
+    ProofFile. States are run from the state at the end of the proof, which
+    is computed once per version of the file, so each candidate costs a
+    single tactic run instead of a document check.
+
+    Attributes:
+        proof_file (ProofFile): The file whose proofs are checked.
+        client (PetanqueClient): The client of the petanque server.
+    """
+
+    def __init__(
+        self,
+        proof_file: ProofFile,
+        pet: str = "pet",
+        timeout: Optional[int] = None,
+        client: Optional[PetanqueClient] = None,
+    ):
+        """
+        Args:
+            proof_file (ProofFile): The file whose proofs are checked.
+            pet (str, optional): Path to the pet binary. Defaults to "pet".
+            timeout (Optional[int], optional): Timeout used for the petanque
+                requests. Defaults to the timeout of the ProofFile.
+            client (Optional[PetanqueClient], optional): Client to use instead
+                of starting a new petanque server. Defaults to None.
+        """
+        self.proof_file = proof_file
+        if client is None:
+            workspace = proof_file.workspace
+            root = workspace if workspace is not None else proof_file.path
+            timeout = proof_file.timeout if timeout is None else timeout
+            client = PetanqueClient(f"file://{root}", timeout=timeout, pet=pet)
+        self.client = client
+        self.__states: Dict[Tuple[int, str, Tuple[str, ...]], PetState] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __proof_steps(self, proof: ProofTerm) -> List[str]:
+        steps = [step.text.strip() for step in proof.steps]
+        # Steps are run before the step that closes the proof, as in try_step
+        if len(proof.steps) > 0 and self.proof_file.context.is_end_proof(
+            proof.steps[-1].step
+        ):
+            steps.pop()
+        return steps
+
+    def state(
+        self, proof: ProofTerm, previous_steps: Optional[List[str]] = None
+    ) -> PetState:
+        """
+        Args:
+            proof (ProofTerm): A proof of the file.
+            previous_steps (Optional[List[str]], optional): Steps run after the
+                end of the proof. Defaults to None.
+
+        Returns:
+            PetState: The state after the steps of the proof and the previous
+                steps. The states are cached for each version of the file.
+        """
+        names = self.proof_file.context.names(proof.step)
+        end = proof.step.ast.range.end
+        # Proofs without a name (e.g., Goal) are started from their position
+        name = names[0] if len(names) > 0 else f"{end.line}:{end.character}"
+        steps = self.__proof_steps(proof)
+        steps += [step.strip() for step in previous_steps or []]
+        version = self.proof_file.version
+        if any(key[0] != version for key in self.__states):
+            # The handles of older versions of the file are not reused
+            self.__states = {
+                key: st for key, st in self.__states.items() if key[0] == version
+            }
+
+        # Resume from the longest prefix of the steps already run
+        last = len(steps)
+        while last > 0 and (version, name, tuple(steps[:last])) not in self.__states:
+            last -= 1
+        key = (version, name, tuple(steps[:last]))
+        if key not in self.__states:
+            uri = f"file://{self.proof_file.path}"
+            if len(names) > 0:
+                self.__states[key] = self.client.start(uri, name)
+            else:
+                self.__states[key] = self.client.state_at_pos(uri, end)
+        state = self.__states[key]
+        for i in range(last, len(steps)):
+            state = self.client.run(state, steps[i])
+            self.__states[(version, name, tuple(steps[: i + 1]))] = state
+        return state
+
+    def goals(self, proof: ProofTerm, state: PetState) -> GoalAnswer:
+        """
+        Args:
+            proof (ProofTerm): The proof of the state.
+            state (PetState): The proof state.
+
+        Returns:
+            GoalAnswer: The goals of the state. The position of the answer is
+                the end of the statement of the theorem.
+        """
+        uri = f"file://{self.proof_file.path}"
+        return GoalAnswer(
+            VersionedTextDocumentIdentifier(uri, self.proof_file.version),
+            proof.ast.range.end,
+            state.feedback,
+            goals=self.client.goals(state),
+        )
+
+    def try_step(
+        self,
+        proof: ProofTerm,
+        step_text: str,
+        previous_steps: Optional[List[str]] = None,
+    ) -> CandidateResult:
+        """Runs a step at the end of a proof. See ProofFile.try_step.
+
+        Args:
+            proof (ProofTerm): The proof to which the step would be added.
+            step_text (str): The text of the step.
+            previous_steps (Optional[List[str]], optional): Steps run between
+                the end of the proof and the step. Defaults to None.
+
+        Returns:
+            CandidateResult: The goals after the step and the errors of the
+                step. Errors have no range in the file. If the steps of the
+                proof or the previous steps fail, the result has no goals.
+        """
+        start = time.perf_counter()
+        state, diagnostics = None, []
+        try:
+            state = self.state(proof, previous_steps)
+            # An empty step keeps the state, as when added to the file
+            if step_text.strip() != "":
+                state = self.client.run(state, step_text.strip())
+        except ResponseError as e:
+            empty_range = {
+                "start": {"line": 0, "character": 0},
+                "end": {"line": 0, "character": 0},
+            }
+            diagnostics = [
+                Diagnostic(empty_range, e.message, severity=DiagnosticSeverity.Error)
+            ]
+        goals = None if state is None else self.goals(proof, state)
+        return CandidateResult(
+            step_text, goals, diagnostics, time.perf_counter() - start
+        )
+
+    def evaluate_candidates(
+        self,
+        proof: ProofTerm,
+        step_texts: List[str],
+        workers: int = 1,
+        previous_steps: Optional[List[str]] = None,
+    ) -> List[CandidateResult]:
+        """Runs several steps at the end of a proof. See
+        ProofFile.evaluate_candidates.
+
+        Args:
+            proof (ProofTerm): The proof to which the steps would be added.
+            step_texts (List[str]): The text of each candidate step.
+            workers (int, optional): Maximum number of candidates whose
+                requests are sent to the petanque server at the same time.
+                Every candidate is run from the same state handle, so a single
+                server is used. Defaults to 1.
+            previous_steps (Optional[List[str]], optional): Steps run between
+                the end of the proof and the candidates. Defaults to None.
+
+        Returns:
+            List[CandidateResult]: The result of each candidate.
+        """
+        workers = max(1, min(workers, len(step_texts)))
+        if workers == 1:
+            return [
+                self.try_step(proof, text, previous_steps=previous_steps)
+                for text in step_texts
+            ]
+
+        # The first candidate computes the state shared by the others
+        results: List[Optional[CandidateResult]] = [None] * len(step_texts)
+        results[0] = self.try_step(proof, step_texts[0], previous_steps=previous_steps)
+        pending: queue.Queue = queue.Queue()
+        for i in range(1, len(step_texts)):
+            pending.put(i)
+        failures: List[Exception] = []
+
+        def evaluate():
+            while len(failures) == 0:
+                try:
+                    i = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[i] = self.try_step(
+                        proof, step_texts[i], previous_steps=previous_steps
+                    )
+                except Exception as e:
+                    failures.append(e)
+                    return
+
+        threads = [threading.Thread(target=evaluate) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(failures) > 0:
+            raise failures[0]
+        return results
+
+    def close(self):
+        self.__states.clear()
+        self.client.close()
@@ -4,29 +4,55 @@ import logging
 import tempfile
 import shutil
 import pickle
+import time
 import uuid
+import queue
+import threading
 from functools import lru_cache
-from typing import Optional, Tuple, Union, List, Dict
+from typing import Optional, Tuple, Union, List, Dict, TYPE_CHECKING
 
 from coqpyt.lsp.structs import (
     TextDocumentItem,
     TextDocumentIdentifier,
     VersionedTextDocumentIdentifier,
     TextDocumentContentChangeEvent,
+    Diagnostic,
     ResponseError,
     ErrorCodes,
 )
 from coqpyt.coq.lsp.structs import Result, Query, Range, GoalAnswer, Position
 from coqpyt.coq.lsp.client import CoqLspClient
-from coqpyt.coq.structs import TermType, Step, Term, ProofStep, ProofTerm
+from coqpyt.coq.structs import (
+    TermType,
+    Step,
+    Term,
+    ProofStep,
+    ProofTerm,
+    CandidateResult,
+)
 from coqpyt.coq.exceptions import *
 from coqpyt.coq.changes import *
 from coqpyt.coq.context import FileContext
 from coqpyt.coq.base_file import CoqFile
+from coqpyt.coq.bundle import ContextBundle
+from coqpyt.coq.goals import (
+    GoalCache,
+    GoalDiff,
+    TacticCache,
+    TacticKey,
+    diff_goal_configs,
+    goal_state_hash,
+)
+
+if TYPE_CHECKING:
+    from coqpyt.coq.daemon import LibraryContextClient
 
 
 class _AuxFile(object):
     CACHE_NAME = "coqpyt_cache"
+    # Content digests of library files, memoized by the stat signature
+    # (size, mtime, inode) of the file when the digest was computed
+    __library_digests: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
 
     def __init__(
         self,
@@ -34,6 +60,7 @@ class _AuxFile(object):
         copy: bool = False,
         workspace: Optional[str] = None,
         timeout: int = 30,
+        coq_lsp: str = "coq-lsp",
     ):
         self.__copy = copy
         self.__init_path(file_path)
@@ -41,7 +68,7 @@ class _AuxFile(object):
             uri = f"file://{workspace}"
         else:
             uri = f"file://{self.path}"
-        self.coq_lsp_client = CoqLspClient(uri, timeout=timeout)
+        self.coq_lsp_client = CoqLspClient(uri, timeout=timeout, coq_lsp=coq_lsp)
 
     def __enter__(self):
         return self
@@ -168,10 +195,17 @@ class _AuxFile(object):
         library_hash: str,
         timeout: int,
         workspace: Optional[str] = None,
+        coq_lsp: str = "coq-lsp",
+        coqtop: str = "coqtop",
     ):
         # NOTE: the library_hash attribute is only used for the LRU cache
         coq_file = CoqFile(
-            library_file, workspace=workspace, library=library_name, timeout=timeout
+            library_file,
+            workspace=workspace,
+            library=library_name,
+            timeout=timeout,
+            coq_lsp=coq_lsp,
+            coqtop=coqtop,
         )
         coq_file.run()
         context = coq_file.context
@@ -215,6 +249,29 @@ class _AuxFile(object):
         with open(library_cache_loc, "wb") as f:
             pickle.dump(terms, f)
 
+    @staticmethod
+    def __library_digest(library_file: str) -> str:
+        stat = os.stat(library_file)
+        signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        cached = _AuxFile.__library_digests.get(library_file)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(library_file, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        _AuxFile.__library_digests[library_file] = (signature, digest)
+        return digest
+
+    @staticmethod
+    def get_library_hash(
+        library_name: str, library_file: str, workspace: Optional[str] = None
+    ) -> str:
+        # NOTE: The contents of the library are only read again if the stat
+        # signature of the file changed since the last time it was hashed.
+        digest = _AuxFile.__library_digest(library_file)
+        key = "\0".join([library_name, library_file, str(workspace), digest])
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
     @classmethod
     def get_library(
         cls,
@@ -223,16 +280,22 @@ class _AuxFile(object):
         timeout: int,
         workspace: Optional[str] = None,
         use_disk_cache: bool = False,
+        coq_lsp: str = "coq-lsp",
+        coqtop: str = "coqtop",
     ) -> Dict[str, Term]:
-        with open(library_file, "r") as f:
-            contents_to_hash = library_name + library_file + str(workspace) + f.read()
-            library_hash = hashlib.md5(contents_to_hash.encode("utf-8")).hexdigest()
+        library_hash = cls.get_library_hash(library_name, library_file, workspace)
         if use_disk_cache:
             cached_library = cls.get_from_disk_cache(library_hash)
             if cached_library is not None:
                 return cached_library
         aux_context = _AuxFile.__load_library(
-            library_name, library_file, library_hash, timeout, workspace=workspace
+            library_name,
+            library_file,
+            library_hash,
+            timeout,
+            workspace=workspace,
+            coq_lsp=coq_lsp,
+            coqtop=coqtop,
         )
         # FIXME: we ignore the usage of "Local" from imported files to
         # simplify the implementation. However, they can be used:
@@ -240,7 +303,7 @@ class _AuxFile(object):
         # NOTE: We handle "Local" separately from section-local keywords
         # due to the aforementioned reason. The handling should be different
         # for both types of keywords.
-        terms = aux_context.terms
+        terms = dict(aux_context.terms)
         for term in aux_context.terms.keys():
             if terms[term].text.startswith("Local"):
                 terms.pop(term)
@@ -258,38 +321,155 @@ class _AuxFile(object):
         aux_file.truncate("\nPrint Libraries.")
         return list(map(lambda line: line.strip(), libraries.split("\n")[1:-1]))
 
+    @staticmethod
+    def locate_libraries(aux_file: "_AuxFile", libraries: List[str]) -> List[str]:
+        last_line = len(aux_file.read().split("\n")) - 1
+        for library in libraries:
+            aux_file.append(f"\nLocate Library {library}.")
+
+        # The didChange is expensive so we only do it if needed
+        if len(libraries) > 0:
+            aux_file.didChange()
+
+        library_files = []
+        for i, library in enumerate(libraries):
+            library_file = aux_file.get_diagnostics(
+                "Locate Library", library, last_line + i + 1
+            ).split()[-1][:-1]
+            library_files.append(library_file)
+        return library_files
+
     @staticmethod
     def get_coq_context(
-        timeout: int, workspace: Optional[str] = None, use_disk_cache: bool = False
+        timeout: int,
+        workspace: Optional[str] = None,
+        use_disk_cache: bool = False,
+        library_daemon: Optional["LibraryContextClient"] = None,
+        bundle: Optional[ContextBundle] = None,
+        coq_lsp: str = "coq-lsp",
+        coqtop: str = "coqtop",
+        coq_version: Optional[str] = None,
     ) -> FileContext:
         temp_path = os.path.join(
             tempfile.gettempdir(), "aux_" + str(uuid.uuid4()).replace("-", "") + ".v"
         )
 
-        with _AuxFile(file_path=temp_path, timeout=timeout) as aux_file:
+        if bundle is not None and len(bundle.prelude) > 0:
+            context = FileContext(temp_path, coqtop=coqtop, coq_version=coq_version)
+            for library in bundle.prelude:
+                terms = bundle.get_library(library)
+                # The file of the library changed since the bundle was built
+                if terms is None:
+                    terms = _AuxFile.get_library(
+                        library,
+                        bundle.libraries[library][0],
+                        timeout,
+                        workspace=workspace,
+                        use_disk_cache=use_disk_cache,
+                        coq_lsp=coq_lsp,
+                        coqtop=coqtop,
+                    )
+                context.add_library(library, terms)
+            return context
+
+        if library_daemon is not None:
+            context = FileContext(temp_path, coqtop=coqtop, coq_version=coq_version)
+            # The terms of the libraries stay in the daemon, which is asked for
+            # the names that are not defined in the file
+            resolver = library_daemon.resolver(timeout, workspace=workspace)
+            libraries = library_daemon.get_libraries(timeout, workspace=workspace)
+            for library, library_file in libraries:
+                context.add_remote_library(library, library_file, resolver)
+            return context
+
+        with _AuxFile(
+            file_path=temp_path, timeout=timeout, coq_lsp=coq_lsp
+        ) as aux_file:
             aux_file.didOpen()
             libraries = _AuxFile.get_libraries(aux_file)
-            for library in libraries:
-                aux_file.append(f"\nLocate Library {library}.")
-            aux_file.didChange()
+            library_files = _AuxFile.locate_libraries(aux_file, libraries)
 
-            context = FileContext(temp_path)
-            for i, library in enumerate(libraries):
-                v_file = aux_file.get_diagnostics(
-                    "Locate Library", library, i + 1
-                ).split()[-1][:-1]
+            context = FileContext(
+                temp_path,
+                coqtop=coqtop,
+                coq_version=aux_file.coq_lsp_client.coq_version,
+            )
+            for library, v_file in zip(libraries, library_files):
                 terms = _AuxFile.get_library(
                     library,
                     v_file,
                     timeout,
                     workspace=workspace,
                     use_disk_cache=use_disk_cache,
+                    coq_lsp=coq_lsp,
+                    coqtop=coqtop,
                 )
                 context.add_library(library, terms)
 
         return context
 
 
+class _ScratchDocument(object):
+    """Document opened in a coq-lsp server only to check candidate steps.
+
+    The document is never written to disk. Each candidate is sent as a new
+    version of the document, whose text is a prefix of the Coq file followed
+    by the candidate, so coq-lsp reuses the states of the unchanged prefix.
+    """
+
+    def __init__(self, coq_lsp_client: CoqLspClient, file_path: str):
+        self.coq_lsp_client = coq_lsp_client
+        path = os.path.join(
+            os.path.dirname(file_path),
+            "coqpyt_scratch_" + str(uuid.uuid4()).replace("-", "") + ".v",
+        )
+        self.uri = f"file://{path}"
+        self.version = 0
+
+    @staticmethod
+    def __end(text: str) -> Position:
+        lines = text.split("\n")
+        return Position(len(lines) - 1, len(lines[-1]))
+
+    def evaluate(self, prefix: str, text: str) -> CandidateResult:
+        """Checks a candidate step after a prefix of the file.
+
+        Args:
+            prefix (str): Text of the file before the candidate.
+            text (str): Text of the candidate.
+
+        Returns:
+            CandidateResult: The goals after the candidate and its diagnostics.
+        """
+        start, document = _ScratchDocument.__end(prefix), prefix + text
+        begin = time.perf_counter()
+        self.version += 1
+        if self.version == 1:
+            self.coq_lsp_client.didOpen(
+                TextDocumentItem(self.uri, "coq", self.version, document)
+            )
+        else:
+            self.coq_lsp_client.didChange(
+                VersionedTextDocumentIdentifier(self.uri, self.version),
+                [TextDocumentContentChangeEvent(None, None, document)],
+            )
+        goals = self.coq_lsp_client.proof_goals(
+            TextDocumentIdentifier(self.uri), _ScratchDocument.__end(document)
+        )
+        seconds = time.perf_counter() - begin
+
+        # The diagnostics of the prefix are not related to the candidate
+        diagnostics = self.coq_lsp_client.lsp_endpoint.diagnostics.get(self.uri, [])
+        diagnostics = [d for d in diagnostics if d.range.end > start]
+        return CandidateResult(text, goals, diagnostics, seconds)
+
+    def close(self):
+        if self.version > 0:
+            self.coq_lsp_client.didClose(TextDocumentIdentifier(self.uri))
+            self.coq_lsp_client.lsp_endpoint.diagnostics.pop(self.uri, None)
+            self.version = 0
+
+
 class ProofFile(CoqFile):
     """Allows to get information about the proofs of a Coq file.
     ProofState will run the file from its current state, i.e., if the file
@@ -297,6 +477,18 @@ class ProofFile(CoqFile):
     will be fully checked after the creation of a ProofState.
     """
 
+    # Commands that may leave proof mode without closing the open proof
+    __PROOF_EXITS = [
+        "VernacAbortAll",
+        "VernacRestart",
+        "VernacUndo",
+        "VernacUndoTo",
+        "VernacBack",
+        "VernacBackTo",
+        "VernacResetName",
+        "VernacResetInitial",
+    ]
+
     def __init__(
         self,
         file_path: str,
@@ -307,6 +499,11 @@ class ProofFile(CoqFile):
         coqtop: str = "coqtop",
         error_mode: str = "strict",
         use_disk_cache: bool = False,
+        library_daemon: Optional["LibraryContextClient"] = None,
+        context_bundle: Optional[str] = None,
+        goal_cache_size: Optional[int] = 1024,
+        goal_memory_budget: Optional[int] = None,
+        tactic_cache: Optional[TacticCache] = None,
     ):
         """Creates a ProofFile.
 
@@ -320,7 +517,8 @@ class ProofFile(CoqFile):
             coq_lsp (str, optional): Path to the coq-lsp binary. Defaults to "coq-lsp".
             coqtop (str, optional): Path to the coqtop binary used to compile the Coq libraries
                 imported by coq-lsp. This is NOT passed as a parameter to coq-lsp, it is
-                simply used to check the Coq version in use. Defaults to "coqtop".
+                simply used to check the Coq version in use when coq-lsp does not report it.
+                Defaults to "coqtop".
             error_mode (str, optional): How errors are handled. Can be "strict" or "warning".
                 If "strict", an exception will be raised when an unexpected behavior occurs.
                 If "warning", a warning will be logged instead (it only applies to recoverable errors).
@@ -330,22 +528,74 @@ class ProofFile(CoqFile):
                 loaded from the cache if their corresponing library (file) has the same text.
                 Note that caching only depends on the text of the file, so if the Coq version changes,
                 or the version of coqpyt changes, the cache should be deleted.
+            library_daemon (Optional[LibraryContextClient], optional): Client of a library
+                context daemon (see coqpyt.coq.daemon). If defined, the terms of the loaded
+                libraries are kept by the daemon, which keeps them loaded across processes,
+                and the names which are not defined in the file are looked up in the
+                daemon. The terms of these libraries are then not part of the terms of
+                the context. Defaults to None.
+            context_bundle (Optional[str], optional): Path to a bundle of library contexts
+                built with ``coqpyt build-context``. The terms of the libraries in the
+                bundle are loaded from it instead of coq-lsp. If None, the bundle built
+                for the workspace and coq-lsp binary in the default path is used, if it
+                exists. Defaults to None.
+            goal_cache_size (Optional[int], optional): Maximum number of goals kept in
+                memory. The goals are cached for each version of the file and the goals
+                before an edit are kept after it. If None, the cache has no limit.
+                Defaults to 1024.
+            goal_memory_budget (Optional[int], optional): Maximum size in bytes of the
+                goals kept in memory. If defined, the least recently used goals over the
+                budget are compressed and written to a temporary file, from which they
+                are loaded when accessed again. Defaults to None.
+            tactic_cache (Optional[TacticCache], optional): Cache of the outcomes of
+                tactics on proof states, which may be shared with other ProofFiles.
+                If defined, try_step and evaluate_candidates return the outcome of
+                a step seen before on the same goals without checking it, and
+                add_step fails without changing the file if the step is known to
+                fail. Defaults to None.
         """
         if not os.path.isabs(file_path):
             file_path = os.path.abspath(file_path)
         super().__init__(file_path, library, timeout, workspace, coq_lsp, coqtop)
-        self.__aux_file = _AuxFile(file_path, timeout=self.timeout, workspace=workspace)
+        self.__aux_file = _AuxFile(
+            file_path, timeout=self.timeout, workspace=workspace, coq_lsp=coq_lsp
+        )
+        self.__coq_lsp = coq_lsp
+        self.__coqtop = coqtop
         self.__error_mode = error_mode
         self.__use_disk_cache = use_disk_cache
+        self.__library_daemon = library_daemon
+        self.__library_resolver = None
+        if library_daemon is not None:
+            self.__library_resolver = library_daemon.resolver(
+                self.timeout, workspace=self.workspace
+            )
+        self.__goal_cache = GoalCache(goal_cache_size, goal_memory_budget)
+        self.__tactic_cache = tactic_cache
+        self.__scratch: Optional[_ScratchDocument] = None
+        # Scratch documents of the extra coq-lsp servers used by evaluate_candidates
+        self.__candidate_pool: List[_ScratchDocument] = []
+        self.__prefixes: Dict[Tuple[int, int, int], str] = {}
         self.__aux_file.didOpen()
 
         try:
+            if context_bundle is not None:
+                self.__bundle = ContextBundle.load(context_bundle)
+            else:
+                self.__bundle = ContextBundle.discover(
+                    _AuxFile.get_coqpyt_disk_cache_loc(), workspace, coq_lsp
+                )
             # We need to update the context already defined in the CoqFile
             self.context.update(
                 _AuxFile.get_coq_context(
                     self.timeout,
                     workspace=self.workspace,
                     use_disk_cache=self.__use_disk_cache,
+                    library_daemon=self.__library_daemon,
+                    bundle=self.__bundle,
+                    coq_lsp=self.__coq_lsp,
+                    coqtop=self.__coqtop,
+                    coq_version=self.coq_lsp_client.coq_version,
                 )
             )
         except Exception as e:
@@ -355,8 +605,6 @@ class ProofFile(CoqFile):
         self.__program_context: Dict[str, Tuple[Term, List[Term]]] = {}
         self.__proofs: List[ProofTerm] = []
         self.__open_proofs: List[ProofTerm] = []
-        self.__last_end_pos: Optional[Position] = None
-        self.__current_goals = None
 
     def __enter__(self):
         return self
@@ -377,48 +625,36 @@ class ProofFile(CoqFile):
         return list(map(trim, located.split("\n")))
 
     def __step_context(self, step: Step) -> List[Term]:
-        stack, res = self.context.expr(step)[:0:-1], []
-        while len(stack) > 0:
-            el = stack.pop()
-            if FileContext.is_id(el):
-                term = self.context.get_term(FileContext.get_id(el))
-                if term is not None and term not in res:
-                    res.append(term)
-            elif FileContext.is_notation(el):
-                stack.append(el[1:])
-
-                notation_name = el[2][1]
+        # Terms are deduplicated with a dict, which keeps the order they are found
+        res: Dict[Term, None] = {}
+        for kind, name in self.context.references(step):
+            if kind == "id":
+                term = self.context.get_term(name)
+                if term is not None:
+                    res.setdefault(term)
+            else:
                 line = len(self.__aux_file.read().split("\n"))
-                self.__aux_file.append(f'\nLocate "{notation_name}".')
+                self.__aux_file.append(f'\nLocate "{name}".')
                 self.__aux_file.didChange()
-                notations = self.__locate(notation_name, line)
+                notations = self.__locate(name, line)
                 if len(notations) == 1 and notations[0] == "Unknown notation":
                     continue
 
                 for notation in notations:
                     scope = FileContext.get_notation_scope(notation)
                     try:
-                        term = self.context.get_notation(notation_name, scope)
-                        if term not in res:
-                            res.append(term)
+                        term = self.context.get_notation(name, scope)
+                        res.setdefault(term)
                         break
                     except NotationNotFoundException:
                         continue
                 else:
-                    e = NotationNotFoundException(notation_name)
+                    e = NotationNotFoundException(name)
                     if self.__error_mode == "strict":
                         raise e
                     else:
                         logging.warning(str(e))
-            elif isinstance(el, list):
-                for v in reversed(el):
-                    if isinstance(v, (dict, list)):
-                        stack.append(v)
-            elif isinstance(el, dict):
-                for v in reversed(el.values()):
-                    if isinstance(v, (dict, list)):
-                        stack.append(v)
-        return res
+        return list(res)
 
     def __get_program_context(self) -> Tuple[Term, List[Term]]:
         expr = self.context.expr(self.prev_step)
@@ -474,17 +710,15 @@ class ProofFile(CoqFile):
             del self.__program_context[last_added]
 
     def __has_obligations(self, step: Step):
-        for attr in self.context.attrs(step):
-            # Program commands must have this attribute
-            if attr["v"][0] == "program":
-                # FIXME: We assume that Program commands are not defined in proofs
-                # Program Definition introduces obligations, while Program Lemma
-                # enters proof mode directly, so this is how we differentiate both
-                # kinds of Program commands
-                goals = self.__goals(step.ast.range.end)
-                return not self.__in_proof(goals)
-        else:
-            return False
+        # Program commands must have the program attribute
+        if self.context.step_info(step).is_program:
+            # FIXME: We assume that Program commands are not defined in proofs
+            # Program Definition introduces obligations, while Program Lemma
+            # enters proof mode directly, so this is how we differentiate both
+            # kinds of Program commands
+            goals = self.__goals(step.ast.range.end)
+            return not self.__in_proof(goals)
+        return False
 
     def __handle_end_proof(
         self,
@@ -553,9 +787,38 @@ class ProofFile(CoqFile):
         elif self.__has_obligations(step):
             self.__handle_obligations(step, undo=undo)
         # Check if proof step
-        elif len(self.open_proofs) > 0 if undo else self.in_proof:
+        elif len(self.open_proofs) > 0 if undo else self.__in_proof_after(step):
             self.__check_proof_step(step, undo=undo)
 
+    def __in_proof_after(self, step: Step) -> bool:
+        # NOTE: Whether the file is in proof mode after a step is derived from
+        # the AST and the open proofs, so that executing a step does not need
+        # its goals. The server is only asked when the step is ambiguous.
+        info = self.context.step_info(step)
+        expr = info.expr
+        if info.is_proof_term:
+            if (
+                expr[0] == "VernacStartTheoremProof"
+                or info.term_type == TermType.OBLIGATION
+            ):
+                return True
+            if expr[0] == "VernacDefinition":
+                # Definitions without a body enter proof mode, e.g. Goal T.
+                if any(
+                    isinstance(el, list) and len(el) > 0 and el[0] == "ProveBody"
+                    for el in expr[1:]
+                ):
+                    return True
+                elif len(self.__open_proofs) == 0:
+                    return False
+        elif len(self.__open_proofs) > 0:
+            if expr[0] not in ProofFile.__PROOF_EXITS:
+                return True
+        else:
+            # Outside proofs, only steps with new proof terms are handled
+            return False
+        return self.in_proof
+
     def __find_step(self, range: Range) -> Optional[Tuple[ProofTerm, int, int]]:
         for p, proof in enumerate(self.__proofs):
             if proof.ast.range == range:
@@ -592,33 +855,39 @@ class ProofFile(CoqFile):
         goals = self.__goals
         return ProofStep(self.steps[step_index], goals, context)
 
+    def __add_library(self, library: str, library_file: str):
+        if self.__bundle is not None:
+            terms = self.__bundle.get_library(library, library_file)
+            if terms is not None:
+                self.context.add_library(library, terms)
+                return
+        if self.__library_resolver is not None:
+            self.context.add_remote_library(
+                library, library_file, self.__library_resolver
+            )
+            return
+        terms = _AuxFile.get_library(
+            library,
+            library_file,
+            self.timeout,
+            workspace=self.workspace,
+            use_disk_cache=self.__use_disk_cache,
+            coq_lsp=self.__coq_lsp,
+            coqtop=self.__coqtop,
+        )
+        self.context.add_library(library, terms)
+
     def __update_libraries(self):
         libraries = _AuxFile.get_libraries(self.__aux_file)
+        loaded = list(self.context.libraries) + list(self.context.remote_libraries)
         # New libraries
-        new_libraries = [l for l in libraries if l not in self.context.libraries.keys()]
-        last_line = len(self.__aux_file.read().split("\n")) - 1
-        for library in new_libraries:
-            self.__aux_file.append(f"\nLocate Library {library}.")
-
-        # The didChange is expensive so we only do it if needed
-        if len(new_libraries) > 0:
-            self.__aux_file.didChange()
-
-        for i, library in enumerate(new_libraries):
-            library_file = self.__aux_file.get_diagnostics(
-                "Locate Library", library, last_line + i + 1
-            ).split()[-1][:-1]
-            library_terms = _AuxFile.get_library(
-                library,
-                library_file,
-                self.timeout,
-                workspace=self.workspace,
-                use_disk_cache=self.__use_disk_cache,
-            )
-            self.context.add_library(library, library_terms)
+        new_libraries = [l for l in libraries if l not in loaded]
+        library_files = _AuxFile.locate_libraries(self.__aux_file, new_libraries)
+        for library, library_file in zip(new_libraries, library_files):
+            self.__add_library(library, library_file)
 
         # Deleted libraries
-        for library in [l for l in self.context.libraries.keys() if l not in libraries]:
+        for library in [l for l in loaded if l not in libraries]:
             self.context.remove_library(library)
 
     def __find_open_proof_index(self, step: Step) -> int:
@@ -689,9 +958,6 @@ class ProofFile(CoqFile):
             for e in range(prev + 2, len(proof.steps)):
                 # The goals will be loaded if used (Lazy Loading)
                 proof.steps[e].goals = self.__goals
-            if prev + 1 < self.steps_taken:
-                # This will force current_goals to refresh if used
-                self.__last_end_pos = None
 
     def __delete_step(self, step: Step):
         # Ignore segment delimiters because it affects Program handling
@@ -718,9 +984,6 @@ class ProofFile(CoqFile):
                 for e in range(i, len(proof.steps)):
                     # The goals will be loaded if used (Lazy Loading)
                     proof.steps[e].goals = self.__goals
-                if i <= self.steps_taken:
-                    # This will force current_goals to refresh if used
-                    self.__last_end_pos = None
 
     def __get_changes_data(
         self, changes: List[CoqChange]
@@ -757,11 +1020,45 @@ class ProofFile(CoqFile):
 
     def __goals(self, end_pos: Position):
         uri = f"file://{self._path}"
+        key = GoalCache.key(uri, self.version, end_pos)
+        if key in self.__goal_cache:
+            return self.__goal_cache[key]
         try:
-            return self.coq_lsp_client.proof_goals(TextDocumentIdentifier(uri), end_pos)
+            goals = self.coq_lsp_client.proof_goals(
+                TextDocumentIdentifier(uri), end_pos
+            )
         except Exception as e:
             self._handle_exception(e)
             raise e
+        self.__goal_cache[key] = goals
+        return goals
+
+    def __edit_point(self, changes: List[CoqChange]) -> Position:
+        # Only the goals before the first step changed are kept. Each change
+        # refers to the steps after the previous changes, so we keep track of
+        # which original step precedes each change.
+        steps: List[Optional[Step]] = self.steps[:]
+        edit_point: Optional[Position] = None
+        for change in changes:
+            if isinstance(change, CoqAdd):
+                index = change.previous_step_index
+                steps.insert(index + 1, None)
+            elif isinstance(change, CoqDelete):
+                index = change.step_index - 1
+                steps.pop(change.step_index)
+            else:
+                continue
+            while index >= 0 and steps[index] is None:
+                index -= 1
+            position = Position(0, 0) if index < 0 else steps[index].ast.range.end
+            if edit_point is None or position < edit_point:
+                # The ranges of the steps are updated in place by the changes
+                edit_point = Position(position.line, position.character)
+        return Position(0, 0) if edit_point is None else edit_point
+
+    def __invalidate_goals(self, version: int, edit_point: Position):
+        uri = f"file://{self._path}"
+        self.__goal_cache.invalidate(uri, version, self.version, edit_point)
 
     def __in_proof(self, goals: Optional[GoalAnswer]):
         return goals is not None and goals.goals is not None
@@ -853,12 +1150,7 @@ class ProofFile(CoqFile):
             end_pos = self.prev_step.ast.range.end
         else:
             end_pos = self.curr_step.ast.range.start
-
-        if end_pos != self.__last_end_pos:
-            self.__current_goals = self.__goals(end_pos)
-            self.__last_end_pos = end_pos
-
-        return self.__current_goals
+        return self.__goals(end_pos)
 
     @property
     def in_proof(self) -> bool:
@@ -876,6 +1168,318 @@ class ProofFile(CoqFile):
         """
         return self.__can_close_proof(self.current_goals)
 
+    def prefetch_goals(
+        self, proofs: Optional[List[ProofTerm]] = None, concurrency: int = 8
+    ) -> Dict[str, float]:
+        """Loads the goals of all the steps of the given proofs into the goal
+        cache, so that the goals of the steps are read from memory. Goals which
+        are not cached are requested pipelined over the connection to coq-lsp
+        instead of being sent one at a time when each step is accessed.
+
+        Args:
+            proofs (Optional[List[ProofTerm]], optional): Proofs whose goals are
+                prefetched. Defaults to all the closed and open proofs.
+            concurrency (int, optional): Maximum number of goal requests waiting
+                for a response at the same time. Defaults to 8.
+
+        Returns:
+            Dict[str, float]: The number of requests sent, the time they took in
+                seconds and the resulting throughput in requests per second.
+        """
+        if proofs is None:
+            proofs = self.proofs + self.open_proofs
+        steps = [
+            step
+            for proof in proofs
+            for step in proof.steps
+            if callable(step._goals) and step._goals == self.__goals
+        ]
+
+        uri = f"file://{self._path}"
+        steps = [
+            step
+            for step in steps
+            if GoalCache.key(uri, self.version, step.ast.range.start)
+            not in self.__goal_cache
+        ]
+
+        start = time.perf_counter()
+        try:
+            goals = self.coq_lsp_client.proof_goals_batch(
+                TextDocumentIdentifier(uri),
+                [step.ast.range.start for step in steps],
+                concurrency=concurrency,
+            )
+        except Exception as e:
+            self._handle_exception(e)
+            raise e
+        seconds = time.perf_counter() - start
+
+        for step, step_goals in zip(steps, goals):
+            key = GoalCache.key(uri, self.version, step.ast.range.start)
+            self.__goal_cache[key] = step_goals
+        throughput = len(steps) / seconds if seconds > 0 else 0.0
+        logging.debug(
+            f"Prefetched {len(steps)} goals in {seconds:.3f}s "
+            f"({throughput:.1f} requests/s)"
+        )
+        return {
+            "requests": len(steps),
+            "seconds": seconds,
+            "requests_per_second": throughput,
+        }
+
+    @staticmethod
+    def __candidate_text(step_text: str) -> str:
+        return step_text if step_text[:1].isspace() else "\n" + step_text
+
+    def __candidate_anchor(self, proof: ProofTerm) -> Step:
+        # Candidates are checked after the last step of the proof, or before
+        # the step that closes it
+        anchor = proof.step if len(proof.steps) == 0 else proof.steps[-1].step
+        if len(proof.steps) > 0 and self.context.is_end_proof(anchor):
+            anchor = proof.step if len(proof.steps) == 1 else proof.steps[-2].step
+        return anchor
+
+    def __candidate_prefix(
+        self, proof: ProofTerm, previous_steps: Optional[List[str]] = None
+    ) -> str:
+        end = self.__candidate_anchor(proof).ast.range.end
+
+        key = (self.version, end.line, end.character)
+        if key not in self.__prefixes:
+            with open(self.path, "r") as f:
+                lines = f.read().split("\n")
+            prefix = "\n".join(lines[: end.line] + [lines[end.line][: end.character]])
+            # Prefixes of older versions of the file are no longer used
+            self.__prefixes = {key: prefix}
+        if previous_steps is None:
+            return self.__prefixes[key]
+        previous_steps = map(ProofFile.__candidate_text, previous_steps)
+        return self.__prefixes[key] + "".join(previous_steps)
+
+    def context_fingerprint(self, proof: ProofTerm) -> str:
+        """
+        Args:
+            proof (ProofTerm): A proof of the file.
+
+        Returns:
+            str: Digest of the Coq version, the workspace and the terms used by
+                the statement of the proof. Tactics run on the same goals with
+                the same fingerprint are assumed to have the same outcome.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        version = self.coq_lsp_client.coq_version
+        digest.update(f"{version}\0{self.workspace}\0".encode("utf-8"))
+        for term in proof.context:
+            digest.update(f"{term.text}\0".encode("utf-8"))
+        return digest.hexdigest()
+
+    def __candidate_keys(
+        self,
+        proof: ProofTerm,
+        step_texts: List[str],
+        previous_steps: Optional[List[str]] = None,
+    ) -> List[Optional[TacticKey]]:
+        if self.__tactic_cache is None:
+            return [None] * len(step_texts)
+        goals = self.__goals(self.__candidate_anchor(proof).ast.range.end)
+        if not self.__in_proof(goals):
+            return [None] * len(step_texts)
+
+        # The state after the previous steps is only known if their outcomes
+        # are cached
+        fingerprint = self.context_fingerprint(proof)
+        state = goal_state_hash(goals.goals)
+        for text in previous_steps or []:
+            outcome = self.__tactic_cache.get(TacticCache.key(state, text, fingerprint))
+            if outcome is None or outcome[0] is None:
+                return [None] * len(step_texts)
+            state = goal_state_hash(outcome[0])
+        return [TacticCache.key(state, text, fingerprint) for text in step_texts]
+
+    def __lookup_candidate(
+        self, proof: ProofTerm, step_text: str, key: Optional[TacticKey]
+    ) -> Optional[CandidateResult]:
+        if key is None:
+            return None
+        begin = time.perf_counter()
+        outcome = self.__tactic_cache.lookup(key)
+        if outcome is None:
+            return None
+        goals, diagnostics = outcome
+        answer = GoalAnswer(
+            VersionedTextDocumentIdentifier(f"file://{self.path}", self.version),
+            self.__candidate_anchor(proof).ast.range.end,
+            [],
+            goals=goals,
+        )
+        seconds = time.perf_counter() - begin
+        return CandidateResult(step_text, answer, diagnostics, seconds)
+
+    def __cache_candidate(self, key: Optional[TacticKey], result: CandidateResult):
+        if key is not None:
+            goals = None if result.goals is None else result.goals.goals
+            self.__tactic_cache[key] = (goals, result.diagnostics)
+
+    def try_step(
+        self,
+        proof: ProofTerm,
+        step_text: str,
+        previous_steps: Optional[List[str]] = None,
+    ) -> CandidateResult:
+        """Checks a step at the end of a proof without changing the file, its
+        steps or its context. The step is placed after the last step of the
+        proof, or before the step that closes the proof if it is closed.
+
+        Args:
+            proof (ProofTerm): The proof to which the step would be added.
+            step_text (str): The text of the step. If it does not start with
+                whitespace, it is separated from the previous step by a newline.
+            previous_steps (Optional[List[str]], optional): Steps placed between
+                the end of the proof and the step, which are not part of the
+                file either. Defaults to None.
+
+        Returns:
+            CandidateResult: The goals after the step and its diagnostics. If the
+                outcome of the step is in the tactic cache, the goals are
+                positioned at the end of the proof.
+        """
+        step_text = ProofFile.__candidate_text(step_text)
+        (key,) = self.__candidate_keys(proof, [step_text], previous_steps)
+        cached = self.__lookup_candidate(proof, step_text, key)
+        if cached is not None:
+            return cached
+
+        prefix = self.__candidate_prefix(proof, previous_steps)
+        if self.__scratch is None:
+            self.__scratch = _ScratchDocument(self.coq_lsp_client, self.path)
+        try:
+            result = self.__scratch.evaluate(prefix, step_text)
+        except Exception as e:
+            self._handle_exception(e)
+            raise e
+        self.__cache_candidate(key, result)
+        return result
+
+    def __grow_candidate_pool(self, size: int):
+        if self.workspace is not None:
+            root_uri = f"file://{self.workspace}"
+        else:
+            root_uri = f"file://{self.path}"
+        while len(self.__candidate_pool) < size:
+            client = CoqLspClient(
+                root_uri, timeout=self.timeout, coq_lsp=self.__coq_lsp
+            )
+            self.__candidate_pool.append(_ScratchDocument(client, self.path))
+
+    def __close_candidate_worker(self, scratch: _ScratchDocument):
+        self.__candidate_pool.remove(scratch)
+        if not scratch.coq_lsp_client.lsp_endpoint.shutdown_flag:
+            scratch.coq_lsp_client.shutdown()
+            scratch.coq_lsp_client.exit()
+
+    def evaluate_candidates(
+        self,
+        proof: ProofTerm,
+        step_texts: List[str],
+        workers: int = 1,
+        previous_steps: Optional[List[str]] = None,
+    ) -> List[CandidateResult]:
+        """Checks several candidate steps at the end of a proof without changing
+        the file, as in try_step. The candidates are distributed among
+        `workers` coq-lsp servers, which check them in parallel. The servers
+        besides the one of the ProofFile are started on first use and kept
+        until the ProofFile is closed.
+
+        Args:
+            proof (ProofTerm): The proof to which the steps would be added.
+            step_texts (List[str]): The text of each candidate step.
+            workers (int, optional): Number of coq-lsp servers used. Defaults to 1.
+            previous_steps (Optional[List[str]], optional): Steps placed between
+                the end of the proof and the candidates (see try_step).
+                Defaults to None.
+
+        Returns:
+            List[CandidateResult]: The goals, diagnostics and time taken for
+                each candidate, in the same order as the candidates.
+        """
+        workers = max(1, min(workers, len(step_texts)))
+        if workers == 1:
+            return [
+                self.try_step(proof, text, previous_steps=previous_steps)
+                for text in step_texts
+            ]
+
+        step_texts = list(map(ProofFile.__candidate_text, step_texts))
+        keys = self.__candidate_keys(proof, step_texts, previous_steps)
+        results: List[Optional[CandidateResult]] = [None] * len(step_texts)
+        for i, key in enumerate(keys):
+            results[i] = self.__lookup_candidate(proof, step_texts[i], key)
+        missing = [i for i in range(len(step_texts)) if results[i] is None]
+        if len(missing) == 0:
+            return results
+
+        prefix = self.__candidate_prefix(proof, previous_steps)
+        if self.__scratch is None:
+            self.__scratch = _ScratchDocument(self.coq_lsp_client, self.path)
+        workers = min(workers, len(missing))
+        self.__grow_candidate_pool(workers - 1)
+        scratches = [self.__scratch] + self.__candidate_pool[: workers - 1]
+
+        pending: queue.Queue = queue.Queue()
+        for i in missing:
+            pending.put(i)
+        failures: List[Tuple[_ScratchDocument, Exception]] = []
+
+        def evaluate(scratch: _ScratchDocument):
+            while len(failures) == 0:
+                try:
+                    i = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results[i] = scratch.evaluate(prefix, step_texts[i])
+                except Exception as e:
+                    failures.append((scratch, e))
+                    return
+
+        threads = [threading.Thread(target=evaluate, args=(s,)) for s in scratches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for scratch, e in failures:
+            if scratch is self.__scratch:
+                self._handle_exception(e)
+            else:
+                self.__close_candidate_worker(scratch)
+        if len(failures) > 0:
+            raise failures[0][1]
+        for i in missing:
+            self.__cache_candidate(keys[i], results[i])
+        return results
+
+    def goal_diffs(self, proof: ProofTerm) -> List[List[GoalDiff]]:
+        """Compares the goals of each step of a proof with the goals of the
+        previous step.
+
+        Args:
+            proof (ProofTerm): The proof.
+
+        Returns:
+            List[List[GoalDiff]]: For each step, the difference of each of its
+                focused goals to the goals of the previous step. The goals of the
+                first step are compared with no goals.
+        """
+        diffs, previous = [], None
+        for step in proof.steps:
+            goals = step.goals.goals if step.goals is not None else None
+            diffs.append(diff_goal_configs(previous, goals))
+            previous = goals
+        return diffs
+
     def exec(self, nsteps=1) -> List[Step]:
         sign = 1 if nsteps > 0 else -1
         initial_steps_taken = self.steps_taken
@@ -944,6 +1548,11 @@ class ProofFile(CoqFile):
             InvalidChangeException: If the file is invalid after applying the changes.
             NotImplementedError: If the changes contain an unknown ProofChange.
         """
+        self.change_steps(self.__proof_changes(proof, proof_changes))
+
+    def __proof_changes(
+        self, proof: ProofTerm, proof_changes: List[ProofChange]
+    ) -> List[CoqChange]:
         step_index = self.__find_step_index(proof.ast.range)
         changes: List[CoqChange] = []
         offset = len(proof.steps)
@@ -956,13 +1565,167 @@ class ProofFile(CoqFile):
                 changes.append(CoqAdd(change.step_text, step_index + offset))
                 offset += 1
 
-        self.change_steps(changes)
+        return changes
+
+    def __failed_proofs(
+        self,
+        e: InvalidChangeException,
+        proofs: List[ProofTerm],
+        proof_changes: Dict[ProofTerm, List[ProofChange]],
+    ) -> Dict[ProofTerm, InvalidChangeException]:
+        # Line where each proof starts in the changed text. The proofs are in
+        # the order of the file, so each one is only moved by the lines added
+        # and removed in the proofs before it.
+        starts, shift = [], 0
+        for proof in proofs:
+            starts.append(proof.ast.range.start.line + shift)
+            texts = [step.text for step in proof.steps]
+            for change in proof_changes[proof]:
+                if isinstance(change, ProofPop):
+                    shift -= texts.pop().count("\n")
+                elif isinstance(change, ProofAppend):
+                    texts.append(change.step_text)
+                    shift += change.step_text.count("\n")
+
+        # Each error is caused by the last changed proof before it, e.g., a
+        # proof left open breaks the commands after it
+        errors: Dict[ProofTerm, List[Diagnostic]] = {}
+        for diagnostic in e.errors:
+            line = diagnostic.range.start.line
+            before = [i for i, start in enumerate(starts) if start <= line]
+            if len(before) == 0:
+                errors = {}
+                break
+            errors.setdefault(proofs[before[-1]], []).append(diagnostic)
+        if len(errors) == 0:
+            # The errors cannot be traced to a proof, so every proof fails
+            errors = {proof: e.errors for proof in proofs}
+
+        failures: Dict[ProofTerm, InvalidChangeException] = {}
+        for proof, diagnostics in errors.items():
+            failures[proof] = InvalidChangeException()
+            failures[proof].diagnostics = diagnostics
+        return failures
+
+    def change_proofs(
+        self,
+        proof_changes: Dict[ProofTerm, List[ProofChange]],
+        keep_valid: bool = False,
+    ) -> Dict[ProofTerm, InvalidChangeException]:
+        """Changes the steps of several proofs in a single transaction, i.e.,
+        the file is changed and checked once for all the proofs instead of once
+        for each proof as in change_proof.
+
+        Args:
+            proof_changes (Dict[ProofTerm, List[ProofChange]]): The changes to be
+                applied to each proof.
+            keep_valid (bool, optional): If True, the changes of the proofs which
+                are valid are applied even if the changes of other proofs are not.
+                The file is checked again for each round of invalid proofs found.
+                If False, the file is not changed if the changes of any proof are
+                not valid. Defaults to False.
+
+        Raises:
+            InvalidFileException: If the file being changed is not valid.
+            NotImplementedError: If the changes contain an unknown ProofChange.
+
+        Returns:
+            Dict[ProofTerm, InvalidChangeException]: For each proof whose changes
+                are not valid, an exception with the errors attributed to the
+                proof. The changes of these proofs are not applied. Errors are
+                attributed to the last changed proof that starts before them.
+        """
+        pending = dict(proof_changes)
+        failures: Dict[ProofTerm, InvalidChangeException] = {}
+        while len(pending) > 0:
+            indexes = {p: self.__find_step_index(p.ast.range) for p in pending}
+            proofs = sorted(pending, key=lambda proof: indexes[proof])
+            # Changes are applied from the last proof, so that the indexes of the
+            # steps of the proofs before it are not moved
+            changes: List[CoqChange] = []
+            for proof in reversed(proofs):
+                changes.extend(self.__proof_changes(proof, pending[proof]))
+
+            try:
+                self.change_steps(changes)
+                break
+            except InvalidChangeException as e:
+                failed = self.__failed_proofs(e, proofs, pending)
+                failures.update(failed)
+                if not keep_valid:
+                    break
+                for proof in failed:
+                    pending.pop(proof)
+        return failures
+
+    def __step_key(
+        self, previous_step_index: int, step_text: str
+    ) -> Tuple[Optional[TacticKey], Optional[GoalAnswer]]:
+        if self.__tactic_cache is None or not self.is_valid:
+            return None, None
+        previous_step = self.steps[previous_step_index]
+        found = self.__find_step(previous_step.ast.range)
+        if found is None:
+            return None, None
+        goals = self.__goals(previous_step.ast.range.end)
+        if not self.__in_proof(goals):
+            return None, None
+        state = goal_state_hash(goals.goals)
+        fingerprint = self.context_fingerprint(found[0])
+        return TacticCache.key(state, step_text, fingerprint), goals
+
+    @staticmethod
+    def __step_errors(
+        diagnostics: List[Diagnostic], start: Position, step_text: str
+    ) -> List[Diagnostic]:
+        # The errors in the range the step had when it was added to the file
+        lines = step_text.split("\n")
+        if len(lines) == 1:
+            end = Position(start.line, start.character + len(step_text))
+        else:
+            end = Position(start.line + len(lines) - 1, len(lines[-1]))
+        return [
+            diagnostic
+            for diagnostic in diagnostics
+            if diagnostic.severity == 1
+            and not diagnostic.range.start < start
+            and not end < diagnostic.range.end
+        ]
 
     def add_step(self, previous_step_index: int, step_text: str):
+        # A step known to fail on the goals where it is added is rejected
+        # without changing the file
+        key, previous_goals = self.__step_key(previous_step_index, step_text)
+        outcome = None if key is None else self.__tactic_cache.lookup(key)
+        if outcome is not None:
+            _, diagnostics = outcome
+            if any(diagnostic.severity == 1 for diagnostic in diagnostics):
+                e = InvalidAddException(step_text)
+                e.diagnostics = diagnostics
+                raise e
+
         # We need to calculate this here because the _add_step
         # will possibly change the steps_taken
         processed = self.steps_taken > previous_step_index + 1
-        self._make_change(self._add_step, previous_step_index, step_text)
+        version = self.version
+        start = self.steps[previous_step_index].ast.range.end
+        start = Position(start.line, start.character)
+        edit_point = self.__edit_point([CoqAdd(step_text, previous_step_index)])
+        try:
+            self._make_change(self._add_step, previous_step_index, step_text)
+        except InvalidAddException as e:
+            # Only errors of the step itself are recorded, since the file may
+            # also be invalid because of the steps after it
+            errors = (
+                []
+                if key is None
+                else self.__step_errors(e.diagnostics, start, step_text)
+            )
+            if len(errors) > 0:
+                self.__tactic_cache[key] = (previous_goals.goals, errors)
+            raise e
+        finally:
+            self.__invalidate_goals(version, edit_point)
         if processed:
             n_steps = self.steps_taken - previous_step_index - 2
             self.__local_exec(-n_steps)  # Backtrack until added step
@@ -971,18 +1734,31 @@ class ProofFile(CoqFile):
             self.__add_step(previous_step_index + 1)
             self.__local_exec(n_steps)  # Execute until starting point
 
+        if key is not None:
+            added = self.steps[previous_step_index + 1]
+            goals = self.__goals(added.ast.range.end)
+            goals = None if goals is None else goals.goals
+            self.__tactic_cache[key] = (goals, added.diagnostics)
+
     def delete_step(self, step_index: int) -> None:
         deleted = self.steps[step_index]  # Get step before deletion
         # We need to calculate this here because the _delete_step
         # will possibly change the steps_taken
         processed = self.steps_taken > step_index
-        self._make_change(self._delete_step, step_index)
+        version = self.version
+        edit_point = self.__edit_point([CoqDelete(step_index)])
+        try:
+            self._make_change(self._delete_step, step_index)
+        finally:
+            self.__invalidate_goals(version, edit_point)
         if processed:
             self.__delete_step(deleted)
 
     def change_steps(self, changes: List[CoqChange]):
         adds, deletes, new_steps_taken = self.__get_changes_data(changes)
         old_steps_taken = self.steps_taken
+        version = self.version
+        edit_point = self.__edit_point(changes)
 
         nsteps = 0 if len(deletes) == 0 else max(0, self.steps_taken - deletes[0])
         nsteps = nsteps if len(adds) == 0 else max(nsteps, self.steps_taken - adds[0])
@@ -996,11 +1772,13 @@ class ProofFile(CoqFile):
         try:
             super().change_steps(changes)  # Apply (faster) changes in CoqFile
         except InvalidChangeException as e:
+            self.__invalidate_goals(version, edit_point)
             # Rollback deleted steps
             for delete in deletes:
                 self.__add_step(delete)
             self.__local_exec(old_steps_taken - self.steps_taken)
             raise e
+        self.__invalidate_goals(version, edit_point)
 
         # Add ProofSteps to ProofFile after Steps are added to CoqFile
         for add in adds:
@@ -1008,5 +1786,13 @@ class ProofFile(CoqFile):
         self.__local_exec(new_steps_taken - self.steps_taken)
 
     def close(self):
+        if (
+            self.__scratch is not None
+            and not self.coq_lsp_client.lsp_endpoint.shutdown_flag
+        ):
+            self.__scratch.close()
+        for scratch in self.__candidate_pool[:]:
+            self.__close_candidate_worker(scratch)
         super().close()
         self.__aux_file.close()
+        self.__goal_cache.close()
@@ -0,0 +1,216 @@
+import pickle
+from collections import OrderedDict
+from typing import Optional, List, Dict
+
+from coqpyt.coq.lsp.structs import GoalAnswer
+from coqpyt.coq.structs import ProofTerm, CandidateResult
+from coqpyt.coq.proof_file import ProofFile
+
+
+class ProofNode(object):
+    """Node of a ProofTree. The state of a node is the result of checking the
+    steps from the root to the node after the end of the proof.
+
+    Attributes:
+        text (Optional[str]): The step of the node. None for the root.
+        parent (Optional[ProofNode]): The parent of the node. None for the root.
+        children (Dict[str, ProofNode]): The children of the node, by step.
+        result (Optional[CandidateResult]): The cached state of the node. None
+            if the node was not checked yet or if its state was evicted.
+    """
+
+    def __init__(self, text: Optional[str], parent: Optional["ProofNode"] = None):
+        self.text = text
+        self.parent = parent
+        self.children: Dict[str, ProofNode] = {}
+        self.result: Optional[CandidateResult] = None
+
+    def __repr__(self) -> str:
+        return f"ProofNode({self.steps!r})"
+
+    @property
+    def steps(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The steps from the root to the node.
+        """
+        steps, node = [], self
+        while node.parent is not None:
+            steps.append(node.text)
+            node = node.parent
+        return steps[::-1]
+
+    @property
+    def depth(self) -> int:
+        return len(self.steps)
+
+
+class ProofTree(object):
+    """Tree of proof states for search over the steps of a proof.
+
+    The root is the state at the end of a proof of a ProofFile, and each child
+    adds a step to the state of its parent. The steps are checked with
+    ProofFile.evaluate_candidates, so the file is never changed. The state of
+    each node is cached, so revisiting a node does not check it again, and the
+    least recently used subtrees are evicted when the cached states exceed the
+    memory budget. Nodes are extended from the steps of their ancestors, so
+    extending a node does not need the states of its ancestors.
+
+    Attributes:
+        proof_file (ProofFile): The file of the proof.
+        proof (ProofTerm): The proof whose states are explored.
+        root (ProofNode): The state at the end of the proof.
+        memory_budget (Optional[int]): Maximum size in bytes of the cached states,
+            measured as the size of their serialization. If None, the states
+            are never evicted.
+        workers (int): Number of coq-lsp servers used to check the children
+            of a node.
+        evaluations (int): Number of steps checked.
+    """
+
+    def __init__(
+        self,
+        proof_file: ProofFile,
+        proof: ProofTerm,
+        memory_budget: Optional[int] = None,
+        workers: int = 1,
+    ):
+        self.proof_file = proof_file
+        self.proof = proof
+        self.root = ProofNode(None)
+        self.memory_budget = memory_budget
+        self.workers = workers
+        self.evaluations = 0
+        # Nodes with a cached state, from the least to the most recently used
+        self.__lru: Dict[int, ProofNode] = OrderedDict()
+        self.__sizes: Dict[int, int] = {}
+        self.__memory = 0
+
+    @property
+    def memory(self) -> int:
+        """
+        Returns:
+            int: Size in bytes of the cached states. Only measured if a memory
+                budget is defined.
+        """
+        return self.__memory
+
+    def __touch(self, node: ProofNode):
+        if id(node) in self.__lru:
+            self.__lru.move_to_end(id(node))
+
+    def __cache(self, node: ProofNode, result: CandidateResult):
+        node.result = result
+        self.__lru[id(node)] = node
+        if self.memory_budget is not None:
+            size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+            self.__sizes[id(node)] = size
+            self.__memory += size
+
+    def __uncache(self, node: ProofNode):
+        node.result = None
+        self.__lru.pop(id(node), None)
+        self.__memory -= self.__sizes.pop(id(node), 0)
+
+    def __evict_over_budget(self, keep: List[ProofNode]):
+        if self.memory_budget is None:
+            return
+        path = set()
+        for node in keep:
+            while node is not None and id(node) not in path:
+                path.add(id(node))
+                node = node.parent
+        keep = set(id(node) for node in keep)
+
+        for node in list(self.__lru.values()):
+            if self.__memory <= self.memory_budget:
+                break
+            if id(node) in keep or node.result is None:
+                continue
+            # Extending a node only needs the steps of its ancestors, so the
+            # ancestors of the nodes kept lose their state but not their children
+            if id(node) in path:
+                self.__uncache(node)
+            else:
+                self.evict(node)
+
+    def __evaluate(self, node: ProofNode, texts: List[str]) -> List[CandidateResult]:
+        results = self.proof_file.evaluate_candidates(
+            self.proof, texts, workers=self.workers, previous_steps=node.steps
+        )
+        self.evaluations += len(texts)
+        return results
+
+    def state(self, node: ProofNode) -> CandidateResult:
+        """
+        Args:
+            node (ProofNode): A node of the tree.
+
+        Returns:
+            CandidateResult: The state of the node. If it is not cached, the
+                node is checked again.
+        """
+        if node.result is None:
+            if node.parent is None:
+                # The root adds no step to the proof
+                result = self.__evaluate(node, [""])[0]
+            else:
+                result = self.__evaluate(node.parent, [node.text])[0]
+            self.__cache(node, result)
+            self.__evict_over_budget([node])
+        else:
+            self.__touch(node)
+        return node.result
+
+    def goals(self, node: ProofNode) -> Optional[GoalAnswer]:
+        """
+        Args:
+            node (ProofNode): A node of the tree.
+
+        Returns:
+            Optional[GoalAnswer]: The goals in the state of the node.
+        """
+        return self.state(node).goals
+
+    def expand(self, node: ProofNode, step_texts: List[str]) -> List[ProofNode]:
+        """Adds a child to a node for each step, and checks the steps whose
+        state is not cached.
+
+        Args:
+            node (ProofNode): The node to expand.
+            step_texts (List[str]): The steps to add to the state of the node.
+
+        Returns:
+            List[ProofNode]: The child of the node for each step.
+        """
+        children = []
+        for text in step_texts:
+            if text not in node.children:
+                node.children[text] = ProofNode(text, node)
+            children.append(node.children[text])
+
+        pending = [child for child in children if child.result is None]
+        pending = list({id(child): child for child in pending}.values())
+        if len(pending) > 0:
+            results = self.__evaluate(node, [child.text for child in pending])
+            for child, result in zip(pending, results):
+                self.__cache(child, result)
+        for child in children:
+            self.__touch(child)
+        self.__touch(node)
+        self.__evict_over_budget(children)
+        return children
+
+    def evict(self, node: ProofNode):
+        """Removes the children of a node and the cached states of the node
+        and its descendants. The state of the node is checked again if used.
+
+        Args:
+            node (ProofNode): The root of the subtree to evict.
+        """
+        stack = [node]
+        while len(stack) > 0:
+            current = stack.pop()
+            self.__uncache(current)
+            stack.extend(current.children.values())
+        node.children.clear()
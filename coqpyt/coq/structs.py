@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Any, Optional, List, Union, Callable
+from typing import Any, Optional, List, Tuple, Union, Callable
 
 from coqpyt.lsp.structs import Diagnostic, Position
 from coqpyt.coq.lsp.structs import RangedSpan, GoalAnswer
@@ -75,13 +75,76 @@ class SegmentStack:
         self.__current -= 1
 
 
+class StepInfo(object):
+    """Classification of a step, computed once from its AST.
+
+    Attributes:
+        span (Any): The span of the AST from which the info was computed.
+        expr (List): 'expr' field from the AST of the step.
+        attrs (List): 'attrs' field from the AST of the step.
+        term_type (TermType): The term type of the step.
+        is_proof_term (bool): Whether the step introduces a new proof term.
+        is_end_proof (bool): Whether the step closes an open proof term.
+        is_segment_delimiter (bool): Whether the step delimits a segment.
+        is_program (bool): Whether the step has the program attribute.
+        references (Optional[List[Tuple[str, str]]]): Identifiers ("id") and
+            notations ("notation") referenced by the step, in the order they
+            appear. Computed the first time they are needed.
+        names (Optional[List[str]]): Names defined by the step. Computed the
+            first time they are needed.
+    """
+
+    __slots__ = (
+        "span",
+        "expr",
+        "attrs",
+        "term_type",
+        "is_proof_term",
+        "is_end_proof",
+        "is_segment_delimiter",
+        "is_program",
+        "references",
+        "names",
+    )
+
+    def __init__(
+        self,
+        span: Any,
+        expr: List,
+        attrs: List,
+        term_type: TermType,
+        is_proof_term: bool,
+        is_end_proof: bool,
+        is_segment_delimiter: bool,
+        is_program: bool,
+    ):
+        self.span = span
+        self.expr = expr
+        self.attrs = attrs
+        self.term_type = term_type
+        self.is_proof_term = is_proof_term
+        self.is_end_proof = is_end_proof
+        self.is_segment_delimiter = is_segment_delimiter
+        self.is_program = is_program
+        self.references: Optional[List[Tuple[str, str]]] = None
+        self.names: Optional[List[str]] = None
+
+
 class Step(object):
+    # Computed by FileContext.step_info. It is not serialized with the step.
+    info: Optional[StepInfo] = None
+
     def __init__(self, text: str, short_text: str, ast: RangedSpan):
         self.text = text
         self.short_text = short_text
         self.ast = ast
         self.diagnostics: List[Diagnostic] = []
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("info", None)
+        return state
+
     def __repr__(self) -> str:
         return self.text
 
@@ -109,11 +172,17 @@ class Term:
         self.module = module
 
     def __eq__(self, __value: object) -> bool:
+        # The same term is usually found many times in a context
+        if __value is self:
+            return True
         if not isinstance(__value, Term):
             return False
         return __value.text == self.text
 
     def __hash__(self) -> int:
+        # NOTE: The hash is not stored in the term because the text of a step
+        # is updated when the file changes. Strings cache their own hash, so
+        # the text is only hashed once.
         return hash(self.text)
 
     def __repr__(self) -> str:
@@ -144,8 +213,10 @@ class ProofStep:
 
     @property
     def goals(self) -> GoalAnswer:
+        # Lazy goals are not kept by the step, so that the memory used by the
+        # goals is bounded by the loader (e.g., the goal cache of a ProofFile)
         if callable(self._goals):
-            self._goals = self._goals(self.ast.range.start)
+            return self._goals(self.ast.range.start)
         return self._goals
 
     @goals.setter
@@ -177,3 +248,45 @@ class ProofTerm(Term):
         self.steps = steps
         self.context = context
         self.program = program
+
+
+class CandidateResult(object):
+    """Result of checking a candidate step without changing the file.
+
+    Attributes:
+        text (str): The text of the candidate.
+        goals (Optional[GoalAnswer]): The goals after the candidate.
+        diagnostics (List[Diagnostic]): The diagnostics of the candidate.
+        seconds (float): Time taken to check the candidate.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        goals: Optional[GoalAnswer],
+        diagnostics: List[Diagnostic],
+        seconds: float,
+    ):
+        self.text = text
+        self.goals = goals
+        self.diagnostics = diagnostics
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return f"CandidateResult({self.text!r}, valid={self.valid})"
+
+    @property
+    def errors(self) -> List[Diagnostic]:
+        """
+        Returns:
+            List[Diagnostic]: The diagnostics of the candidate with severity 1.
+        """
+        return list(filter(lambda x: x.severity == 1, self.diagnostics))
+
+    @property
+    def valid(self) -> bool:
+        """
+        Returns:
+            bool: True if the candidate has no errors.
+        """
+        return len(self.errors) == 0
@@ -18,16 +18,18 @@ class LspEndpoint(threading.Thread):
         self.event_dict = {}
         self.response_dict = {}
         self.next_id = 0
+        self.id_lock = threading.Lock()
         self.timeout = timeout
         self.shutdown_flag = False
         self.diagnostics: Dict[str, List[structs.Diagnostic]] = {}
 
     def handle_result(self, rpc_id, result, error):
+        event = self.event_dict.get(rpc_id)
+        if event is None:
+            # Nobody waits for the response anymore (e.g., after a timeout)
+            return
         self.response_dict[rpc_id] = (result, error)
-        cond = self.event_dict[rpc_id]
-        cond.acquire()
-        cond.notify()
-        cond.release()
+        event.set()
 
     def stop(self):
         self.shutdown_flag = True
@@ -95,28 +97,45 @@ class LspEndpoint(threading.Thread):
         message_dict["params"] = params
         self.json_rpc_endpoint.send_request(message_dict)
 
-    def call_method(self, method_name, **kwargs):
-        current_id = self.next_id
-        self.next_id += 1
-        cond = threading.Condition()
-        self.event_dict[current_id] = cond
+    def send_method(self, method_name, **kwargs) -> int:
+        """Sends a request without waiting for its response, so that several
+        requests can be in flight at the same time.
 
-        cond.acquire()
+        Returns:
+            int: The id of the request, to be used in wait_result.
+        """
+        with self.id_lock:
+            current_id = self.next_id
+            self.next_id += 1
+        # The event is registered before sending, so the response is never lost
+        self.event_dict[current_id] = threading.Event()
         self.send_message(method_name, kwargs, current_id)
-        if self.shutdown_flag:
-            cond.release()
-            return None
-        if not cond.wait(timeout=self.timeout):
-            raise TimeoutError()
-        cond.release()
+        return current_id
+
+    def wait_result(self, rpc_id: int):
+        """Waits for the response to a request sent with send_method.
 
-        self.event_dict.pop(current_id)
-        result, error = self.response_dict.pop(current_id)
+        Args:
+            rpc_id (int): The id of the request.
+        """
+        try:
+            if self.shutdown_flag:
+                return None
+            if not self.event_dict[rpc_id].wait(timeout=self.timeout):
+                raise TimeoutError()
+            result, error = self.response_dict[rpc_id]
+        finally:
+            # Abandoned requests must not keep their entries
+            self.event_dict.pop(rpc_id, None)
+            self.response_dict.pop(rpc_id, None)
         if error:
             raise structs.ResponseError(
                 error.get("code"), error.get("message"), error.get("data")
             )
         return result
 
+    def call_method(self, method_name, **kwargs):
+        return self.wait_result(self.send_method(method_name, **kwargs))
+
     def send_notification(self, method_name, **kwargs):
         self.send_message(method_name, kwargs)
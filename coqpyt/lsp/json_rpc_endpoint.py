@@ -19,6 +19,9 @@ class MyEncoder(json.JSONEncoder):
     """
 
     def default(self, o):  # pylint: disable=E0202
+        # Objects with lazy attributes do not serialize their raw payload
+        if hasattr(o, "to_dict"):
+            return o.to_dict()
         return o.__dict__
 
 
@@ -3,6 +3,7 @@ import pytest
 from coqpyt.coq.lsp.structs import *
 from coqpyt.coq.exceptions import *
 from coqpyt.coq.changes import *
+from coqpyt.coq.goals import TacticCache
 
 from utility import *
 
@@ -306,6 +307,117 @@ class TestProofSimpleFileChanges(SetupProofFile):
         unproven = self.proof_file.unproven_proofs
         assert unproven == []
 
+    def test_try_step(self):
+        proven = self.proof_file.proofs[-1]
+        self.proof_file.pop_step(proven)
+        self.proof_file.pop_step(proven)
+        proof = self.proof_file.unproven_proofs[0]
+        with open(self.proof_file.path, "r") as f:
+            text = f.read()
+        n_steps = len(self.proof_file.steps)
+
+        result = self.proof_file.try_step(proof, "reflexivity.")
+        assert result.valid
+        assert len(result.goals.goals.goals) == 0
+        result = self.proof_file.try_step(proof, " rewrite test3.")
+        assert not result.valid
+        assert len(result.errors) == 1
+        assert len(result.goals.goals.goals) == 1
+
+        # Neither the file nor the proof changed
+        with open(self.proof_file.path, "r") as f:
+            assert f.read() == text
+        assert len(self.proof_file.steps) == n_steps
+        assert len(proof.steps) == 1
+        self.proof_file.append_step(proof, " reflexivity.")
+        self.proof_file.append_step(proof, " Qed.")
+        assert self.proof_file.unproven_proofs == []
+
+    def test_evaluate_candidates(self):
+        proven = self.proof_file.proofs[-1]
+        self.proof_file.pop_step(proven)
+        self.proof_file.pop_step(proven)
+        proof = self.proof_file.unproven_proofs[0]
+
+        candidates = ["reflexivity.", " rewrite test3.", "\nauto.", " simpl."] * 2
+        results = self.proof_file.evaluate_candidates(proof, candidates, workers=3)
+        assert len(results) == len(candidates)
+        for result, text in zip(results, candidates):
+            assert result.text.strip() == text.strip()
+            assert result.seconds >= 0
+        assert [result.valid for result in results] == [True, False, True, True] * 2
+        assert len(results[0].goals.goals.goals) == 0
+        assert len(results[3].goals.goals.goals) == 1
+        assert len(proof.steps) == 1
+
+    def test_change_proofs(self):
+        test1, test2 = self.proof_file.proofs
+        steps = [step.text for step in self.proof_file.steps]
+        changes = {
+            test1: [ProofPop(), ProofAppend(" Admitted.")],
+            test2: [ProofPop(), ProofPop(), ProofPop(), ProofAppend(" rewrite test3.")],
+        }
+
+        # No change is applied if the changes of a proof are not valid
+        failures = self.proof_file.change_proofs(changes)
+        assert list(failures.keys()) == [test2]
+        assert len(failures[test2].errors) > 0
+        assert [step.text for step in self.proof_file.steps] == steps
+
+        failures = self.proof_file.change_proofs(changes, keep_valid=True)
+        assert list(failures.keys()) == [test2]
+        assert [step.text for step in test1.steps] == [" reflexivity.", " Admitted."]
+        assert [step.text for step in test2.steps] == steps[4:]
+        assert self.proof_file.unproven_proofs == [test1]
+
+
+class TestProofTacticCache(SetupProofFile):
+    def setup_method(self, method):
+        self.tactic_cache = TacticCache()
+        self.setup("test_simple_file.v", tactic_cache=self.tactic_cache)
+
+    def test_tactic_cache(self):
+        proven = self.proof_file.proofs[-1]
+        self.proof_file.pop_step(proven)
+        self.proof_file.pop_step(proven)
+        proof = self.proof_file.unproven_proofs[0]
+
+        result = self.proof_file.try_step(proof, " rewrite test3.")
+        assert not result.valid
+        assert (self.tactic_cache.hits, len(self.tactic_cache)) == (0, 1)
+        cached = self.proof_file.try_step(proof, "rewrite test3.  ")
+        assert self.tactic_cache.hits == 1
+        assert not cached.valid
+        assert repr(cached.goals.goals) == repr(result.goals.goals)
+
+        # Steps known to fail are rejected without changing the file
+        with open(self.proof_file.path, "r") as f:
+            text = f.read()
+        with pytest.raises(InvalidAddException):
+            self.proof_file.append_step(proof, " rewrite test3.")
+        assert self.tactic_cache.hits == 2
+        with open(self.proof_file.path, "r") as f:
+            assert f.read() == text
+
+        # Failures of added steps are recorded as well
+        self.tactic_cache.clear()
+        with pytest.raises(InvalidAddException):
+            self.proof_file.append_step(proof, " rewrite test3.")
+        assert len(self.tactic_cache) == 1
+        assert not self.proof_file.try_step(proof, " rewrite test3.").valid
+        assert self.tactic_cache.hits == 3
+
+        # Outcomes of previous steps are used to find the state of a candidate
+        self.proof_file.try_step(proof, " reflexivity.")
+        results = self.proof_file.evaluate_candidates(
+            proof, [" Qed."], previous_steps=[" reflexivity."]
+        )
+        assert results[0].valid
+        self.proof_file.evaluate_candidates(
+            proof, [" Qed."], previous_steps=[" reflexivity."]
+        )
+        assert self.tactic_cache.hits == 4
+
 
 class TestProofChangeWithNotation(SetupProofFile):
     def setup_method(self, method):
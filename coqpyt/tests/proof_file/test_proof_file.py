@@ -455,3 +455,80 @@ class TestModuleInline(SetupProofFile):
         self.proof_file.run()
         assert self.proof_file.context.curr_modules == []
         assert not self.proof_file.context.in_module_type
+
+
+class TestProofGoalRequests(SetupProofFile):
+    def setup_method(self, method):
+        self.setup("test_valid.v")
+
+    def test_goal_requests(self):
+        self.proof_file.exec(-self.proof_file.steps_taken)
+        requests = []
+        proof_goals = self.proof_file.coq_lsp_client.proof_goals
+
+        def count_requests(*args, **kwargs):
+            requests.append(args)
+            return proof_goals(*args, **kwargs)
+
+        # Executing a file without Program commands needs no goals
+        self.proof_file.coq_lsp_client.proof_goals = count_requests
+        self.proof_file.run()
+        assert len(requests) == 0
+        check_proofs(
+            "tests/proof_file/expected/valid_file.yml",
+            self.proof_file.proofs,
+            coq_version=self.coq_version,
+        )
+
+    def test_prefetch_goals(self):
+        requests = []
+        proof_goals = self.proof_file.coq_lsp_client.proof_goals
+
+        def count_requests(*args, **kwargs):
+            requests.append(args)
+            return proof_goals(*args, **kwargs)
+
+        self.proof_file.coq_lsp_client.proof_goals = count_requests
+        n_steps = sum(len(proof.steps) for proof in self.proof_file.proofs)
+        stats = self.proof_file.prefetch_goals(concurrency=4)
+        assert stats["requests"] == n_steps
+        # Prefetched goals are not requested again
+        check_proofs(
+            "tests/proof_file/expected/valid_file.yml",
+            self.proof_file.proofs,
+            coq_version=self.coq_version,
+        )
+        assert len(requests) == 0
+        assert self.proof_file.prefetch_goals()["requests"] == 0
+
+
+class TestProofGoalCache(SetupProofFile):
+    def setup_method(self, method):
+        self.setup("test_valid.v")
+
+    def test_goal_cache(self):
+        requests = []
+        proof_goals = self.proof_file.coq_lsp_client.proof_goals
+
+        def count_requests(*args, **kwargs):
+            requests.append(args)
+            return proof_goals(*args, **kwargs)
+
+        self.proof_file.coq_lsp_client.proof_goals = count_requests
+        first_step = self.proof_file.proofs[0].steps[0]
+        index = self.proof_file.steps.index(first_step.step)
+        self.proof_file.exec(index - self.proof_file.steps_taken + 1)
+        goals = self.proof_file.current_goals
+        assert len(requests) == 1
+        assert self.proof_file.current_goals is goals
+        assert len(requests) == 1
+
+        # Goals before the edit point are kept after the edit
+        self.proof_file.add_step(len(self.proof_file.steps) - 1, "\nCheck 1.")
+        assert self.proof_file.current_goals is goals
+        assert len(requests) == 1
+
+        # Goals after the edit point are requested again
+        self.proof_file.add_step(index - 1, "\nCheck 1.")
+        self.proof_file.current_goals
+        assert len(requests) == 2
@@ -15,7 +15,7 @@ from coqpyt.coq.lsp.structs import *
 
 
 class SetupProofFile(ABC):
-    def setup(self, file_path, workspace=None, use_disk_cache: bool = False):
+    def setup(self, file_path, workspace=None, use_disk_cache: bool = False, **kwargs):
         if workspace is not None:
             self.workspace = os.path.join(
                 tempfile.gettempdir(), "test" + str(uuid.uuid4()).replace("-", "")
@@ -41,6 +41,7 @@ class SetupProofFile(ABC):
             timeout=60,
             workspace=self.workspace,
             use_disk_cache=use_disk_cache,
+            **kwargs,
         )
         self.proof_file.run()
         self.versionId = VersionedTextDocumentIdentifier(uri, 1)
@@ -0,0 +1,83 @@
+"""Scripted stand-in for the petanque server used by tests/test_petanque.py.
+
+The goal of a state is the list of tactics run from the start of the proof,
+"qed." closes the proof and "fail." fails.
+"""
+
+import sys
+import json
+
+states = []
+
+
+def send(message):
+    body = json.dumps(message).encode("utf-8")
+    sys.stdout.buffer.write(f"Content-Length: {len(body)}\r\n\r\n".encode("utf-8"))
+    sys.stdout.buffer.write(body)
+    sys.stdout.buffer.flush()
+
+
+def recv():
+    length = None
+    while True:
+        line = sys.stdin.buffer.readline()
+        if line == b"":
+            return None
+        line = line.decode("utf-8").strip()
+        if line == "":
+            break
+        if line.startswith("Content-Length:"):
+            length = int(line.split(":")[1])
+    return json.loads(sys.stdin.buffer.read(length))
+
+
+def new_state(tactics):
+    states.append(tactics)
+    finished = len(tactics) > 0 and tactics[-1] == "qed."
+    return {
+        "st": len(states) - 1,
+        "hash": hash(tuple(tactics)),
+        "proof_finished": finished,
+        "feedback": [],
+    }
+
+
+def handle(method, params):
+    if method == "petanque/setWorkspace":
+        return None
+    if method == "petanque/start":
+        return new_state([params["thm"]])
+    if method == "petanque/get_state_at_pos":
+        position = params["position"]
+        return new_state([f"Goal@{position['line']}:{position['character']}"])
+    if method == "petanque/run":
+        if params["tac"] == "fail.":
+            raise ValueError("Tactic failure.")
+        return new_state(states[params["st"]] + [params["tac"]])
+    if method == "petanque/goals":
+        tactics = states[params["st"]]
+        goals = [] if tactics[-1] == "qed." else [{"hyps": [], "ty": " ".join(tactics)}]
+        return {"goals": goals, "stack": [], "shelf": [], "given_up": []}
+    raise ValueError(f"Unknown method {method}")
+
+
+while True:
+    message = recv()
+    if message is None:
+        break
+    try:
+        send(
+            {
+                "jsonrpc": "2.0",
+                "id": message["id"],
+                "result": handle(message["method"], message["params"]),
+            }
+        )
+    except ValueError as e:
+        send(
+            {
+                "jsonrpc": "2.0",
+                "id": message["id"],
+                "error": {"code": -32803, "message": str(e)},
+            }
+        )
@@ -0,0 +1,74 @@
+import os
+import subprocess
+
+from coqpyt.coq.bundle import ContextBundle
+from coqpyt.coq.context import FileContext
+from coqpyt.coq.proof_file import _AuxFile
+from coqpyt.coq.structs import Step, Term, TermType
+
+
+def mock_terms(text: str):
+    return {text: Term(Step(text, text, None), TermType.DEFINITION, "mock.v", [])}
+
+
+def test_bundle_save_load(tmp_path):
+    library = tmp_path / "Lib.v"
+    library.write_text("Definition x := 1.")
+    bundle = ContextBundle(str(tmp_path))
+    bundle.add_library("Lib", str(library), mock_terms("x"), prelude=True)
+    bundle.add_library("Other", str(library), mock_terms("y"))
+
+    path = str(tmp_path / "context.bundle")
+    bundle.save(path)
+    loaded = ContextBundle.load(path)
+    assert loaded.workspace == str(tmp_path)
+    assert loaded.prelude == ["Lib"]
+    assert list(loaded.get_library("Lib").keys()) == ["x"]
+    assert list(loaded.get_library("Other", str(library)).keys()) == ["y"]
+    assert loaded.get_library("Other", str(tmp_path / "Other.v")) is None
+    assert loaded.get_library("Unknown") is None
+
+    # Libraries whose file changed after the bundle was built are ignored
+    stat = os.stat(library)
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert loaded.get_library("Lib") is None
+
+
+def test_bundle_discover(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert ContextBundle.discover(cache_dir, "/workspace") is None
+
+    library = tmp_path / "Lib.v"
+    library.write_text("Definition x := 1.")
+    bundle = ContextBundle("/workspace")
+    bundle.add_library("Lib", str(library), mock_terms("x"), prelude=True)
+    bundle.save(ContextBundle.default_path(cache_dir, "/workspace"))
+
+    assert ContextBundle.discover(cache_dir, "/workspace").prelude == ["Lib"]
+    assert ContextBundle.discover(cache_dir, "/other") is None
+    assert ContextBundle.discover(cache_dir, "/workspace", "other-lsp") is None
+
+    # Files that cannot be loaded are treated as stale bundles
+    path = ContextBundle.default_path(cache_dir, "/workspace")
+    with open(path, "rb") as f:
+        data = f.read()
+    for content in [data[: len(data) // 2], b"cunknown_module\nBundle\n."]:
+        with open(path, "wb") as f:
+            f.write(content)
+        assert ContextBundle.discover(cache_dir, "/workspace") is None
+
+
+def test_bundle_context_version(tmp_path, monkeypatch):
+    library = tmp_path / "Lib.v"
+    library.write_text("Definition x := 1.")
+    bundle = ContextBundle(str(tmp_path))
+    bundle.add_library("Lib", str(library), mock_terms("x"), prelude=True)
+
+    def check_output(command, shell=False):
+        raise AssertionError("coqtop should not run")
+
+    # The version reported by coq-lsp is used instead of running coqtop
+    monkeypatch.setattr(subprocess, "check_output", check_output)
+    FileContext.get_coq_version.cache_clear()
+    context = _AuxFile.get_coq_context(30, bundle=bundle, coq_version="8.19.2")
+    assert context.get_term("x") is not None
@@ -1,3 +1,5 @@
+import os
+
 from coqpyt.coq.proof_file import _AuxFile, ProofFile
 
 
@@ -8,3 +10,20 @@ def test_set_cache_size():
     _AuxFile._AuxFile__load_library.cache_info().maxsize == 512
     ProofFile.set_library_cache_size(256)
     _AuxFile._AuxFile__load_library.cache_info().maxsize == 256
+
+
+def test_library_hash(tmp_path):
+    library = tmp_path / "Lib.v"
+    library.write_text("Definition x := 1.")
+    library_hash = _AuxFile.get_library_hash("Lib", str(library))
+    assert library_hash == _AuxFile.get_library_hash("Lib", str(library))
+    assert library_hash != _AuxFile.get_library_hash("Lib", str(library), "ws")
+
+    # The digest is reused while the stat signature of the file is the same
+    stat = os.stat(library)
+    library.write_text("Definition y := 1.")
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert library_hash == _AuxFile.get_library_hash("Lib", str(library))
+
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert library_hash != _AuxFile.get_library_hash("Lib", str(library))
@@ -1,5 +1,11 @@
+import pickle
+import pytest
+import subprocess
+
 from coqpyt.coq.context import FileContext
+from coqpyt.coq.exceptions import NotationNotFoundException
 from coqpyt.coq.structs import Term, TermType, Step
+from coqpyt.coq.lsp.structs import RangedSpan
 
 
 def test_notation_colon_problem():
@@ -51,3 +57,320 @@ def test_notation_spaces():
 
     term = context.get_notation(" _  +  _ ", "test_scope")
     assert term == mock_context["x - y : test_scope"]
+
+
+def test_library_lookup():
+    context = FileContext("mock.v")
+    library_a = {
+        "x + y : nat_scope": Term(
+            Step("XXX", "YYY", None), TermType.NOTATION, "a.v", []
+        ),
+        "A.f": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "a.v", []),
+        "f": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "a.v", []),
+    }
+    library_b = {
+        "f": Term(Step("BBB", "BBB", None), TermType.DEFINITION, "b.v", []),
+    }
+    context.add_library("A", library_a)
+    context.add_library("B", library_b)
+
+    assert context.get_term("A.f") == library_a["A.f"]
+    assert context.get_term("f") == library_b["f"]
+    assert context.get_notation("_ + _", "nat_scope") == library_a["x + y : nat_scope"]
+    assert len(context.terms) == 3
+    assert context.local_terms == []
+
+    local = {"f": Term(Step("CCC", "CCC", None), TermType.DEFINITION, "mock.v", [])}
+    context.update(local)
+    assert context.get_term("f") == local["f"]
+    assert context.local_terms == [local["f"]]
+
+    context.remove_library("B")
+    assert "B" not in context.libraries
+    assert context.terms["f"] == local["f"]
+
+    # A library required after a local term shadows it
+    library_c = {
+        "f": Term(Step("DDD", "DDD", None), TermType.DEFINITION, "c.v", []),
+    }
+    context.add_library("C", library_c)
+    assert context.get_term("f") == library_c["f"]
+    assert context.local_terms == []
+    context.remove_library("C")
+    assert context.get_term("f") == local["f"]
+    assert context.local_terms == [local["f"]]
+
+
+def test_terms_view():
+    context = FileContext("mock.v")
+    library = {"f": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "a.v", [])}
+    context.add_library("A", library)
+    terms = context.terms
+    assert terms == library
+
+    local = {"f": Term(Step("BBB", "BBB", None), TermType.DEFINITION, "mock.v", [])}
+    context.update(local)
+    # The view follows the changes to the context
+    assert terms["f"] == local["f"]
+    assert context.local_terms == [local["f"]]
+    with pytest.raises(TypeError):
+        terms["g"] = local["f"]
+
+
+def test_incremental_layers(monkeypatch):
+    updates = []
+    set_visible = FileContext._FileContext__set_visible
+
+    def count_updates(self, name, layer, term):
+        updates.append(name)
+        set_visible(self, name, layer, term)
+
+    monkeypatch.setattr(FileContext, "_FileContext__set_visible", count_updates)
+    context = FileContext("mock.v", coq_version="8.19.2")
+    large = {
+        f"f{i}": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "a.v", [])
+        for i in range(100)
+    }
+    small = {
+        "f0": Term(Step("BBB", "BBB", None), TermType.LEMMA, "b.v", []),
+        "g": Term(Step("BBB", "BBB", None), TermType.LEMMA, "b.v", []),
+    }
+    context.add_library("A", large)
+    local = {"g": Term(Step("CCC", "CCC", None), TermType.DEFINITION, "mock.v", [])}
+    context.update(local)
+    context.add_library("B", small)
+    assert context.terms["f0"] == small["f0"]
+    lemmas = context.get_terms_by_type(TermType.LEMMA)
+    assert dict(lemmas) == small
+
+    # Only the names of the layer that changes are updated
+    updates.clear()
+    context.remove_library("B")
+    assert sorted(updates) == ["f0", "g"]
+    assert context.terms["f0"] == large["f0"]
+    assert context.terms["g"] == local["g"]
+    assert len(lemmas) == 0
+
+    updates.clear()
+    context.remove_library("A")
+    assert len(updates) == 100
+    assert dict(context.terms) == local
+
+    updates.clear()
+    context.add_library("B", small)
+    context.add_library("A", large)
+    assert len(updates) == 102
+    assert context.terms["g"] == small["g"]
+    assert context.terms["f0"] == large["f0"]
+
+
+def test_notation_index():
+    context = FileContext("mock.v")
+    mock_context = {
+        "'if' c 'then' a 'else' b": Term(
+            Step("AAA", "AAA", None), TermType.NOTATION, "mock.v", []
+        ),
+        "x 'ONE' y": Term(Step("BBB", "BBB", None), TermType.NOTATION, "mock.v", []),
+        "x ONE y : nat_scope": Term(
+            Step("CCC", "CCC", None), TermType.NOTATION, "mock.v", []
+        ),
+        "x ONE y": Term(Step("DDD", "DDD", None), TermType.DEFINITION, "mock.v", []),
+    }
+    context.update(mock_context)
+
+    term = context.get_notation("if _ then _ else _", "")
+    assert term == mock_context["'if' c 'then' a 'else' b"]
+    term = context.get_notation("_ ONE _", "")
+    assert term == mock_context["x 'ONE' y"]
+    term = context.get_notation("_ ONE _", "nat_scope")
+    assert term == mock_context["x ONE y : nat_scope"]
+    with pytest.raises(NotationNotFoundException):
+        context.get_notation("_ TWO _", "nat_scope")
+
+
+@pytest.mark.parametrize("probes", [FileContext.MAX_NOTATION_PROBES, 0])
+def test_notation_layers(monkeypatch, probes):
+    # Without probes, notations are matched against every name in the context
+    monkeypatch.setattr(FileContext, "MAX_NOTATION_PROBES", probes)
+    context = FileContext("mock.v")
+    library_a = {
+        "x + y : nat_scope": Term(
+            Step("AAA", "AAA", None), TermType.NOTATION, "a.v", []
+        ),
+        "x * y": Term(Step("AAA", "AAA", None), TermType.NOTATION, "a.v", []),
+    }
+    library_b = {
+        "a + b : nat_scope": Term(
+            Step("BBB", "BBB", None), TermType.NOTATION, "b.v", []
+        ),
+        "a * b": Term(Step("BBB", "BBB", None), TermType.NOTATION, "b.v", []),
+    }
+    context.add_library("A", library_a)
+    context.add_library("B", library_b)
+    assert context.get_notation("_ + _", "nat_scope") == library_b["a + b : nat_scope"]
+    assert context.get_notation("_ * _", "") == library_b["a * b"]
+
+    local = {
+        "n + m : nat_scope": Term(
+            Step("CCC", "CCC", None), TermType.NOTATION, "mock.v", []
+        )
+    }
+    context.update(local)
+    assert context.get_notation("_ + _", "nat_scope") == local["n + m : nat_scope"]
+
+    # The newest layer wins, regardless of when the names were indexed
+    context.add_library("A", library_a)
+    assert context.get_notation("_ + _", "nat_scope") == library_a["x + y : nat_scope"]
+    assert context.get_notation("_ * _", "") == library_a["x * y"]
+
+
+def test_term_indexes():
+    context = FileContext("mock.v", module=["Mock"])
+    library = {
+        "A.f": Term(Step("AAA", "AAA", None), TermType.LEMMA, "nat.v", ["A"]),
+        "g": Term(Step("GGG", "GGG", None), TermType.DEFINITION, "nat.v", []),
+        "x + y : nat_scope": Term(
+            Step("XXX", "XXX", None), TermType.NOTATION, "nat.v", []
+        ),
+    }
+    context.add_library("Coq.Init.Nat", library)
+    lemmas = context.get_terms_by_type(TermType.LEMMA)
+    assert dict(lemmas) == {"A.f": library["A.f"]}
+    # Modules are indexed by the path of the library and the modules inside it
+    nat_a = context.get_terms_by_module(["Coq", "Init", "Nat", "A"])
+    assert dict(nat_a) == {"A.f": library["A.f"]}
+    assert len(context.get_terms_by_module(["A"])) == 0
+    assert dict(context.get_terms_by_module(["Coq", "Init", "Nat"])) == {
+        "g": library["g"],
+        "x + y : nat_scope": library["x + y : nat_scope"],
+    }
+    nat_definitions = context.get_terms_by_type_and_module(
+        TermType.DEFINITION, ["Coq", "Init", "Nat"]
+    )
+    assert dict(nat_definitions) == {"g": library["g"]}
+    notations = context.get_notations_by_scope("nat_scope")
+    assert list(notations) == ["x + y : nat_scope"]
+
+    local = {
+        "A.f": Term(Step("BBB", "BBB", None), TermType.DEFINITION, "mock.v", ["A"])
+    }
+    context.update(local)
+    assert len(lemmas) == 0
+    assert len(nat_a) == 0
+    assert dict(context.get_terms_by_type(TermType.DEFINITION)) == {
+        "g": library["g"],
+        "A.f": local["A.f"],
+    }
+    assert dict(context.get_terms_by_module(["Mock", "A"])) == local
+    assert (
+        dict(context.get_terms_by_type_and_module(TermType.DEFINITION, ["Mock", "A"]))
+        == local
+    )
+
+    # Terms of other files are not indexed under the module of the file
+    other = {"h": Term(Step("HHH", "HHH", None), TermType.DEFINITION, "/b/other.v", [])}
+    context.update(other)
+    assert dict(context.get_terms_by_module(["other"])) == other
+    assert "h" not in context.get_terms_by_module(["Mock"])
+
+    context.remove_library("Coq.Init.Nat")
+    assert len(notations) == 0
+    assert len(nat_definitions) == 0
+
+
+def test_qualified_lookup():
+    context = FileContext("mock.v", module=["Mock", "File"])
+    library = {
+        "add": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "nat.v", []),
+        "M.f": Term(Step("BBB", "BBB", None), TermType.DEFINITION, "nat.v", ["M"]),
+    }
+    context.add_library("Coq.Init.Nat", library)
+    local = {"g": Term(Step("CCC", "CCC", None), TermType.DEFINITION, "mock.v", [])}
+    context.update(local)
+
+    # Each term is stored once, under its name inside the file
+    assert set(context.terms) == {"add", "M.f", "g"}
+    for name in ["add", "Nat.add", "Init.Nat.add", "Coq.Init.Nat.add"]:
+        assert context.get_term(name) == library["add"]
+    assert context.get_term("Nat.M.f") == library["M.f"]
+    assert context.get_term("Nat.f") is None
+    assert context.get_term("File.g") == local["g"]
+    assert context.get_term("Mock.File.g") == local["g"]
+
+    context.remove_library("Coq.Init.Nat")
+    assert context.get_term("Nat.add") is None
+
+
+def test_qualified_lookup_order():
+    context = FileContext("mock.v", module=["Mock", "Nat"])
+    library = {
+        "add": Term(Step("AAA", "AAA", None), TermType.DEFINITION, "nat.v", []),
+    }
+    local = {"add": Term(Step("BBB", "BBB", None), TermType.DEFINITION, "mock.v", [])}
+
+    # Both Coq.Init.Nat and Mock.Nat end in Nat, so the newest layer wins
+    context.add_library("Coq.Init.Nat", library)
+    context.update(local)
+    assert context.get_term("add") == local["add"]
+    assert context.get_term("Nat.add") == local["add"]
+    assert context.get_term("Init.Nat.add") == library["add"]
+
+    context.add_library("Coq.Init.Nat", library)
+    assert context.get_term("add") == library["add"]
+    assert context.get_term("Nat.add") == library["add"]
+    assert context.get_term("Mock.Nat.add") == local["add"]
+
+
+def test_coq_version_cache(monkeypatch):
+    calls = []
+
+    def check_output(command, shell=False):
+        calls.append(command)
+        return b"The Coq Proof Assistant, version 8.19.2\n"
+
+    monkeypatch.setattr(subprocess, "check_output", check_output)
+    FileContext.get_coq_version.cache_clear()
+    try:
+        FileContext("a.v", coqtop="/mock/coqtop")
+        FileContext("b.v", coqtop="/mock/coqtop")
+        FileContext("c.v", coqtop="/mock/coqtop", coq_version="8.18.0")
+        assert calls == ["/mock/coqtop -v"]
+    finally:
+        FileContext.get_coq_version.cache_clear()
+
+
+def test_step_info():
+    context = FileContext("mock.v", coq_version="8.19.2")
+    span = {"v": {"expr": ["VernacSynPure", ["VernacEndProof", ["Proved"]]]}}
+    step = Step("Qed.", "Qed.", RangedSpan(None, span))
+
+    info = context.step_info(step)
+    assert context.step_info(step) is info
+    assert context.expr(step) == ["VernacEndProof", ["Proved"]]
+    assert context.is_end_proof(step)
+    assert not context.is_proof_term(step)
+    assert context.attrs(step) == []
+
+    # The info is computed again if the AST of the step changes
+    span = {"v": {"expr": ["VernacSynPure", ["VernacBeginSection", {}]]}}
+    step.ast = RangedSpan(None, span)
+    assert not context.is_end_proof(step)
+    assert context.is_segment_delimiter(step)
+    assert pickle.loads(pickle.dumps(step)).info is None
+
+
+def test_step_references():
+    context = FileContext("mock.v", coq_version="8.19.2")
+    qualid = lambda name: ["Ser_Qualid", ["DirPath", []], ["Id", name]]
+    notation = ["CNotation", None, ["InConstrEntry", "_ + _"], [[{"v": qualid("x")}]]]
+    expr = ["VernacCheckMayEval", {"v": qualid("f")}, notation, {"v": qualid("g")}]
+    step = Step("", "", RangedSpan(None, {"v": {"expr": ["VernacSynPure", expr]}}))
+
+    references = context.references(step)
+    assert references == [
+        ("id", "f"),
+        ("notation", "_ + _"),
+        ("id", "x"),
+        ("id", "g"),
+    ]
+    assert context.references(step) is references
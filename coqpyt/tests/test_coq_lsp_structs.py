@@ -0,0 +1,92 @@
+import json
+import pickle
+
+from coqpyt.lsp.structs import Position
+from coqpyt.lsp.json_rpc_endpoint import MyEncoder
+from coqpyt.coq.lsp.structs import GoalAnswer, FlecheDocument, Message
+
+GOAL_ANSWER = {
+    "textDocument": {"uri": "file:///tmp/test.v", "version": 2},
+    "position": {"line": 3, "character": 4},
+    "messages": [
+        "Unknown message",
+        {"level": 3, "text": "Info", "range": None},
+    ],
+    "goals": {
+        "goals": [
+            {
+                "hyps": [
+                    {"names": ["n", "m"], "ty": "nat"},
+                    {"names": ["x"], "ty": "nat", "def": "n + m"},
+                ],
+                "ty": "x = n + m",
+            }
+        ],
+        "stack": [[[], [{"hyps": [], "ty": "True"}]]],
+        "shelf": [],
+        "given_up": [],
+    },
+}
+
+
+def test_lazy_goal_answer():
+    goal_answer = GoalAnswer.parse(GOAL_ANSWER)
+    # Only the attributes read are parsed
+    assert "goals" not in vars(goal_answer)
+    assert goal_answer.goals is not None
+    assert "goals" not in vars(goal_answer.goals)
+    assert goal_answer.goals.bullet is None
+
+    goal = goal_answer.goals.goals[0]
+    assert goal.ty == "x = n + m"
+    assert [hyp.names for hyp in goal.hyps] == [["n", "m"], ["x"]]
+    assert goal.hyps[0].definition is None
+    assert goal.hyps[1].definition == "n + m"
+    assert goal_answer.goals.stack[0][1][0].ty == "True"
+    assert goal_answer.goals.shelf == []
+
+    assert goal_answer.position == Position(3, 4)
+    assert goal_answer.textDocument.version == 2
+    assert goal_answer.messages[0] == "Unknown message"
+    assert isinstance(goal_answer.messages[1], Message)
+    assert goal_answer.error is None
+    assert goal_answer.program == []
+    # The raw payload is not changed
+    assert "def" in GOAL_ANSWER["goals"]["goals"][0]["hyps"][1]
+
+    copy = pickle.loads(pickle.dumps(GoalAnswer.parse(GOAL_ANSWER)))
+    assert repr(copy.goals) == repr(goal_answer.goals)
+    assert copy.messages[1].text == "Info"
+
+
+def test_lazy_fleche_document():
+    ranges = [
+        {"start": {"line": i, "character": 0}, "end": {"line": i, "character": 5}}
+        for i in range(3)
+    ]
+    document = FlecheDocument.parse(
+        {
+            "spans": [{"range": r, "span": {"v": i}} for i, r in enumerate(ranges)]
+            + [{"range": ranges[0]}],
+            "completed": {"status": "Yes", "range": ranges[-1]},
+        }
+    )
+    assert document.completed.status == "Yes"
+    assert len(document.spans) == 4
+    assert document.spans[1].range.start == Position(1, 0)
+    assert document.spans[2].span == {"v": 2}
+    assert document.spans[3].span is None
+    assert FlecheDocument.parse({"spans": []}) is None
+
+
+def test_lazy_serialization():
+    goal_answer = GoalAnswer.parse(GOAL_ANSWER)
+    # The lazy attributes are parsed, and the raw payload is not serialized
+    data = json.loads(json.dumps(goal_answer, cls=MyEncoder))
+    assert "_raw" not in data and "_raw" not in data["goals"]
+    assert (data["position"]["line"], data["position"]["character"]) == (3, 4)
+    assert data["goals"]["goals"][0]["ty"] == "x = n + m"
+    assert data["goals"]["goals"][0]["hyps"][1]["definition"] == "n + m"
+    assert data["goals"]["bullet"] is None
+    assert data["messages"][1]["text"] == "Info"
+    assert json.dumps(goal_answer, cls=MyEncoder) == json.dumps(data)
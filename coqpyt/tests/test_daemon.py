@@ -0,0 +1,221 @@
+import os
+import uuid
+import pytest
+import tempfile
+import threading
+
+from coqpyt.coq.structs import Step, Term, TermType
+from coqpyt.coq.context import FileContext
+from coqpyt.coq.exceptions import NotationNotFoundException
+from coqpyt.coq.daemon import (
+    LibraryContextService,
+    InProcessLibraryClient,
+    LibraryDaemon,
+    LibraryDaemonClient,
+)
+
+
+class MockLibraryService(LibraryContextService):
+    LIBRARIES = {
+        "Coq.Init.Prelude": {
+            "nat": Term(
+                Step("Inductive nat", "Inductive nat", None),
+                TermType.INDUCTIVE,
+                "Prelude.v",
+                [],
+            ),
+        },
+        "Coq.Init.Logic": {
+            "x + y": Term(
+                Step("Notation", "Notation x + y", None),
+                TermType.NOTATION,
+                "Logic.v",
+                [],
+            ),
+        },
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.loaded = []
+
+    def get_libraries(self, timeout, workspace=None):
+        return [(library, f"{library}.v") for library in self.LIBRARIES]
+
+    def get_library(self, library_name, library_file, timeout, workspace=None):
+        if library_name not in self.LIBRARIES:
+            raise RuntimeError(f"Library {library_name} not found.")
+        self.loaded.append(library_name)
+        return self.LIBRARIES[library_name]
+
+
+def check_coq_context(client):
+    coq_context = client.get_coq_context(30)
+    assert list(coq_context.keys()) == ["Coq.Init.Prelude", "Coq.Init.Logic"]
+    term = coq_context["Coq.Init.Prelude"]["nat"]
+    assert term == MockLibraryService.LIBRARIES["Coq.Init.Prelude"]["nat"]
+    assert term is not MockLibraryService.LIBRARIES["Coq.Init.Prelude"]["nat"]
+    assert term.file_path == "Prelude.v"
+
+    with pytest.raises(RuntimeError):
+        client.get_library("Coq.Init.Unknown", "Unknown.v", 30)
+
+
+def test_in_process_client():
+    service = MockLibraryService()
+    client = InProcessLibraryClient(service)
+    check_coq_context(client)
+    assert service.loaded == ["Coq.Init.Prelude", "Coq.Init.Logic"]
+
+
+def test_daemon():
+    socket_path = os.path.join(
+        tempfile.gettempdir(), "coqpyt" + str(uuid.uuid4()).replace("-", "")
+    )
+    service = MockLibraryService()
+    daemon = LibraryDaemon(socket_path, service)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+        clients = [LibraryDaemonClient(socket_path) for _ in range(2)]
+        for client in clients:
+            check_coq_context(client)
+            client.close()
+        assert len(service.loaded) == 4
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_socket_path(tmp_path):
+    path = tmp_path / "not_a_socket"
+    path.write_text("data")
+    umask = os.umask(0o022)
+    os.umask(umask)
+    with pytest.raises(FileExistsError):
+        LibraryDaemon(str(path), MockLibraryService())
+    assert path.read_text() == "data"
+
+    # A stale socket is replaced, and the umask of the process is not changed
+    socket_path = str(tmp_path / "socket")
+    for _ in range(2):
+        daemon = LibraryDaemon(socket_path, MockLibraryService())
+        assert os.stat(socket_path).st_mode & 0o777 == 0o600
+        daemon.socket.close()
+    assert os.umask(umask) == umask
+    daemon.server_close()
+
+
+def test_daemon_notation():
+    client = InProcessLibraryClient(MockLibraryService())
+    libraries = client.get_libraries(30)
+    term = client.get_notation(libraries, "_ + _", "", 30)
+    assert term == MockLibraryService.LIBRARIES["Coq.Init.Logic"]["x + y"]
+    assert client.get_notation(libraries, "_ - _", "", 30) is None
+
+
+def test_remote_libraries():
+    service = MockLibraryService()
+    requests = []
+    get_term = service.get_term
+
+    def count_requests(libraries, names, timeout, workspace=None):
+        requests.append(([library for library, _ in libraries], names))
+        return get_term(libraries, names, timeout, workspace=workspace)
+
+    service.get_term = count_requests
+    client = InProcessLibraryClient(service)
+    resolver = client.resolver(30)
+    assert client.resolver(30) is resolver
+    context = FileContext("mock.v", coq_version="8.19.2")
+    for library, library_file in client.get_libraries(30):
+        context.add_remote_library(library, library_file, resolver)
+
+    # Only the names of the libraries are kept in the process
+    nat = MockLibraryService.LIBRARIES["Coq.Init.Prelude"]["nat"]
+    assert context.libraries == {}
+    assert len(context.terms) == 0
+    assert context.get_term("nat") == nat
+    assert context.get_term("Prelude.nat") == nat
+    assert context.get_term("nat") == nat
+    assert context.get_term("bool") is None
+    assert requests == [
+        (["Coq.Init.Prelude", "Coq.Init.Logic"], ["nat"]),
+        (["Coq.Init.Prelude", "Coq.Init.Logic"], ["Prelude.nat"]),
+        (["Coq.Init.Prelude", "Coq.Init.Logic"], ["bool"]),
+    ]
+    term = context.get_notation("_ + _", "")
+    assert term == MockLibraryService.LIBRARIES["Coq.Init.Logic"]["x + y"]
+    with pytest.raises(NotationNotFoundException):
+        context.get_notation("_ - _", "")
+
+    # Local terms are found without requests
+    requests.clear()
+    local = {"nat": Term(Step("nat", "nat", None), TermType.DEFINITION, "mock.v", [])}
+    context.update(local)
+    assert context.get_term("nat") == local["nat"]
+    assert requests == []
+
+    # Libraries required after the local term are looked up first
+    context.add_remote_library("Coq.Init.Prelude", "Coq.Init.Prelude.v", resolver)
+    assert context.get_term("nat") == nat
+    assert requests == [(["Coq.Init.Prelude"], ["nat"])]
+    context.remove_library("Coq.Init.Prelude")
+    assert context.get_term("nat") == local["nat"]
+    assert list(context.remote_libraries) == ["Coq.Init.Logic"]
+
+
+def test_remote_libraries_modules(monkeypatch):
+    service = MockLibraryService()
+    requests = []
+    get_term = service.get_term
+
+    def count_requests(libraries, names, timeout, workspace=None):
+        requests.append(names)
+        return get_term(libraries, names, timeout, workspace=workspace)
+
+    service.get_term = count_requests
+    client = InProcessLibraryClient(service)
+    context = FileContext("mock.v", coq_version="8.19.2")
+    for library, library_file in client.get_libraries(30):
+        context.add_remote_library(library, library_file, client.resolver(30))
+
+    # Open the module M
+    expr = ["VernacDefineModule", None, {"v": [None, "M"]}, []]
+    monkeypatch.setattr(context, "expr", lambda step: expr)
+    context.process_step(Step("Module M.", "Module M.", None))
+
+    # Every prefix of the name is looked up in a single request
+    nat = MockLibraryService.LIBRARIES["Coq.Init.Prelude"]["nat"]
+    assert context.get_term("nat") == nat
+    assert requests == [["M.nat", "nat"]]
+
+
+def test_service_contexts(tmp_path, monkeypatch):
+    service = MockLibraryService()
+    monkeypatch.setattr(LibraryContextService, "MAX_CONTEXTS", 2)
+    library_file = tmp_path / "Coq.Init.Prelude.v"
+    library_file.write_text("Inductive nat.")
+    libraries = [("Coq.Init.Prelude", str(library_file))]
+
+    # Contexts are kept for each workspace
+    for workspace in [None, "/workspace", None]:
+        assert service.get_term(libraries, ["nat"], 30, workspace) is not None
+    assert service.loaded == ["Coq.Init.Prelude"] * 2
+
+    # Contexts are built again if a library changed
+    service.loaded.clear()
+    library_file.write_text("Inductive nat : Set.")
+    assert service.get_term(libraries, ["nat"], 30) is not None
+    assert service.get_term(libraries, ["nat"], 30) is not None
+    assert service.loaded == ["Coq.Init.Prelude"]
+
+    # Only the most recently used contexts are kept
+    service.loaded.clear()
+    assert service.get_term(libraries, ["nat"], 60) is not None
+    assert service.get_term(libraries, ["nat"], 30) is not None
+    assert service.loaded == ["Coq.Init.Prelude"]
+    assert service.get_term(libraries, ["nat"], 30, "/workspace") is not None
+    assert service.loaded == ["Coq.Init.Prelude"] * 2
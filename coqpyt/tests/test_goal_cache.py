@@ -0,0 +1,176 @@
+from coqpyt.lsp.structs import Position
+from coqpyt.coq.lsp.structs import GoalAnswer, Goal, Hyp
+from coqpyt.coq.goals import (
+    GoalCache,
+    TacticCache,
+    diff_goals,
+    diff_goal_configs,
+    goal_state_hash,
+)
+
+URI = "file:///tmp/test_goal_cache.v"
+
+
+def goal_answer(line: int) -> GoalAnswer:
+    hyps = [
+        {"names": [f"H{i}"], "ty": f"{i} + {line} = {line} + {i}"} for i in range(50)
+    ]
+    goal = {"hyps": hyps, "ty": f"{line} = {line}"}
+    return GoalAnswer.parse(
+        {
+            "textDocument": {"uri": URI, "version": 1},
+            "position": {"line": line, "character": 0},
+            "messages": [],
+            "goals": {"goals": [goal], "stack": [], "shelf": [], "given_up": []},
+        }
+    )
+
+
+def test_lru_eviction():
+    cache = GoalCache(max_size=2)
+    first, second, third = [GoalCache.key(URI, 1, Position(i, 0)) for i in range(3)]
+    cache[first] = None
+    cache[second] = None
+    assert first in cache
+    cache[first]  # first is now the most recently used
+    cache[third] = None
+    assert len(cache) == 2
+    assert first in cache and third in cache
+    assert second not in cache
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disabled():
+    cache = GoalCache(max_size=0)
+    cache[GoalCache.key(URI, 1, Position(0, 0))] = None
+    assert len(cache) == 0
+
+
+def test_invalidate():
+    cache = GoalCache()
+    for line in range(4):
+        cache[GoalCache.key(URI, 1, Position(line, 2))] = line
+    cache[GoalCache.key("file:///tmp/other.v", 1, Position(3, 2))] = "other"
+    # Requested while the edit was applied
+    cache[GoalCache.key(URI, 2, Position(3, 2))] = "new"
+
+    cache.invalidate(URI, 1, 2, Position(2, 0))
+    assert len(cache) == 4
+    for line in range(2):
+        assert cache[GoalCache.key(URI, 2, Position(line, 2))] == line
+        assert GoalCache.key(URI, 1, Position(line, 2)) not in cache
+    assert GoalCache.key(URI, 2, Position(2, 2)) not in cache
+    assert cache[GoalCache.key(URI, 2, Position(3, 2))] == "new"
+    assert cache[GoalCache.key("file:///tmp/other.v", 1, Position(3, 2))] == "other"
+
+    # Goals of older versions are dropped
+    cache.invalidate(URI, 2, 3, Position(0, 0))
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_spill_to_disk():
+    goals = [goal_answer(line) for line in range(20)]
+    cache = GoalCache(max_size=None, memory_budget=8000)
+    for line, answer in enumerate(goals):
+        cache[GoalCache.key(URI, 1, Position(line, 0))] = answer
+    assert len(cache) == 20
+    assert cache.memory <= 8000
+    assert cache.disk_size > 0
+
+    for line in [0, 19, 5, 0]:
+        key = GoalCache.key(URI, 1, Position(line, 0))
+        assert key in cache
+        answer = cache[key]
+        assert answer.position == Position(line, 0)
+        assert answer.goals.goals[0].ty == f"{line} = {line}"
+        assert repr(answer.goals.goals[0].hyps) == repr(goals[line].goals.goals[0].hyps)
+    assert cache.loads >= 2
+    assert cache.memory <= 8000
+
+    # Spilled goals are moved to the new version as well
+    cache.invalidate(URI, 1, 2, Position(10, 0))
+    assert len(cache) == 10
+    for line in range(10):
+        key = GoalCache.key(URI, 2, Position(line, 0))
+        assert cache[key].goals.goals[0].ty == f"{line} = {line}"
+
+    cache.close()
+    assert len(cache) == 0 and cache.disk_size == 0
+
+
+def test_spill_segment_bounded():
+    cache = GoalCache(max_size=None, memory_budget=8000)
+    keys = [GoalCache.key(URI, 1, Position(line, 0)) for line in range(20)]
+    for line, key in enumerate(keys):
+        cache[key] = goal_answer(line)
+
+    # Goals loaded and evicted again reuse their copy in the segment, so only
+    # the goals never spilled before are written
+    sizes = []
+    for _ in range(20):
+        for line, key in enumerate(keys):
+            assert cache[key].goals.goals[0].ty == f"{line} = {line}"
+        sizes.append(cache.disk_size)
+    assert cache.loads >= 20 * 19
+    assert len(set(sizes)) == 1
+    full_size = sizes[0]
+
+    # Replaced goals leave stale bytes, which are compacted
+    for i in range(20):
+        for line, key in enumerate(keys):
+            cache[key] = goal_answer(line + i)
+        assert cache.disk_size <= 2 * full_size
+    for line, key in enumerate(keys):
+        assert cache[key].goals.goals[0].ty == f"{line + 19} = {line + 19}"
+    cache.close()
+
+
+def test_goal_diff():
+    previous = goal_answer(1).goals.goals[0]
+    goal = goal_answer(1).goals.goals[0]
+    # Interned strings are shared between goals parsed separately
+    assert goal.hyps[3].ty is previous.hyps[3].ty
+    assert diff_goals(previous, goal).is_empty
+
+    goal = Goal(previous.hyps[:10] + [Hyp(["n"], "nat")] + previous.hyps[12:], "False")
+    diff = diff_goals(previous, goal)
+    assert not diff.is_empty and diff.ty_changed
+    assert [hyp.names for hyp in diff.removed] == [["H10"], ["H11"]]
+    assert [hyp.names for hyp in diff.added] == [["n"]]
+    rebuilt = diff.apply(previous)
+    assert rebuilt.ty == "False"
+    assert rebuilt.hyps == goal.hyps
+
+    diffs = diff_goal_configs(None, goal_answer(2).goals)
+    assert len(diffs) == 1 and len(diffs[0].added) == 50
+    assert diffs[0].apply(None).ty == "2 = 2"
+
+
+def test_tactic_cache(tmp_path):
+    state = goal_state_hash(goal_answer(1).goals)
+    assert state == goal_state_hash(goal_answer(1).goals)
+    assert state != goal_state_hash(goal_answer(2).goals)
+
+    path = str(tmp_path / "tactics.cache")
+    cache = TacticCache(path, max_size=2)
+    keys = [TacticCache.key(state, tactic, "ctx") for tactic in ["auto.", "lia."]]
+    cache[keys[0]] = (goal_answer(2).goals, [])
+    cache[keys[1]] = (None, [])
+    assert cache.lookup(TacticCache.key(state, "  auto.\n", "ctx")) is not None
+    assert cache.lookup(TacticCache.key(state, "auto.", "other")) is None
+    assert cache.hit_rate == 0.5
+    # Probing neither counts nor changes the order of eviction
+    assert keys[1] in cache and cache.get(keys[1]) == (None, [])
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache[TacticCache.key(state, "simpl.", "ctx")] = (None, [])
+    assert len(cache) == 2 and cache.evictions == 1
+    assert keys[1] not in cache
+
+    # The outcomes are reused by later runs
+    cache.save()
+    loaded = TacticCache(path, max_size=2)
+    assert len(loaded) == 2
+    goals, diagnostics = loaded[keys[0]]
+    assert goals.goals[0].ty == "2 = 2" and diagnostics == []
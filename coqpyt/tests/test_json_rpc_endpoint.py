@@ -93,3 +93,49 @@ def test_recv_close_pipe():
     pipeout.close()
     result = json_rpc_endpoint.recv_response()
     assert result is None
+
+
+def test_pipelined_requests():
+    client_in, server_out = os.pipe()
+    server_in, client_out = os.pipe()
+    client = lsp.JsonRpcEndpoint(
+        os.fdopen(client_out, "wb"), os.fdopen(client_in, "rb")
+    )
+    server = lsp.JsonRpcEndpoint(
+        os.fdopen(server_out, "wb"), os.fdopen(server_in, "rb")
+    )
+    lsp_endpoint = lsp.LspEndpoint(client)
+    lsp_endpoint.start()
+
+    rpc_ids = [lsp_endpoint.send_method("echo", value=i) for i in range(3)]
+    requests = [server.recv_response() for _ in rpc_ids]
+    # All requests are sent before any response, which arrive out of order
+    for request in reversed(requests):
+        server.send_request(
+            {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]}
+        )
+    results = [lsp_endpoint.wait_result(rpc_id) for rpc_id in rpc_ids]
+    assert results == [{"value": i} for i in range(3)]
+
+    # Abandoned requests leave no entries, and their late responses are ignored
+    lsp_endpoint.timeout = 0.1
+    rpc_id = lsp_endpoint.send_method("echo", value=3)
+    request = server.recv_response()
+    with pytest.raises(TimeoutError):
+        lsp_endpoint.wait_result(rpc_id)
+    assert lsp_endpoint.event_dict == {} and lsp_endpoint.response_dict == {}
+    server.send_request(
+        {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]}
+    )
+    lsp_endpoint.timeout = 2
+    rpc_id = lsp_endpoint.send_method("echo", value=4)
+    request = server.recv_response()
+    server.send_request(
+        {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]}
+    )
+    assert lsp_endpoint.wait_result(rpc_id) == {"value": 4}
+    assert lsp_endpoint.response_dict == {}
+
+    lsp_endpoint.stop()
+    server.send_request({"jsonrpc": "2.0", "method": "exit", "params": {}})
+    lsp_endpoint.join()
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+from coqpyt.coq.petanque import PetanqueClient, PetanqueEngine
+from coqpyt.coq.proof_tree import ProofTree
+from coqpyt.lsp.structs import ResponseError
+
+SCRIPTED_PET = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "resources", "scripted_pet.py"
+)
+
+
+class Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ScriptedContext:
+    def names(self, step):
+        return [] if step.name is None else [step.name]
+
+    def is_end_proof(self, step):
+        return step.text.strip() == "qed."
+
+
+def make_proof(name, steps, line=0):
+    end = Namespace(line=line, character=12)
+    text = "Goal True." if name is None else f"Lemma {name}."
+    return Namespace(
+        step=Namespace(name=name, text=text, ast=Namespace(range=Namespace(end=end))),
+        steps=[Namespace(text=f" {text}", step=Namespace(text=text)) for text in steps],
+        ast=Namespace(range=Namespace(end=end)),
+    )
+
+
+@pytest.fixture
+def client():
+    client = PetanqueClient("file:///tmp", pet=f"{sys.executable} {SCRIPTED_PET}")
+    yield client
+    client.close()
+
+
+def test_client(client):
+    state = client.start("file:///tmp/test.v", "thm")
+    state = client.run(state, "intros.")
+    assert client.goals(state).goals[0].ty == "thm intros."
+    assert not state.proof_finished
+    assert client.run(state, "qed.").proof_finished
+    with pytest.raises(ResponseError):
+        client.run(state, "fail.")
+
+
+def test_engine(client):
+    proof_file = Namespace(version=1, path="/tmp/test.v", context=ScriptedContext())
+    engine = PetanqueEngine(proof_file, client=client)
+    proof = make_proof("thm", ["intros.", "qed."])
+
+    result = engine.try_step(proof, "simpl.")
+    assert result.valid
+    assert result.goals.goals.goals[0].ty == "thm intros. simpl."
+    assert result.goals.textDocument.version == 1
+
+    results = engine.evaluate_candidates(
+        proof, ["fail.", "qed."], previous_steps=["simpl."]
+    )
+    assert not results[0].valid
+    assert results[0].errors[0].message == "Tactic failure."
+    assert results[1].valid and results[1].goals.goals.goals == []
+    results = engine.evaluate_candidates(
+        proof, ["fail.", "qed.", "auto."], workers=2, previous_steps=["simpl."]
+    )
+    assert [result.valid for result in results] == [False, True, True]
+    assert results[2].goals.goals.goals[0].ty == "thm intros. simpl. auto."
+
+    # A failure before the candidate is reported in the result
+    result = engine.try_step(proof, "auto.", previous_steps=["fail."])
+    assert not result.valid and result.goals is None
+    assert result.errors[0].message == "Tactic failure."
+
+    # The engine can be used by a ProofTree in place of the ProofFile
+    tree = ProofTree(engine, proof)
+    (node,) = tree.expand(tree.root, ["simpl."])
+    (child,) = tree.expand(node, ["auto."])
+    assert tree.goals(child).goals.goals[0].ty == "thm intros. simpl. auto."
+
+
+def test_engine_unnamed_proof(client):
+    proof_file = Namespace(version=1, path="/tmp/test.v", context=ScriptedContext())
+    engine = PetanqueEngine(proof_file, client=client)
+    first, second = make_proof(None, ["intros."]), make_proof(None, [], line=3)
+
+    result = engine.try_step(first, "auto.")
+    assert result.valid
+    assert result.goals.goals.goals[0].ty == "Goal@0:12 intros. auto."
+    # Each unnamed proof is started from its own position
+    result = engine.try_step(second, "auto.")
+    assert result.goals.goals.goals[0].ty == "Goal@3:12 auto."
@@ -0,0 +1,58 @@
+from coqpyt.coq.structs import CandidateResult
+from coqpyt.coq.proof_tree import ProofTree
+
+
+class ScriptedProofFile:
+    """Stand-in for a ProofFile whose candidates leave as goal the text of
+    the steps checked so far."""
+
+    def __init__(self):
+        self.calls = []
+
+    def evaluate_candidates(self, proof, step_texts, workers=1, previous_steps=None):
+        self.calls.append((list(previous_steps), list(step_texts)))
+        return [
+            CandidateResult(text, " ".join(previous_steps + [text]), [], 0.0)
+            for text in step_texts
+        ]
+
+
+def test_expand_and_revisit():
+    proof_file = ScriptedProofFile()
+    tree = ProofTree(proof_file, None)
+    assert tree.goals(tree.root) == ""
+
+    a, b = tree.expand(tree.root, ["a.", "b."])
+    assert tree.goals(a) == "a." and tree.goals(b) == "b."
+    (c,) = tree.expand(a, ["c."])
+    assert c.steps == ["a.", "c."]
+    assert tree.goals(c) == "a. c."
+    assert proof_file.calls[-1] == (["a."], ["c."])
+
+    # Cached states are not checked again
+    n_calls = len(proof_file.calls)
+    assert tree.expand(tree.root, ["b.", "a."]) == [b, a]
+    tree.goals(c)
+    assert len(proof_file.calls) == n_calls
+    assert tree.evaluations == 4
+
+
+def test_memory_budget():
+    proof_file = ScriptedProofFile()
+    tree = ProofTree(proof_file, None, memory_budget=600)
+    old = tree.expand(tree.root, ["a.", "b."])
+    node = old[0]
+    for i in range(10):
+        node = tree.expand(node, [f"s{i}."])[0]
+    assert tree.memory <= 600
+    # The least recently used subtree was evicted, the path to the node was kept
+    assert old[1].result is None
+    assert node.result is not None
+    assert node.steps == ["a."] + [f"s{i}." for i in range(10)]
+
+    n_calls = len(proof_file.calls)
+    assert tree.goals(old[1]) == "b."
+    assert len(proof_file.calls) == n_calls + 1
+
+    tree.evict(old[0])
+    assert len(old[0].children) == 0 and old[0].result is None
@@ -14,14 +14,7 @@ with CoqFile(os.path.join(os.getcwd(), "examples/readme.v")) as coq_file:
     # Filter by Tactics
     print(
         "Number of tactics:",
-        len(
-            list(
-                filter(
-                    lambda term: term.type == TermType.TACTIC,
-                    coq_file.context.terms.values(),
-                )
-            )
-        ),
+        len(coq_file.context.get_terms_by_type(TermType.TACTIC)),
     )
 
     # Save compiled file
@@ -64,14 +57,7 @@ with ProofFile(os.path.join(os.getcwd(), "examples/readme.v")) as proof_file:
     # Filter for Notations only
     print(
         "Number of notations:",
-        len(
-            list(
-                filter(
-                    lambda term: term.type == TermType.NOTATION,
-                    proof_file.context.terms.values(),
-                )
-            )
-        ),
+        len(proof_file.context.get_terms_by_type(TermType.NOTATION)),
     )
 
 
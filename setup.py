@@ -33,6 +33,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/sr-lab/coqpyt",
     packages=find_packages(),
+    entry_points={"console_scripts": ["coqpyt=coqpyt.cli:main"]},
     tests_require=["pytest", "pytest_mock"],
     cmdclass={"test": PyTest},
 )